@@ -0,0 +1,463 @@
+"""Record/replay of every external exchange in a run.
+
+With CASSETTE_MODE=record, Serper searches, page scrapes and HEAD checks, GNews responses,
+Reddit listings and comment trees, tool LLM calls and agent LLM calls are written to a
+gzip-compressed cassette at CASSETTE_PATH, indexed by a hash of the request. With
+CASSETTE_MODE=replay they are served from it instead, after the recorded latency or, with
+CASSETTE_LATENCY=zero, right away.
+
+Cache hits never reach upstream and so are not recorded; record from an empty CACHE_DIR
+with LLM_CACHE=off (benchmarks/replay.py does this) and replay the same way.
+"""
+import asyncio
+import gzip
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from types import SimpleNamespace
+
+CASSETTE_MODE = os.getenv("CASSETTE_MODE", "").lower()
+CASSETTE_PATH = os.getenv("CASSETTE_PATH", "run.cassette.json.gz")
+CASSETTE_LATENCY = os.getenv("CASSETTE_LATENCY", "original").lower()
+
+CASSETTE_VERSION = 1
+# Requests are kept in the file only for reading; strings past this are cut
+REQUEST_PREVIEW_CHARS = 200
+# Kinds whose requests may differ slightly between runs, so a miss falls back to recorded order
+SEQUENTIAL_KINDS = {"agent llm"}
+
+
+class CassetteMiss(LookupError):
+    pass
+
+
+class ReplayedError(Exception):
+    """An upstream error played back from a cassette, with its original HTTP status if there was one."""
+
+    def __init__(self, message, status_code=None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def request_hash(kind, request):
+    payload = json.dumps({"kind": kind, "request": request}, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _preview(value):
+    if isinstance(value, str) and len(value) > REQUEST_PREVIEW_CHARS:
+        return value[:REQUEST_PREVIEW_CHARS] + "..."
+    if isinstance(value, dict):
+        return {k: _preview(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_preview(v) for v in value]
+    return value
+
+
+def _status(error):
+    for value in (getattr(error, "status_code", None), getattr(getattr(error, "response", None), "status_code", None)):
+        if isinstance(value, int):
+            return value
+    return None
+
+
+class Cassette:
+    def __init__(self, path, mode, latency="original"):
+        if mode not in ("record", "replay"):
+            raise ValueError(f"cassette mode must be record or replay, not {mode!r}")
+        self.path = path
+        self.mode = mode
+        self.latency = latency
+        self.meta = {}
+        self.exchanges = defaultdict(list)
+        self._cursors = defaultdict(int)
+        self._order = defaultdict(list)
+        self._used = set()
+        self._lock = threading.Lock()
+        if mode == "replay":
+            self.load()
+
+    @property
+    def recording(self):
+        return self.mode == "record"
+
+    @property
+    def replaying(self):
+        return self.mode == "replay"
+
+    def load(self):
+        with gzip.open(self.path, "rt", encoding="utf-8") as f:
+            data = json.load(f)
+        self.meta = data.get("meta", {})
+        for key, entries in data["exchanges"].items():
+            self.exchanges[key] = entries
+        # Recorded order per kind, for the sequential fallback
+        for key, index in data.get("order", []):
+            self._order[self.exchanges[key][index]["kind"]].append((key, index))
+
+    def save(self):
+        with self._lock:
+            data = {
+                "version": CASSETTE_VERSION,
+                "created": time.time(),
+                "meta": self.meta,
+                "exchanges": dict(self.exchanges),
+                "order": [pair for pairs in self._order.values() for pair in pairs],
+            }
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with gzip.open(self.path, "wt", encoding="utf-8") as f:
+                json.dump(data, f, separators=(",", ":"), default=str)
+        return self.path
+
+    def add(self, kind, request, response=None, error=None, elapsed=0.0):
+        """Record one exchange and return its entry, which may still be filled in (e.g. a streamed listing)."""
+        key = request_hash(kind, request)
+        entry = {
+            "kind": kind,
+            "request": _preview(request),
+            "response": response,
+            "error": None if error is None else {"message": repr(error)[:500], "status": _status(error)},
+            "elapsed": elapsed,
+        }
+        with self._lock:
+            self.exchanges[key].append(entry)
+            self._order[kind].append((key, len(self.exchanges[key]) - 1))
+        return entry
+
+    def lookup(self, kind, request):
+        """The next recorded entry for this request; repeats of a request are served in recorded order."""
+        key = request_hash(kind, request)
+        with self._lock:
+            entries = self.exchanges.get(key)
+            if entries:
+                index = min(self._cursors[key], len(entries) - 1)
+                self._cursors[key] += 1
+            elif kind in SEQUENTIAL_KINDS:
+                pair = next((pair for pair in self._order[kind] if pair not in self._used), None)
+                if pair is None:
+                    raise CassetteMiss(f"no recorded {kind} exchange left")
+                print(f"[cassette] {kind}: request changed since recording, replaying in recorded order")
+                key, index = pair
+                entries = self.exchanges[key]
+            else:
+                raise CassetteMiss(f"no recorded {kind} exchange for {_preview(request)}")
+            self._used.add((key, index))
+            return entries[index]
+
+    def _delay(self, entry):
+        return entry["elapsed"] if self.latency == "original" else 0.0
+
+    @staticmethod
+    def _result(entry, decode):
+        if entry["error"]:
+            raise ReplayedError(entry["error"]["message"], entry["error"]["status"])
+        return decode(entry["response"]) if decode else entry["response"]
+
+    def call(self, kind, request, fn, *args, encode=None, decode=None, **kwargs):
+        if self.replaying:
+            entry = self.lookup(kind, request)
+            time.sleep(self._delay(entry))
+            return self._result(entry, decode)
+        start = time.perf_counter()
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as e:
+            self.add(kind, request, error=e, elapsed=time.perf_counter() - start)
+            raise
+        self.add(kind, request, encode(result) if encode else result, elapsed=time.perf_counter() - start)
+        return result
+
+    async def acall(self, kind, request, fn, *args, encode=None, decode=None, **kwargs):
+        if self.replaying:
+            entry = self.lookup(kind, request)
+            await asyncio.sleep(self._delay(entry))
+            return self._result(entry, decode)
+        start = time.perf_counter()
+        try:
+            result = await fn(*args, **kwargs)
+        except Exception as e:
+            self.add(kind, request, error=e, elapsed=time.perf_counter() - start)
+            raise
+        self.add(kind, request, encode(result) if encode else result, elapsed=time.perf_counter() - start)
+        return result
+
+    def stats(self):
+        """Exchanges and upstream seconds per kind, of everything recorded or of what was replayed so far."""
+        with self._lock:
+            if self.recording:
+                entries = [entry for entries in self.exchanges.values() for entry in entries]
+            else:
+                entries = [self.exchanges[key][index] for key, index in self._used]
+        stats = defaultdict(lambda: {"exchanges": 0, "upstream_s": 0.0})
+        for entry in entries:
+            stats[entry["kind"]]["exchanges"] += 1
+            stats[entry["kind"]]["upstream_s"] += entry["elapsed"]
+        return dict(stats)
+
+
+_active = None
+_active_lock = threading.Lock()
+_from_env = False
+
+
+def active_cassette():
+    """The cassette in use, set up from CASSETTE_MODE on first use, or None."""
+    global _active, _from_env
+    with _active_lock:
+        if _active is None and CASSETTE_MODE and not _from_env:
+            _from_env = True
+            _active = Cassette(CASSETTE_PATH, CASSETTE_MODE, CASSETTE_LATENCY)
+        return _active
+
+
+@contextmanager
+def use_cassette(path, mode, latency="original"):
+    global _active
+    cassette = Cassette(path, mode, latency)
+    with _active_lock:
+        previous, _active = _active, cassette
+    try:
+        yield cassette
+    finally:
+        with _active_lock:
+            _active = previous
+        if cassette.recording:
+            cassette.save()
+
+
+def save_cassette():
+    cassette = active_cassette()
+    if cassette is not None and cassette.recording:
+        return cassette.save()
+    return None
+
+
+def recorded(kind, request, fn, *args, encode=None, decode=None, **kwargs):
+    """fn(*args, **kwargs), recorded to or replayed from the active cassette if there is one."""
+    cassette = active_cassette()
+    if cassette is None:
+        return fn(*args, **kwargs)
+    return cassette.call(kind, request, fn, *args, encode=encode, decode=decode, **kwargs)
+
+
+async def arecorded(kind, request, fn, *args, encode=None, decode=None, **kwargs):
+    cassette = active_cassette()
+    if cassette is None:
+        return await fn(*args, **kwargs)
+    return await cassette.acall(kind, request, fn, *args, encode=encode, decode=decode, **kwargs)
+
+
+# Reddit: asyncpraw objects are recorded as plain dicts and replayed as look-alikes
+# carrying only the attributes the tools read.
+
+SUBMISSION_FIELDS = ("id", "title", "selftext", "url", "score", "num_comments", "created_utc", "link_flair_text")
+
+
+def _listing_request(subreddit, listing, **params):
+    return {"subreddit": subreddit.lower(), "listing": listing, **params}
+
+
+def _comments_request(submission):
+    return {"id": submission.id, "sort": submission.comment_sort, "limit": submission.comment_limit}
+
+
+def submission_record(submission):
+    record = {field: getattr(submission, field, None) for field in SUBMISSION_FIELDS}
+    record["subreddit"] = submission.subreddit.display_name
+    return record
+
+
+def comment_tree(comments):
+    # MoreComments have no body; they are gone after replace_more(limit=0) anyway
+    return [
+        {"id": c.id, "body": c.body, "score": c.score, "replies": comment_tree(c.replies)}
+        for c in comments if hasattr(c, "body")
+    ]
+
+
+class _Proxy:
+    def __init__(self, target):
+        object.__setattr__(self, "_target", target)
+
+    def __getattr__(self, name):
+        return getattr(self._target, name)
+
+    def __setattr__(self, name, value):
+        setattr(self._target, name, value)
+
+
+class RecordingSubmission(_Proxy):
+    def __init__(self, target, cassette):
+        super().__init__(target)
+        object.__setattr__(self, "_cassette", cassette)
+
+    async def load(self):
+        request = _comments_request(self._target)
+        start = time.perf_counter()
+        try:
+            await self._target.load()
+            await self._target.comments.replace_more(limit=0)
+        except Exception as e:
+            self._cassette.add("reddit comments", request, error=e, elapsed=time.perf_counter() - start)
+            raise
+        self._cassette.add("reddit comments", request, comment_tree(self._target.comments),
+                           elapsed=time.perf_counter() - start)
+
+
+class RecordingSubreddit(_Proxy):
+    def __init__(self, target, name, cassette):
+        super().__init__(target)
+        object.__setattr__(self, "_name", name)
+        object.__setattr__(self, "_cassette", cassette)
+
+    async def _record(self, request, listing):
+        # Consumers may stop early, so the entry is filled in as submissions arrive
+        entry = self._cassette.add("reddit listing", request, [])
+        iterator = listing.__aiter__()
+        while True:
+            start = time.perf_counter()
+            try:
+                submission = await iterator.__anext__()
+            except StopAsyncIteration:
+                break
+            except Exception as e:
+                entry["error"] = {"message": repr(e)[:500], "status": _status(e)}
+                raise
+            finally:
+                entry["elapsed"] += time.perf_counter() - start
+            entry["response"].append(submission_record(submission))
+            yield RecordingSubmission(submission, self._cassette)
+
+    def search(self, query, **params):
+        return self._record(_listing_request(self._name, "search", query=query, **params),
+                            self._target.search(query, **params))
+
+    def hot(self, **params):
+        return self._record(_listing_request(self._name, "hot", **params), self._target.hot(**params))
+
+
+class RecordingReddit(_Proxy):
+    def __init__(self, target, cassette):
+        super().__init__(target)
+        object.__setattr__(self, "_cassette", cassette)
+
+    async def subreddit(self, name, **kwargs):
+        return RecordingSubreddit(await self._target.subreddit(name, **kwargs), name, self._cassette)
+
+
+class ReplayForest(list):
+    async def replace_more(self, limit=None):
+        return []
+
+
+def _replay_forest(tree):
+    return ReplayForest(
+        SimpleNamespace(id=c["id"], body=c["body"], score=c["score"], replies=_replay_forest(c["replies"]))
+        for c in tree
+    )
+
+
+class ReplaySubmission:
+    def __init__(self, record, cassette):
+        for field in SUBMISSION_FIELDS:
+            setattr(self, field, record.get(field))
+        self.subreddit = SimpleNamespace(display_name=record["subreddit"])
+        self.comment_sort = None
+        self.comment_limit = None
+        self.comments = ReplayForest()
+        self._cassette = cassette
+
+    async def load(self):
+        entry = self._cassette.lookup("reddit comments", _comments_request(self))
+        await asyncio.sleep(self._cassette._delay(entry))
+        self.comments = _replay_forest(Cassette._result(entry, None))
+
+
+class ReplaySubreddit:
+    def __init__(self, name, cassette):
+        self.display_name = name
+        self._cassette = cassette
+
+    async def _replay(self, request):
+        entry = self._cassette.lookup("reddit listing", request)
+        await asyncio.sleep(self._cassette._delay(entry))
+        for record in entry["response"]:
+            yield ReplaySubmission(record, self._cassette)
+        if entry["error"]:
+            raise ReplayedError(entry["error"]["message"], entry["error"]["status"])
+
+    def search(self, query, **params):
+        return self._replay(_listing_request(self.display_name, "search", query=query, **params))
+
+    def hot(self, **params):
+        return self._replay(_listing_request(self.display_name, "hot", **params))
+
+
+class ReplayReddit:
+    def __init__(self, cassette):
+        self._cassette = cassette
+
+    async def subreddit(self, name, **kwargs):
+        return ReplaySubreddit(name, self._cassette)
+
+    async def close(self):
+        pass
+
+
+def cassette_reddit(make_reddit):
+    """The Reddit client for this process: make_reddit(), wrapped or replaced by the active cassette."""
+    cassette = active_cassette()
+    if cassette is None:
+        return make_reddit()
+    if cassette.replaying:
+        return ReplayReddit(cassette)
+    return RecordingReddit(make_reddit(), cassette)
+
+
+# Agent LLMs: crewai calls them directly, so each one is wrapped
+
+def plain(value):
+    """`value` as JSON data; tool calls and other pydantic objects become dicts, anything else its str."""
+    if isinstance(value, str):
+        return value
+    return json.loads(json.dumps(value, default=lambda o: o.model_dump() if hasattr(o, "model_dump") else str(o)))
+
+
+def wrap_agent_llms(agents):
+    """Route the agents' LLM calls through the active cassette; safe to call more than once."""
+    cassette = active_cassette()
+    if cassette is None:
+        return
+    from crewai import BaseLLM
+
+    class RecordedAgentLLM(BaseLLM):
+        _cassette_wrapped = True
+
+        def __init__(self, llm):
+            super().__init__(model=getattr(llm, "model", "unknown"))
+            self.llm = llm
+
+        def call(self, messages, *args, **kwargs):
+            # With function calling the offered tools shape the answer, so they are part of the request
+            request = {"model": self.model, "messages": messages}
+            if kwargs.get("tools"):
+                request["tools"] = kwargs["tools"]
+            return recorded("agent llm", request, self.llm.call, messages, *args, encode=plain, **kwargs)
+
+        # The wrapper must take the same prompting and tool-call path as the wrapped LLM
+        def supports_function_calling(self):
+            return getattr(self.llm, "supports_function_calling", lambda: False)()
+
+        def supports_stop_words(self):
+            return getattr(self.llm, "supports_stop_words", lambda: True)()
+
+        def get_context_window_size(self):
+            return getattr(self.llm, "get_context_window_size", lambda: 128000)()
+
+    for agent in agents:
+        if not getattr(agent.llm, "_cassette_wrapped", False):
+            agent.llm = RecordedAgentLLM(agent.llm)
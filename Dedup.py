@@ -0,0 +1,152 @@
+import os
+import re
+import threading
+import time
+import zlib
+from collections import defaultdict
+
+import numpy as np
+
+DEDUP_THRESHOLD = float(os.getenv("DEDUP_THRESHOLD", "0.5"))
+# How long stories stay in the process-wide index shared by the news and Reddit tools
+STORY_INDEX_TTL = float(os.getenv("STORY_INDEX_TTL", str(6 * 3600)))
+SHINGLE_CHARS = 5
+MAX_TEXT_CHARS = 2000
+
+_PRIME = np.uint64(4294967311)
+_URL = re.compile(r"https?://\S+")
+_NON_WORD = re.compile(r"[^a-z0-9]+")
+
+
+def normalize(text):
+    text = _URL.sub(" ", text.lower())
+    return _NON_WORD.sub(" ", text).strip()[:MAX_TEXT_CHARS]
+
+
+def shingles(text):
+    text = normalize(text)
+    if len(text) <= SHINGLE_CHARS:
+        return {text} if text else set()
+    return {text[i:i + SHINGLE_CHARS] for i in range(len(text) - SHINGLE_CHARS + 1)}
+
+
+class NearDuplicateIndex:
+    """MinHash signatures with an LSH band index; near-duplicates join the group of their first match."""
+
+    def __init__(self, num_perm=64, bands=32, threshold=DEDUP_THRESHOLD, ttl=None):
+        assert num_perm % bands == 0
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.threshold = threshold
+        self.ttl = ttl
+        rng = np.random.default_rng(1)
+        self._a = rng.integers(1, 2 ** 32, size=num_perm, dtype=np.uint64)
+        self._b = rng.integers(0, 2 ** 32, size=num_perm, dtype=np.uint64)
+        self._lock = threading.Lock()
+        self._buckets = defaultdict(list)
+        self._signatures = {}
+        self._added = {}
+        self._group_of = {}
+        self.groups = defaultdict(list)
+        self.sources = defaultdict(set)
+
+    def signature(self, text):
+        hashes = np.fromiter((zlib.crc32(s.encode("utf-8")) for s in shingles(text)), dtype=np.uint64)
+        if not hashes.size:
+            return np.full(self.num_perm, _PRIME, dtype=np.uint64)
+        # One row per permutation, one column per shingle, min over the shingles
+        return ((np.outer(self._a, hashes) + self._b[:, None]) % _PRIME).min(axis=1)
+
+    def _band_keys(self, signature):
+        return [(i, signature[i * self.rows:(i + 1) * self.rows].tobytes()) for i in range(self.bands)]
+
+    def _expired(self, key, now):
+        return self.ttl is not None and now - self._added[key] > self.ttl
+
+    def _evict(self, key):
+        for band in self._band_keys(self._signatures.pop(key)):
+            bucket = self._buckets[band]
+            bucket.remove(key)
+            if not bucket:
+                del self._buckets[band]
+        del self._added[key]
+        representative = self._group_of.pop(key)
+        group = self.groups[representative]
+        group.remove(key)
+        if not group:
+            del self.groups[representative]
+            self.sources.pop(representative, None)
+
+    def _prune(self, now):
+        """Forget every expired key; _added is in the order keys were added, so they come first."""
+        if self.ttl is None:
+            return
+        while self._added:
+            key = next(iter(self._added))
+            if not self._expired(key, now):
+                break
+            self._evict(key)
+
+    def _best_match(self, signature, now):
+        best, best_similarity = None, self.threshold
+        candidates = {key for band in self._band_keys(signature) for key in self._buckets.get(band, [])}
+        for key in candidates:
+            if self._expired(key, now):
+                continue
+            similarity = float(np.mean(self._signatures[key] == signature))
+            if similarity >= best_similarity:
+                best, best_similarity = key, similarity
+        return best
+
+    def query(self, text):
+        """Representative of the group `text` is a near-duplicate of, or None."""
+        signature = self.signature(text)
+        with self._lock:
+            match = self._best_match(signature, time.time())
+            return self._group_of[match] if match else None
+
+    def add(self, key, text, source=None):
+        """Index `text` under `key` and return the representative key of its group."""
+        signature = self.signature(text)
+        now = time.time()
+        with self._lock:
+            self._prune(now)
+            if key in self._group_of:
+                return self._group_of[key]
+            match = self._best_match(signature, now)
+            representative = self._group_of[match] if match else key
+            self._signatures[key] = signature
+            self._added[key] = now
+            self._group_of[key] = representative
+            self.groups[representative].append(key)
+            if source:
+                self.sources[representative].add(source)
+            for band in self._band_keys(signature):
+                self._buckets[band].append(key)
+            return representative
+
+    def group_size(self, key):
+        with self._lock:
+            return len(self.groups[self._group_of.get(key, key)])
+
+
+def dedupe(items, text, index=None, key=None, source=None):
+    """Keep the first item of every near-duplicate group, with its group size in item["duplicates"].
+
+    `text` and `key` are functions of an item; items must be dicts.
+    """
+    index = index or NearDuplicateIndex()
+    key = key or (lambda item: str(id(item)))
+    representatives = {}
+    for item in items:
+        item_key = key(item)
+        representative = index.add(item_key, text(item), source=source)
+        if representative == item_key or representative not in representatives:
+            representatives.setdefault(representative, item)
+    for representative, item in representatives.items():
+        item["duplicates"] = index.group_size(representative)
+    return list(representatives.values())
+
+
+story_index = NearDuplicateIndex(ttl=STORY_INDEX_TTL)
@@ -0,0 +1,168 @@
+import math
+import os
+import re
+from collections import Counter
+from dataclasses import dataclass
+
+DISTILL_TOKEN_BUDGET = int(os.getenv("DISTILL_TOKEN_BUDGET", "1500"))
+CHUNK_WORDS = 80
+
+BOILERPLATE = re.compile(
+    r"cookie|accept all|privacy policy|terms of (use|service)|all rights reserved|subscribe|sign in|"
+    r"sign up|log in|newsletter|advertisement|share this|follow us|skip to (main )?content|"
+    r"download (the )?app|javascript|©",
+    re.I,
+)
+
+# Background vocabulary that makes a chunk worth keeping even when it never names the stock
+FINANCE_TERMS = [
+    "revenue", "earnings", "profit", "loss", "margin", "quarter", "guidance", "dividend",
+    "shares", "stock", "price", "target", "valuation", "growth", "results", "outlook",
+    "debt", "ebitda", "eps", "sales", "market", "rating", "upgrade", "downgrade",
+]
+
+_WORD = re.compile(r"[a-z0-9][a-z0-9&.\-]*")
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+(?=[A-Z0-9\"'(])")
+
+
+def tokenize(text):
+    return [w.strip(".-") for w in _WORD.findall(text.lower())]
+
+
+def estimate_tokens(text):
+    # Roughly 4/3 tokens per word for English with the Llama and GPT tokenizers
+    return math.ceil(len(text.split()) * 4 / 3)
+
+
+@dataclass
+class DistillResult:
+    text: str
+    tokens_before: int
+    tokens_after: int
+    chunks_kept: int
+    chunks_total: int
+
+
+def split_long_line(line, max_words=CHUNK_WORDS):
+    """A line of at most `max_words` as is, else its sentences packed into pieces of at most `max_words`.
+
+    Pages scraped as one line (minified or single-line output) would otherwise be one chunk.
+    """
+    words = line.split()
+    if len(words) <= max_words:
+        return [line]
+    pieces = []
+    current = []
+    for sentence in _SENTENCE_END.split(line):
+        sentence_words = sentence.split()
+        # A sentence longer than a piece (e.g. a run of menu items) is cut into word windows
+        while len(sentence_words) > max_words:
+            if current:
+                pieces.append(" ".join(current))
+                current = []
+            pieces.append(" ".join(sentence_words[:max_words]))
+            sentence_words = sentence_words[max_words:]
+        if len(current) + len(sentence_words) > max_words:
+            pieces.append(" ".join(current))
+            current = []
+        current.extend(sentence_words)
+    if current:
+        pieces.append(" ".join(current))
+    return pieces
+
+
+def strip_boilerplate(text):
+    lines = []
+    seen = set()
+    for line in (piece for raw in text.splitlines() for piece in split_long_line(raw.strip())):
+        line = line.strip()
+        if not line or line in seen:
+            continue
+        seen.add(line)
+        words = line.split()
+        # Short lines are menus, buttons and breadcrumbs; only keep them if they carry a number
+        if len(words) < 6 and not re.search(r"\d", line):
+            continue
+        if len(words) < 25 and BOILERPLATE.search(line):
+            continue
+        lines.append(line)
+    return lines
+
+
+def split_chunks(lines, chunk_words=CHUNK_WORDS):
+    chunks = []
+    current = []
+    size = 0
+    for line in lines:
+        current.append(line)
+        size += len(line.split())
+        if size >= chunk_words:
+            chunks.append(" ".join(current))
+            current = []
+            size = 0
+    if current:
+        chunks.append(" ".join(current))
+    return chunks
+
+
+def bm25_scores(chunks, query_terms, k1=1.5, b=0.75):
+    docs = [Counter(tokenize(chunk)) for chunk in chunks]
+    lengths = [sum(doc.values()) for doc in docs]
+    avg_length = (sum(lengths) / len(lengths)) if lengths else 0.0
+    n = len(docs)
+
+    scores = [0.0] * n
+    for term, weight in query_terms.items():
+        df = sum(1 for doc in docs if term in doc)
+        if not df:
+            continue
+        idf = math.log(1 + (n - df + 0.5) / (df + 0.5))
+        for i, doc in enumerate(docs):
+            tf = doc.get(term, 0)
+            if tf:
+                norm = k1 * (1 - b + b * lengths[i] / (avg_length or 1))
+                scores[i] += weight * idf * tf * (k1 + 1) / (tf + norm)
+    return scores
+
+
+def distill(text, stock, token_budget=DISTILL_TOKEN_BUDGET):
+    """Keep the chunks of a scraped page most relevant to `stock` within `token_budget`."""
+    if not isinstance(text, str):
+        text = str(text)
+    tokens_before = estimate_tokens(text)
+
+    chunks = split_chunks(strip_boilerplate(text))
+    if not chunks:
+        return DistillResult("", tokens_before, 0, 0, 0)
+
+    stock_terms = [t for t in tokenize(stock) if len(t) > 1]
+    query_terms = {term: 0.3 for term in FINANCE_TERMS}
+    query_terms.update({term: 3.0 for term in stock_terms})
+    scores = bm25_scores(chunks, query_terms)
+
+    # Exact ticker / company name mentions outrank any lexical score
+    name = re.compile(r"\b" + re.escape(stock.strip()) + r"\b", re.I) if stock.strip() else None
+    for i, chunk in enumerate(chunks):
+        if name and name.search(chunk):
+            scores[i] += 10.0
+
+    ranked = sorted(range(len(chunks)), key=lambda i: scores[i], reverse=True)
+    kept = []
+    used = 0
+    for i in ranked:
+        if scores[i] <= 0 and kept:
+            break
+        cost = estimate_tokens(chunks[i])
+        if used + cost > token_budget:
+            continue
+        kept.append(i)
+        used += cost
+
+    if not kept:
+        # Even the best chunk is over budget, so keep as much of it as fits
+        words = chunks[ranked[0]].split()
+        chunks[ranked[0]] = " ".join(words[:token_budget * 3 // 4])
+        kept = [ranked[0]]
+
+    distilled = "\n\n".join(chunks[i] for i in sorted(kept))
+    return DistillResult(distilled, tokens_before, estimate_tokens(distilled), len(kept), len(chunks))
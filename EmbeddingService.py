@@ -0,0 +1,88 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from Lazy import lazy
+from LLMs import embedding_model
+
+# Texts per call into the model
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "64"))
+# Vectors kept in memory, by text hash (384 float32 values each for all-MiniLM-L6-v2)
+EMBED_CACHE_SIZE = int(os.getenv("EMBED_CACHE_SIZE", "5000"))
+
+
+def text_hash(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class EmbeddingService(Embeddings):
+    """The process's one embedding model, fed in batches, with vectors cached by text hash.
+
+    Calls from concurrent analyses take turns on the model instead of loading their own.
+    """
+
+    def __init__(self, model, batch_size=EMBED_BATCH_SIZE, cache_size=EMBED_CACHE_SIZE):
+        self.model = model
+        self.batch_size = max(1, batch_size)
+        self.cache_size = cache_size
+        self.hits = 0
+        self.misses = 0
+        self._cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self._model_lock = threading.Lock()
+
+    def _cached(self, keys):
+        found = {}
+        with self._cache_lock:
+            for key in keys:
+                vector = self._cache.get(key)
+                if vector is not None:
+                    self._cache.move_to_end(key)
+                    found[key] = vector
+        return found
+
+    def _store(self, key, vector):
+        with self._cache_lock:
+            self._cache[key] = vector
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def embed_documents(self, texts):
+        keys = [text_hash(text) for text in texts]
+        vectors = self._cached(keys)
+        missing = {key: text for key, text in zip(keys, texts) if key not in vectors}
+        self.hits += len(keys) - len(missing)
+        self.misses += len(missing)
+
+        pending = list(missing.items())
+        for start in range(0, len(pending), self.batch_size):
+            batch = pending[start:start + self.batch_size]
+            with self._model_lock:
+                encoded = self.model.embed_documents([text for _, text in batch])
+            for (key, _), vector in zip(batch, encoded):
+                vectors[key] = np.asarray(vector, dtype=np.float32)
+                self._store(key, vectors[key])
+        return [vectors[key].tolist() for key in keys]
+
+    def embed_query(self, text):
+        # Some models embed queries differently from documents, so they're cached apart
+        key = "query:" + text_hash(text)
+        vector = self._cached([key]).get(key)
+        if vector is None:
+            self.misses += 1
+            with self._model_lock:
+                vector = np.asarray(self.model.embed_query(text), dtype=np.float32)
+            self._store(key, vector)
+        else:
+            self.hits += 1
+        return vector.tolist()
+
+
+@lazy
+def get_embedding_service():
+    return EmbeddingService(embedding_model())
@@ -0,0 +1,28 @@
+import asyncio
+import threading
+
+# Async clients (asyncpraw, httpx) are bound to the loop they were created on, and
+# crewai runs async tools through asyncio.run, which makes a fresh loop per call.
+# Shared clients therefore live on one long-lived background loop, and callers hand
+# their coroutines over to it.
+_loop = None
+_lock = threading.Lock()
+
+
+def background_loop():
+    global _loop
+    with _lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="background-loop", daemon=True).start()
+        return _loop
+
+
+async def run_in_background(coro):
+    """Run `coro` on the background loop and await its result from any other loop."""
+    return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coro, background_loop()))
+
+
+def run_sync(coro):
+    """Run `coro` on the background loop and block until it finishes."""
+    return asyncio.run_coroutine_threadsafe(coro, background_loop()).result()
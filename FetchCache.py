@@ -0,0 +1,225 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import urllib.error
+import urllib.request
+import zlib
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import Any, Optional
+
+from Cassette import recorded
+
+CACHE_DIR = os.getenv("CACHE_DIR", ".cache")
+CACHE_MAX_BYTES = int(os.getenv("CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+
+# Seconds a cached response stays fresh, per source; override with CACHE_TTL_<SOURCE>
+DEFAULT_TTLS = {
+    "search": 6 * 3600,
+    "scrape": 12 * 3600,
+    "news": 30 * 60,
+    "llm": 7 * 24 * 3600,
+    # Whole-crew reports; a request for the same ticker within this window gets the last one
+    "analysis": 30 * 60,
+}
+
+REVALIDATE_TIMEOUT = 10
+
+
+def source_ttl(source):
+    return float(os.getenv(f"CACHE_TTL_{source.upper()}", DEFAULT_TTLS.get(source, 3600)))
+
+
+@dataclass
+class CacheEntry:
+    value: Any
+    fresh: bool
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+
+
+class DiskCache:
+    """SQLite-backed TTL cache; values are stored once per content hash as zlib blobs."""
+
+    def __init__(self, path=None, max_bytes=CACHE_MAX_BYTES):
+        if path is None:
+            os.makedirs(CACHE_DIR, exist_ok=True)
+            path = os.path.join(CACHE_DIR, "fetch_cache.sqlite")
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS blobs (
+                hash TEXT PRIMARY KEY,
+                data BLOB NOT NULL,
+                size INTEGER NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS entries (
+                key TEXT PRIMARY KEY,
+                source TEXT NOT NULL,
+                blob_hash TEXT NOT NULL REFERENCES blobs(hash),
+                created REAL NOT NULL,
+                last_access REAL NOT NULL,
+                expires REAL NOT NULL,
+                etag TEXT,
+                last_modified TEXT
+            );
+            CREATE INDEX IF NOT EXISTS entries_lru ON entries(last_access);
+        """)
+        self._conn.commit()
+        self.counters = defaultdict(lambda: defaultdict(int))
+
+    @staticmethod
+    def _key(source, key):
+        return hashlib.sha256(f"{source}\0{key}".encode("utf-8")).hexdigest()
+
+    def get(self, source, key, allow_stale=False):
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT e.expires, e.etag, e.last_modified, b.data FROM entries e "
+                "JOIN blobs b ON b.hash = e.blob_hash WHERE e.key = ?",
+                (self._key(source, key),),
+            ).fetchone()
+            if row is None:
+                self.counters[source]["misses"] += 1
+                return None
+
+            expires, etag, last_modified, data = row
+            fresh = expires > now
+            if not fresh and not allow_stale:
+                self.counters[source]["misses"] += 1
+                return None
+
+            self.counters[source]["hits" if fresh else "stale_hits"] += 1
+            self._conn.execute(
+                "UPDATE entries SET last_access = ? WHERE key = ?", (now, self._key(source, key))
+            )
+            self._conn.commit()
+        value = json.loads(zlib.decompress(data).decode("utf-8"))
+        return CacheEntry(value, fresh, etag, last_modified)
+
+    def put(self, source, key, value, ttl=None, etag=None, last_modified=None):
+        if ttl is None:
+            ttl = source_ttl(source)
+        raw = json.dumps(value).encode("utf-8")
+        blob_hash = hashlib.sha256(raw).hexdigest()
+        data = zlib.compress(raw)
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR IGNORE INTO blobs (hash, data, size) VALUES (?, ?, ?)",
+                (blob_hash, data, len(data)),
+            )
+            self._conn.execute(
+                "INSERT OR REPLACE INTO entries "
+                "(key, source, blob_hash, created, last_access, expires, etag, last_modified) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (self._key(source, key), source, blob_hash, now, now, now + ttl, etag, last_modified),
+            )
+            self.counters[source]["stores"] += 1
+            self._evict()
+            self._conn.commit()
+
+    def touch(self, source, key, ttl=None):
+        """Extend a stale entry's lifetime after the origin confirmed it is unchanged."""
+        if ttl is None:
+            ttl = source_ttl(source)
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "UPDATE entries SET expires = ?, last_access = ? WHERE key = ?",
+                (now + ttl, now, self._key(source, key)),
+            )
+            self._conn.commit()
+            self.counters[source]["revalidated"] += 1
+
+    def set_validators(self, source, key, etag=None, last_modified=None):
+        """Attach the ETag and Last-Modified of an entry stored without them."""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE entries SET etag = ?, last_modified = ? WHERE key = ?",
+                (etag, last_modified, self._key(source, key)),
+            )
+            self._conn.commit()
+
+    def _evict(self):
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM blobs").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        rows = self._conn.execute(
+            "SELECT e.key, e.source, b.size FROM entries e JOIN blobs b ON b.hash = e.blob_hash "
+            "ORDER BY e.last_access ASC"
+        ).fetchall()
+        for key, source, size in rows:
+            if total <= self.max_bytes:
+                break
+            self._conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+            self.counters[source]["evictions"] += 1
+            total -= size
+        self._conn.execute(
+            "DELETE FROM blobs WHERE hash NOT IN (SELECT DISTINCT blob_hash FROM entries)"
+        )
+
+    def stats(self):
+        return {source: dict(counts) for source, counts in self.counters.items()}
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = DiskCache()
+        return _cache
+
+
+def conditional_headers(entry):
+    headers = {}
+    if entry is not None and entry.etag:
+        headers["If-None-Match"] = entry.etag
+    if entry is not None and entry.last_modified:
+        headers["If-Modified-Since"] = entry.last_modified
+    return headers
+
+
+def page_validators(url, timeout=REVALIDATE_TIMEOUT):
+    """ETag and Last-Modified of a page, from a HEAD request."""
+    return tuple(recorded("head", {"url": url}, _page_validators, url, timeout))
+
+
+def _page_validators(url, timeout):
+    try:
+        request = urllib.request.Request(url, method="HEAD", headers={"User-Agent": "Mozilla/5.0"})
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            return response.headers.get("ETag"), response.headers.get("Last-Modified")
+    except (urllib.error.URLError, OSError, ValueError):
+        return None, None
+
+
+def not_modified(url, entry, timeout=REVALIDATE_TIMEOUT):
+    """True if the origin answers 304 to a conditional request for a stale entry."""
+    headers = conditional_headers(entry)
+    if not headers:
+        return False
+    return recorded("revalidate", {"url": url, "headers": headers}, _not_modified, url, headers, timeout)
+
+
+def _not_modified(url, headers, timeout):
+    headers = {**headers, "User-Agent": "Mozilla/5.0"}
+    try:
+        request = urllib.request.Request(url, method="HEAD", headers=headers)
+        with urllib.request.urlopen(request, timeout=timeout):
+            return False
+    except urllib.error.HTTPError as e:
+        return e.code == 304
+    except (urllib.error.URLError, OSError, ValueError):
+        return False
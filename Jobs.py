@@ -0,0 +1,307 @@
+import contextvars
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+from FetchCache import get_cache
+from Tracing import crew_callbacks, record_crew_usage, span, start_trace
+
+# Analyses that run at the same time; later ones wait in the queue
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+# How long a finished job stays reachable by its id (e.g. from a reloaded page)
+JOB_TTL = float(os.getenv("JOB_TTL", str(6 * 60 * 60)))
+# Span kinds that are streamed to the page as progress events
+EVENT_KINDS = {"task", "tool", "rag"}
+
+QUEUED, RUNNING, DONE, FAILED, CANCELLED = "queued", "running", "done", "failed", "cancelled"
+FINISHED = {DONE, FAILED, CANCELLED}
+
+_executor = ThreadPoolExecutor(max_workers=JOB_WORKERS, thread_name_prefix="job")
+_jobs = {}
+_jobs_lock = threading.Lock()
+# Analyses running right now, by ticker; other requests for the ticker wait on the same run
+_inflight = {}
+_inflight_lock = threading.Lock()
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class Job:
+    """One background run: its status, the progress events so far, and its result or error."""
+
+    def __init__(self, label):
+        self.id = uuid.uuid4().hex[:12]
+        self.label = label
+        self.status = QUEUED
+        self.events = []
+        self.result = None
+        self.error = None
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.future = None
+        # Per-part status for jobs made of several runs, e.g. each stock of a portfolio
+        self.progress = {}
+        self._cancel = threading.Event()
+        self._lock = threading.Lock()
+
+    @property
+    def done(self):
+        return self.status in FINISHED
+
+    @property
+    def cancel_requested(self):
+        return self._cancel.is_set()
+
+    @property
+    def elapsed(self):
+        if self.started is None:
+            return 0.0
+        return (self.finished or time.time()) - self.started
+
+    def emit(self, kind, name, **detail):
+        with self._lock:
+            self.events.append({"time": time.time(), "kind": kind, "name": name, **detail})
+
+    def events_since(self, index=0):
+        with self._lock:
+            return list(self.events[index:])
+
+    def on_span(self, s, prefix=None):
+        """Trace listener that turns finished task, tool and RAG spans into progress events."""
+        if s.kind in EVENT_KINDS:
+            name = f"{prefix}: {s.name}" if prefix else s.name
+            self.emit(s.kind, name, wall_s=round(s.duration, 2), error=s.attributes.get("error"))
+
+    def cancel(self):
+        """Stop the job: right away if it hasn't started, else once the crew's current task is done."""
+        self._cancel.set()
+        if self.future is not None and self.future.cancel():
+            self.status = CANCELLED
+            self.finished = time.time()
+        elif not self.done:
+            self.emit("job", "cancel requested")
+
+    def check_cancelled(self):
+        if self._cancel.is_set():
+            raise JobCancelled(f"Job {self.id} was cancelled")
+
+
+def _run(job, fn, args):
+    if job.cancel_requested:
+        job.status, job.finished = CANCELLED, time.time()
+        return
+    job.status, job.started = RUNNING, time.time()
+    job.emit("job", "started")
+    try:
+        job.result = fn(job, *args)
+        job.status = DONE
+    except JobCancelled:
+        job.status = CANCELLED
+    except Exception as e:
+        print(f"Job {job.id} ({job.label}) failed: {e}")
+        job.error = str(e)
+        job.status = FAILED
+    finally:
+        job.finished = time.time()
+        job.emit("job", job.status)
+
+
+def _prune():
+    cutoff = time.time() - JOB_TTL
+    with _jobs_lock:
+        for job_id in [i for i, job in _jobs.items() if job.done and (job.finished or 0) < cutoff]:
+            del _jobs[job_id]
+
+
+def submit(label, fn, *args):
+    """Run `fn(job, *args)` on the job pool and return the Job right away."""
+    _prune()
+    job = Job(label)
+    with _jobs_lock:
+        _jobs[job.id] = job
+    job.future = _executor.submit(contextvars.copy_context().run, _run, job, fn, args)
+    return job
+
+
+def get_job(job_id):
+    with _jobs_lock:
+        return _jobs.get(job_id)
+
+
+def active_jobs():
+    with _jobs_lock:
+        return [job for job in _jobs.values() if not job.done]
+
+
+def build_crew(callbacks=None, verbose=True, market_context=""):
+    """A crew of its own over copies of the shared agents and tasks.
+
+    crewai keeps a run's outputs and executors on the agent and task objects, so
+    concurrent runs must not share them. `market_context` is ticker-independent news,
+    e.g. shared by a portfolio's runs, appended to this run's copy of the research task.
+    """
+    from crewai import Crew
+
+    from Agents import Analyst, DecisionAdvisor, Researcher, Sentiment_analyser
+    from Cassette import wrap_agent_llms
+    from RateLimiter import provider_rpm
+    from Tasks import analysis, reporting, research, sentiment_analysis
+
+    agents = [Researcher, Sentiment_analyser, Analyst, DecisionAdvisor]
+    # With CASSETTE_MODE set, the agents' LLM calls are recorded or replayed too
+    wrap_agent_llms(agents)
+    template = Crew(agents=agents, tasks=[research, sentiment_analysis, analysis, reporting]).copy()
+    if market_context:
+        # Braces would be taken for input placeholders when crewai fills in {stock}
+        context = market_context.replace("{", "(").replace("}", ")")
+        template.tasks[0].description = f"{template.tasks[0].description}\n\n{context}"
+    return Crew(
+        agents=template.agents,
+        tasks=template.tasks,
+        verbose=verbose,
+        max_rpm=provider_rpm("openai"),
+        **(callbacks or {})
+    )
+
+
+def crew_inputs(stock):
+    """Inputs for crew.kickoff."""
+    return {"stock": stock}
+
+
+def analyse(job, stock, market_context="", on_span=None):
+    """The crew, then the RAG index over its report, for one stock under its own trace.
+
+    Returns (crew output, vector store, trace). Cancelling the job stops the crew after
+    its current task.
+    """
+    from Cassette import save_cassette
+    from Prefetch import start_prefetch
+    from Rag import setup_rag_system
+
+    trace = None
+    try:
+        with start_trace("analysis", stock=stock) as trace:
+            trace.listeners.append(on_span or job.on_span)
+            callbacks = crew_callbacks(trace)
+            record_task = callbacks["task_callback"]
+
+            def task_callback(output):
+                record_task(output)
+                # crewai retries an agent whose step raises, which would call the LLM again;
+                # a task callback runs outside that retry, so raising here stops the crew
+                job.check_cancelled()
+
+            callbacks["task_callback"] = task_callback
+            crew = build_crew(callbacks, market_context=market_context)
+            # Start the tools' network fetches so they overlap with the agents
+            start_prefetch(stock)
+            result = crew.kickoff(inputs=crew_inputs(stock))
+            record_crew_usage(trace, getattr(result, "token_usage", None))
+            job.check_cancelled()
+            try:
+                with span("rag", "setup"):
+                    vectordb = setup_rag_system(str(result), stock)
+            except Exception as e:
+                # The report stands without its Q&A; the failed span tells the page why
+                print(f"Error setting up RAG system: {e}")
+                vectordb = None
+    finally:
+        # Cancelled and failed runs are traced too
+        if trace is not None:
+            trace.listeners.clear()
+            trace.export_jsonl()
+            trace.export_otlp()
+        save_cassette()
+    return result, vectordb, trace
+
+
+def analysis_key(stock):
+    return stock.strip().upper()
+
+
+def has_fresh_report(stock):
+    return get_cache().get("analysis", analysis_key(stock)) is not None
+
+
+def _wait_for(job, future):
+    """(report, generated_at) of another job's run, or None if it failed or was cancelled."""
+    while True:
+        job.check_cancelled()
+        try:
+            return future.result(timeout=1.0)
+        except FutureTimeoutError:
+            continue
+        except BaseException:
+            return None
+
+
+def cached_analysis(job, stock, market_context="", on_span=None, force=False):
+    """The stock's report from the analysis cache, from a run already in flight, or from a new run.
+
+    Reports stay in the cache for CACHE_TTL_ANALYSIS seconds. Requests for a ticker that
+    is being analysed wait on that run instead of starting the crew again; `force` skips
+    the cache but still joins a run in flight, which is fresh anyway.
+    Returns (report, vector store, trace or None, generated_at, source), where source is
+    "cache", "shared" or "run".
+    """
+    from Rag import open_vectordb
+
+    key = analysis_key(stock)
+    while True:
+        if not force:
+            entry = get_cache().get("analysis", key)
+            if entry is not None:
+                job.emit("job", f"{stock}: cached report")
+                return entry.value["report"], open_vectordb(stock), None, entry.value["generated_at"], "cache"
+        with _inflight_lock:
+            future = _inflight.get(key)
+            leader = future is None
+            if leader:
+                future = _inflight[key] = Future()
+        if leader:
+            break
+        job.emit("job", f"{stock}: waiting on the analysis already running")
+        shared = _wait_for(job, future)
+        if shared is not None:
+            report, generated_at = shared
+            return report, open_vectordb(stock), None, generated_at, "shared"
+        # That run failed or was cancelled; go round again, running the crew here unless another request got there first
+
+    try:
+        result, vectordb, trace = analyse(job, stock, market_context, on_span)
+        report, generated_at = str(result), time.time()
+        get_cache().put("analysis", key, {"report": report, "generated_at": generated_at})
+        future.set_result((report, generated_at))
+    except BaseException as e:
+        future.set_exception(e)
+        raise
+    finally:
+        with _inflight_lock:
+            _inflight.pop(key, None)
+    return report, vectordb, trace, generated_at, "run"
+
+
+def run_analysis(job, stock, force=False):
+    """One stock's analysis, with its Q&A engine; run as a job via submit()."""
+    from Rag import build_qa_engine
+
+    report, vectordb, trace, generated_at, source = cached_analysis(job, stock, force=force)
+    rag_errors = [event["error"] for event in job.events_since() if event["kind"] == "rag" and event.get("error")]
+    return {
+        "stock": stock,
+        "report": report,
+        "vectordb": vectordb,
+        # Built here, off the page's thread, and then shared by every question
+        "qa_engine": build_qa_engine(stock, vectordb) if vectordb else None,
+        "rag_error": rag_errors[-1] if rag_errors else None,
+        "trace_summary": trace.summary() if trace else None,
+        "generated_at": generated_at,
+        "source": source,
+    }
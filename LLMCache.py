@@ -0,0 +1,230 @@
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict, defaultdict
+
+from langchain_core.messages import AIMessage
+
+from FetchCache import get_cache, source_ttl
+from RateLimiter import limiter
+from Tracing import span, estimate_cost
+from Cassette import active_cassette, recorded, arecorded
+
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "2048"))
+
+
+def llm_cache_disabled():
+    return os.getenv("LLM_CACHE", "on").lower() in ("off", "0", "false", "bypass")
+
+
+def model_name(llm):
+    return getattr(llm, "model_name", None) or getattr(llm, "model", None)
+
+
+def model_id(llm):
+    return f"{type(llm).__name__}:{model_name(llm)}:{getattr(llm, 'temperature', None)}"
+
+
+def record_usage(s, model, response):
+    usage = getattr(response, "usage_metadata", None) or {}
+    prompt_tokens = usage.get("input_tokens", 0)
+    completion_tokens = usage.get("output_tokens", 0)
+    s.record(
+        prompt_tokens=prompt_tokens,
+        completion_tokens=completion_tokens,
+        cost_usd=estimate_cost(model, prompt_tokens, completion_tokens),
+        response_bytes=len(response.content),
+    )
+
+
+# Provider quota each chat model class draws from
+LLM_PROVIDERS = {
+    "ChatGroq": "groq",
+    "ChatGoogleGenerativeAI": "gemini",
+    "ChatOpenAI": "openai",
+}
+# Completion tokens reserved per call on top of the prompt
+COMPLETION_TOKENS = 512
+
+
+def encode_message(response):
+    return {"content": response.content, "usage_metadata": dict(getattr(response, "usage_metadata", None) or {})}
+
+
+def decode_message(data):
+    return AIMessage(content=data["content"], usage_metadata=data["usage_metadata"] or None)
+
+
+def cache_key(model, template, inputs):
+    payload = json.dumps({"model": model, "template": template, "inputs": inputs}, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class MemoryTier:
+    def __init__(self, max_entries=LLM_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            expires, content = item
+            if expires <= time.time():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return content
+
+    def put(self, key, content, ttl):
+        with self._lock:
+            self._data[key] = (time.time() + ttl, content)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+
+class DiskTier:
+    """Stores responses in the shared FetchCache, which handles size-bounded eviction."""
+
+    source = "llm"
+
+    def get(self, key):
+        entry = get_cache().get(self.source, key)
+        return entry.value if entry else None
+
+    def put(self, key, content, ttl):
+        get_cache().put(self.source, key, content, ttl=ttl)
+
+
+class LLMCache:
+    def __init__(self, tiers=None, ttl=None):
+        self.tiers = tiers if tiers is not None else [MemoryTier(), DiskTier()]
+        self.ttl = ttl if ttl is not None else source_ttl("llm")
+        self.bypass = False
+        self.counters = defaultdict(int)
+
+    @property
+    def enabled(self):
+        return not self.bypass and not llm_cache_disabled()
+
+    def get(self, key):
+        if not self.enabled:
+            return None
+        for i, tier in enumerate(self.tiers):
+            content = tier.get(key)
+            if content is not None:
+                self.counters["hits"] += 1
+                # Promote into the faster tiers in front of the one that had it
+                for faster in self.tiers[:i]:
+                    faster.put(key, content, self.ttl)
+                return content
+        self.counters["misses"] += 1
+        return None
+
+    def put(self, key, content):
+        if not self.enabled:
+            return
+        for tier in self.tiers:
+            tier.put(key, content, self.ttl)
+
+
+llm_cache = LLMCache()
+
+
+class CachedChain:
+    """`prompt | llm` that answers repeated inputs from llm_cache instead of calling the model."""
+
+    def __init__(self, prompt, llm, cache=None):
+        self.prompt = prompt
+        self.llm = llm
+        self.chain = prompt | llm
+        self.cache = cache or llm_cache
+
+    def key(self, inputs):
+        return cache_key(model_id(self.llm), self.prompt.template, inputs)
+
+    @property
+    def limiter(self):
+        return limiter(LLM_PROVIDERS.get(type(self.llm).__name__, "llm"))
+
+    def estimate_tokens(self, inputs):
+        return len(self.prompt.format(**inputs)) // 4 + COMPLETION_TOKENS
+
+    def invoke(self, inputs, config=None):
+        key = self.key(inputs)
+        model = model_name(self.llm)
+        with span("llm", model, request_bytes=len(self.prompt.format(**inputs))) as s:
+            content = self.cache.get(key)
+            if s:
+                s.record(cache="miss" if content is None else "hit")
+            if content is None:
+                response = self.limiter.call(
+                    recorded, "llm", {"model": model_id(self.llm), "key": key}, self.chain.invoke, inputs, config=config,
+                    tokens=self.estimate_tokens(inputs), encode=encode_message, decode=decode_message,
+                )
+                if s:
+                    record_usage(s, model, response)
+                content = response.content
+                self.cache.put(key, content)
+        return AIMessage(content=content)
+
+    async def ainvoke(self, inputs, config=None):
+        key = self.key(inputs)
+        model = model_name(self.llm)
+        with span("llm", model, request_bytes=len(self.prompt.format(**inputs))) as s:
+            content = self.cache.get(key)
+            if s:
+                s.record(cache="miss" if content is None else "hit")
+            if content is None:
+                response = await self.limiter.acall(
+                    arecorded, "llm", {"model": model_id(self.llm), "key": key}, self.chain.ainvoke, inputs, config=config,
+                    tokens=self.estimate_tokens(inputs), encode=encode_message, decode=decode_message,
+                )
+                if s:
+                    record_usage(s, model, response)
+                content = response.content
+                self.cache.put(key, content)
+        return AIMessage(content=content)
+
+    def stream(self, inputs, config=None):
+        """Yield the response text as the model produces it; a cached response comes in one piece."""
+        if active_cassette() is not None:
+            # Cassettes hold whole responses, so the call is recorded or replayed unstreamed
+            yield self.invoke(inputs, config).content
+            return
+        key = self.key(inputs)
+        model = model_name(self.llm)
+        with span("llm", model, request_bytes=len(self.prompt.format(**inputs))) as s:
+            content = self.cache.get(key)
+            if s:
+                s.record(cache="miss" if content is None else "hit", streamed=True)
+            if content is not None:
+                yield content
+                return
+            self.limiter.acquire(tokens=self.estimate_tokens(inputs))
+            response = None
+            for chunk in self.chain.stream(inputs, config=config):
+                response = chunk if response is None else response + chunk
+                if chunk.content:
+                    yield chunk.content
+            if response is None:
+                return
+            if s:
+                record_usage(s, model, response)
+            self.cache.put(key, response.content)
+
+    async def abatch(self, inputs_list, config=None):
+        max_concurrency = (config or {}).get("max_concurrency") or len(inputs_list) or 1
+        semaphore = asyncio.Semaphore(max_concurrency)
+
+        async def run(inputs):
+            async with semaphore:
+                return await self.ainvoke(inputs)
+
+        return await asyncio.gather(*(run(inputs) for inputs in inputs_list))
@@ -0,0 +1,47 @@
+import os
+
+from dotenv import load_dotenv
+
+from Lazy import lazy
+
+load_dotenv()
+
+# Clients are built on first use, so importing a module that needs one stays cheap and a
+# missing key only fails the call that needs it.
+
+
+@lazy
+def groq_llm():
+    """llama-3.1-8b-instant, shared by the link, extraction and sentiment chains."""
+    from langchain_groq import ChatGroq
+    return ChatGroq(groq_api_key=os.getenv("GROQ_API_KEY"), model="llama-3.1-8b-instant")
+
+
+@lazy
+def gemini_flash():
+    from langchain_google_genai import ChatGoogleGenerativeAI
+    return ChatGoogleGenerativeAI(google_api_key=os.getenv("GOOGLE_API_KEY"), model="gemini-2.0-flash", temperature=0)
+
+
+@lazy
+def recommendation_llm():
+    from langchain_google_genai import ChatGoogleGenerativeAI
+    return ChatGoogleGenerativeAI(google_api_key=os.getenv("GOOGLE_API_KEY"), model="gemini-2.0-flash", temperature=0.1)
+
+
+@lazy
+def rag_llm():
+    from langchain_openai import ChatOpenAI
+    return ChatOpenAI(model_name="gpt-3.5-turbo", temperature=0, openai_api_key=os.getenv("OPEN_AI_KEY"))
+
+
+@lazy
+def embedding_model():
+    from langchain.embeddings import HuggingFaceEmbeddings
+    return HuggingFaceEmbeddings(model_name="all-MiniLM-L6-v2")
+
+
+def agent_llm():
+    """A new GPT-4o client; each agent gets its own, as crewai counts token usage per LLM object."""
+    from crewai import LLM
+    return LLM(api_key=os.getenv("OPEN_AI_KEY"), model="openai/gpt-4o")
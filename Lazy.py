@@ -0,0 +1,42 @@
+import functools
+import threading
+
+_registry = {}
+
+
+def lazy(factory):
+    """Build `factory()` on the first call and return that same object for the rest of the process.
+
+    The getter's `set(obj)` puts a different object in its place (e.g. a local stand-in),
+    `reset()` drops it so the next call builds a new one, and `is_built()` says whether it
+    exists yet.
+    """
+    lock = threading.Lock()
+    state = {}
+
+    @functools.wraps(factory)
+    def get():
+        if "value" not in state:
+            with lock:
+                if "value" not in state:
+                    state["value"] = factory()
+        return state["value"]
+
+    def set(value):
+        with lock:
+            state["value"] = value
+
+    def reset():
+        with lock:
+            state.pop("value", None)
+
+    get.set = set
+    get.reset = reset
+    get.is_built = lambda: "value" in state
+    _registry[f"{factory.__module__}.{factory.__name__}"] = get
+    return get
+
+
+def built():
+    """Names of the lazy objects that exist so far."""
+    return sorted(name for name, get in _registry.items() if get.is_built())
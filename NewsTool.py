@@ -1,32 +1,176 @@
 from crewai.tools import BaseTool
-import json
-import urllib.request
+import asyncio
+import httpx
 import os
 from dotenv import load_dotenv
+from FetchCache import get_cache, conditional_headers
+from Dedup import dedupe, story_index
+from EventLoop import run_sync
+from SearchResults import dedup_key, normalize_url
+from RateLimiter import limiter, CircuitOpenError
+from Prefetch import warm_result
+from Tracing import span, record, traced_tool, carry, payload_size
+from Cassette import arecorded
 
 load_dotenv()
 
 api_key = os.getenv("GNEWS_KEY")
 
+GNEWS_URL = "https://gnews.io/api/v4/search"
+NEWS_TIMEOUT = float(os.getenv("NEWS_TIMEOUT", "10"))
+MAX_NEWS_CONCURRENCY = int(os.getenv("MAX_NEWS_CONCURRENCY", "8"))
+
+_client = None
+
+
+def get_client():
+  """The process-wide pooled client; only call from coroutines running on the background loop."""
+  global _client
+  if _client is None:
+    _client = httpx.AsyncClient(
+      timeout=NEWS_TIMEOUT,
+      limits=httpx.Limits(max_connections=MAX_NEWS_CONCURRENCY, max_keepalive_connections=MAX_NEWS_CONCURRENCY),
+      transport=httpx.AsyncHTTPTransport(retries=2),
+    )
+  return _client
+
+
+def encode_response(response):
+  headers = {name: response.headers[name] for name in ("etag", "last-modified", "retry-after") if name in response.headers}
+  return {"status": response.status_code, "headers": headers, "body": response.text}
+
+
+def decode_response(data):
+  return httpx.Response(data["status"], headers=data["headers"], text=data["body"],
+                        request=httpx.Request("GET", GNEWS_URL))
+
+
+def gnews_query(query):
+  # Multi-word company names are searched as a phrase
+  query = query.strip()
+  if " " in query and not query.startswith('"'):
+    return f'"{query}"'
+  return query
+
+
+async def fetch_articles(query, max_articles=10):
+  with span("http", "gnews", query=query):
+    return await _fetch_articles(query, max_articles)
+
+
+async def _fetch_articles(query, max_articles):
+  q = gnews_query(query)
+  key = f"{q}|en|any|{max_articles}"
+  cache = get_cache()
+  entry = cache.get("news", key, allow_stale=True)
+  if entry and entry.fresh:
+    record(cache="hit", response_bytes=payload_size(entry.value))
+    return entry.value
+
+  params = {"q": q, "lang": "en", "country": "any", "max": max_articles, "apikey": api_key}
+
+  async def get():
+    headers = conditional_headers(entry)
+    # The API key is left out of the recorded request
+    response = await arecorded(
+      "gnews", {"query": q, "max": max_articles, "headers": headers},
+      get_client().get, GNEWS_URL, params=params, headers=headers,
+      encode=encode_response, decode=decode_response,
+    )
+    if response.status_code != 304:
+      response.raise_for_status()
+    return response
+
+  response = await limiter("gnews").acall(get)
+  record(response_bytes=len(response.content))
+  if response.status_code == 304 and entry:
+    cache.touch("news", key)
+    record(cache="revalidated")
+    return entry.value
+  record(cache="miss")
+  articles = response.json()["articles"]
+  cache.put("news", key, articles,
+            etag=response.headers.get("ETag"),
+            last_modified=response.headers.get("Last-Modified"))
+  return articles
+
+
+def merge_articles(groups):
+  """Articles from several queries, deduped by normalized URL, newest first."""
+  seen = set()
+  merged = []
+  for articles in groups:
+    for article in articles:
+      url = normalize_url(article["url"])
+      key = dedup_key(url) if url else article["url"]
+      if key not in seen:
+        seen.add(key)
+        merged.append(article)
+  return sorted(merged, key=lambda article: article["publishedAt"], reverse=True)
+
+
+async def fetch_headlines(stocks, max_articles=10):
+  """Headlines for many stocks at once.
+
+  `stocks` maps each ticker to a list of alias queries (e.g. company names); every query
+  runs concurrently and each ticker gets its merged, deduped articles back.
+  """
+  semaphore = asyncio.Semaphore(MAX_NEWS_CONCURRENCY)
+
+  async def fetch(query):
+    async with semaphore:
+      try:
+        return await fetch_articles(query, max_articles)
+      except (httpx.HTTPError, CircuitOpenError, KeyError, ValueError) as e:
+        print(f"[news] {query}: {e}")
+        return []
+
+  queries = {stock: [stock, *aliases] for stock, aliases in stocks.items()}
+  results = await asyncio.gather(*(fetch(q) for qs in queries.values() for q in qs))
+
+  headlines = {}
+  i = 0
+  for stock, qs in queries.items():
+    headlines[stock] = merge_articles(results[i:i + len(qs)])
+    i += len(qs)
+  return headlines
+
+
+def format_articles(articles):
+  articles = dedupe(
+    articles,
+    lambda article: f"{article['title']} {article['description']}",
+    index=story_index,
+    key=lambda article: f"news:{article['url']}",
+    source="gnews",
+  )
+  response = ""
+  for article in articles:
+    response += f"Title:{article['title']}\n Description: {article['description']} \n Date: {article['publishedAt']} \n URL: {article['url']}\n"
+    if article["duplicates"] > 1:
+      response += f" Reported by: {article['duplicates']} sources\n"
+    response += "\n"
+  return response
+
+
 class NewsTool(BaseTool):
   name: str = "News tool"
   description: str = (
       "This tool upon giving a single word input for eg: AAPL or Apple"
-      "Gets the top headlines, description, date and url of the latest news"
+      "Gets the top headlines, description, date and url of the latest news. "
+      "Several names for the same company can be given separated by commas, eg: RELIANCE, Reliance Industries"
   )
 
+  @traced_tool
   def _run(self, stocks: str) -> str:
-    apikey = api_key
-    q =  stocks
-    url = f"https://gnews.io/api/v4/search?q={q}&lang=en&country=any&max=10&apikey={apikey}"
-    with urllib.request.urlopen(url) as response:
-        data = json.loads(response.read().decode("utf-8"))
-        articles = data["articles"]
-        response = ""
-        for article in articles:
-          response += f"Title:{article['title']}\n Description: {article['description']} \n Date: {article['publishedAt']} \n URL: {article['url']}\n\n"
-
-        return response if response else "No news found for the given stock."
-    
+    warm = warm_result(self.name, stocks)
+    if warm is not None:
+      return warm
 
+    names = [name.strip() for name in stocks.split(",") if name.strip()]
+    if not names:
+      return "No news found for the given stock."
+    headlines = run_sync(carry(fetch_headlines({names[0]: names[1:]})))
+    response = format_articles(headlines[names[0]])
 
+    return response if response else "No news found for the given stock."
@@ -0,0 +1,211 @@
+import asyncio
+import contextvars
+import os
+import re
+import time
+from concurrent.futures import CancelledError, ThreadPoolExecutor, as_completed
+
+from Jobs import CANCELLED, DONE, FAILED, QUEUED, RUNNING, JobCancelled, cached_analysis, has_fresh_report
+from Lazy import lazy
+
+# Stocks analysed at the same time within one portfolio
+PORTFOLIO_WORKERS = int(os.getenv("PORTFOLIO_WORKERS", "4"))
+MAX_PORTFOLIO_SIZE = int(os.getenv("MAX_PORTFOLIO_SIZE", "50"))
+# Searched once per portfolio instead of by every stock's researcher
+MACRO_QUERIES = [
+    query.strip() for query in os.getenv(
+        "MACRO_QUERIES",
+        "global stock markets,US Federal Reserve interest rates,US tariffs trade policy,geopolitical conflict oil prices",
+    ).split(",") if query.strip()
+]
+# How long the crews wait on the shared fetches before running without them
+MARKET_CONTEXT_WAIT = float(os.getenv("MARKET_CONTEXT_WAIT", "180"))
+
+RATINGS = {"STRONG BUY": 2, "BUY": 1, "HOLD": 0, "SELL": -1, "STRONG SELL": -2}
+# The first rating after a mention of the recommendation, e.g. "Recommendation: **Strong Buy**"
+RATING = re.compile(r"recommendation\w*\W[\s\S]{0,200}?\b(strong\s+buy|strong\s+sell|buy|hold|sell)\b", re.IGNORECASE)
+
+
+def parse_tickers(text):
+    """Unique upper-case tickers from text separated by commas, spaces or new lines, in order."""
+    tickers = [ticker.upper() for ticker in re.split(r"[\s,;]+", text) if ticker]
+    return list(dict.fromkeys(tickers))[:MAX_PORTFOLIO_SIZE]
+
+
+def market_news():
+    """GNews headlines for the macro queries, merged and deduped."""
+    from EventLoop import run_sync
+    from NewsTool import fetch_headlines, format_articles, merge_articles
+
+    headlines = run_sync(fetch_headlines({query: [] for query in MACRO_QUERIES}, max_articles=5))
+    return format_articles(merge_articles(headlines.values()))
+
+
+def reddit_market_news():
+    """The hot finance-subreddit summaries of RedditNewsTool; they don't depend on the stock."""
+    from RedditNewsTool import RedditNewsTool
+
+    return "\n\n".join(asyncio.run(RedditNewsTool()._run()))
+
+
+def start_market_context():
+    """Start the ticker-independent fetches; pass the result to market_context()."""
+    from Prefetch import shared
+
+    # Both fetches run at once; a second portfolio within PREFETCH_WARM_TTL gets the same results
+    return {
+        "Global and macro headlines": shared("portfolio news", ",".join(MACRO_QUERIES), market_news),
+        "Market news from Reddit": shared("portfolio reddit", "hot", reddit_market_news),
+    }
+
+
+def market_context(futures=None, timeout=MARKET_CONTEXT_WAIT):
+    """Ticker-independent news for the research task, fetched once and shared by every stock."""
+    futures = futures or start_market_context()
+    # One wait for all the fetches, not one per fetch
+    deadline = time.monotonic() + timeout
+    parts = []
+    for title, future in futures.items():
+        try:
+            text = future.result(timeout=max(0.0, deadline - time.monotonic()))
+        except Exception as e:
+            print(f"[portfolio] {title} unavailable: {e}")
+            continue
+        if text:
+            parts.append(f"{title}:\n{text}")
+    if not parts:
+        return ""
+    return (
+        "Global market context, gathered once for every stock in this portfolio; use it for the "
+        "global news instead of searching for it again:\n\n" + "\n\n".join(parts)
+    )
+
+
+@lazy
+def rating_chain():
+    """Asks the recommendation LLM for a rating, through the LLM cache and its provider's rate limit."""
+    from langchain_core.prompts import PromptTemplate
+
+    from LLMCache import CachedChain
+    from LLMs import recommendation_llm
+
+    prompt = PromptTemplate(
+        input_variables=["report"],
+        template=(
+            "Here is an analysis report:\n{report}\n\nBased on this analysis, provide a recommendation: "
+            f"{', '.join(RATINGS)}. Only respond with one of these."
+        ),
+    )
+    return CachedChain(prompt, recommendation_llm())
+
+
+def rating_of(report):
+    """The report's recommendation as one of RATINGS, read from the text or else asked of the LLM; "N/A" if neither works."""
+    matches = RATING.findall(report)
+    if matches:
+        return " ".join(matches[-1].upper().split())
+    try:
+        answer = rating_chain().invoke({"report": report}).content.strip().upper()
+        match = re.search(r"STRONG\s+BUY|STRONG\s+SELL|BUY|HOLD|SELL", answer)
+        if match:
+            return " ".join(match.group(0).split())
+    except Exception as e:
+        print(f"[portfolio] Could not get a recommendation: {e}")
+    return "N/A"
+
+
+def rank(rows):
+    """Finished stocks first, best rating first; unrated and failed stocks last."""
+    return sorted(rows, key=lambda row: (
+        row["status"] != DONE, row["rating"] not in RATINGS, -RATINGS.get(row["rating"], 0), row["stock"],
+    ))
+
+
+def run_portfolio(job, stocks, workers=PORTFOLIO_WORKERS, force=False):
+    """Analyse every stock on a pool of `workers` threads and rank them; run as a job via submit().
+
+    Each stock is analysed like run_analysis, cached reports included, and its progress
+    is kept in job.progress. A stock that fails is reported in the summary instead of
+    failing the portfolio.
+    """
+    from Prefetch import start_prefetch
+
+    workers = max(1, min(workers, len(stocks)))
+    for stock in stocks:
+        job.progress[stock] = {"status": QUEUED, "rating": None, "wall_s": None, "tokens": None, "source": None}
+    started = time.time()
+    # Stocks with a fresh cached report need neither their own fetches nor the shared ones
+    to_run = stocks if force else [stock for stock in stocks if not has_fresh_report(stock)]
+    context = ""
+    if to_run:
+        # The shared fetches have a pool of their own; the first stocks' own fetches overlap with them
+        shared_fetches = start_market_context()
+        for stock in to_run[:workers]:
+            start_prefetch(stock)
+        context = market_context(shared_fetches)
+        job.emit("portfolio", "market context", wall_s=round(time.time() - started, 2))
+    job.check_cancelled()
+
+    def analyse_one(stock):
+        job.check_cancelled()
+        job.progress[stock] = {**job.progress[stock], "status": RUNNING}
+        stock_started = time.time()
+        try:
+            report, _, trace, generated_at, source = cached_analysis(
+                job, stock, context, on_span=lambda s: job.on_span(s, prefix=stock), force=force,
+            )
+        except JobCancelled:
+            raise
+        except Exception as e:
+            print(f"[portfolio] {stock} failed: {e}")
+            job.progress[stock] = {
+                **job.progress[stock], "status": FAILED, "wall_s": round(time.time() - stock_started, 1), "error": str(e),
+            }
+            return None
+        # Cached and shared reports cost this portfolio no agent tokens
+        usage = trace.root.attributes if trace else {}
+        job.progress[stock] = {
+            "status": DONE,
+            "rating": rating_of(report),
+            "wall_s": round(time.time() - stock_started, 1),
+            "tokens": int((usage.get("prompt_tokens") or 0) + (usage.get("completion_tokens") or 0)),
+            "source": source,
+            "generated_at": time.strftime("%Y-%m-%d %H:%M", time.localtime(generated_at)),
+        }
+        return report
+
+    reports = {}
+    finished = 0
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="portfolio") as pool:
+        # Each stock gets its own copy of the context, so its trace stays its own
+        futures = {pool.submit(contextvars.copy_context().run, analyse_one, stock): stock for stock in stocks}
+        for future in as_completed(futures):
+            stock = futures[future]
+            try:
+                report = future.result()
+            except (JobCancelled, CancelledError):
+                job.progress[stock] = {**job.progress[stock], "status": CANCELLED}
+                for pending in futures:
+                    pending.cancel()
+                continue
+            if report is not None:
+                reports[stock] = report
+            finished += 1
+            elapsed = time.time() - started
+            job.emit(
+                "portfolio", f"{stock}: {job.progress[stock]['status']} ({finished}/{len(stocks)})",
+                wall_s=job.progress[stock]["wall_s"], per_min=round(len(reports) / elapsed * 60, 2),
+            )
+    job.check_cancelled()
+
+    elapsed = time.time() - started
+    return {
+        "portfolio": True,
+        "stocks": stocks,
+        "rows": rank([{"stock": stock, **row} for stock, row in job.progress.items()]),
+        "reports": reports,
+        "market_context": context,
+        "workers": workers,
+        "elapsed_s": round(elapsed, 1),
+        "analyses_per_min": round(len(reports) / elapsed * 60, 2),
+    }
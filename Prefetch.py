@@ -0,0 +1,108 @@
+import asyncio
+import contextvars
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+# How long prefetched tool output is handed out before tools fetch again themselves
+WARM_TTL = float(os.getenv("PREFETCH_WARM_TTL", str(15 * 60)))
+# How long a tool call waits on an in-flight prefetch of the same input
+PREFETCH_WAIT = float(os.getenv("PREFETCH_WAIT", "180"))
+
+# Three fetches per stock, for as many stocks as a portfolio analyses at once
+PREFETCH_WORKERS = int(os.getenv("PREFETCH_WORKERS", str(3 * int(os.getenv("PORTFOLIO_WORKERS", "4")))))
+
+_executor = ThreadPoolExecutor(max_workers=PREFETCH_WORKERS, thread_name_prefix="prefetch")
+# The fetches every stock of a portfolio waits on never queue behind the stocks' own
+_shared_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv("SHARED_FETCH_WORKERS", "2")), thread_name_prefix="shared-fetch",
+)
+_warm = {}
+_warm_lock = threading.Lock()
+_local = threading.local()
+
+
+def _key(tool_name, arg):
+    return tool_name, str(arg).strip().lower()
+
+
+def _prefetched(tool_name, arg, fn, executor=None):
+    def run():
+        # Inside a prefetch the tool must do the real fetch instead of waiting on itself
+        _local.prefetching = True
+        try:
+            return fn()
+        finally:
+            _local.prefetching = False
+
+    with _warm_lock:
+        key = _key(tool_name, arg)
+        started, future = _warm.get(key, (0.0, None))
+        if future is None or time.time() - started > WARM_TTL or (future.done() and future.exception()):
+            future = (executor or _executor).submit(contextvars.copy_context().run, run)
+            _warm[key] = (time.time(), future)
+        return future
+
+
+def shared(name, arg, fn):
+    """Start `fn()` in the background once per (name, arg) and WARM_TTL; every caller gets the same future.
+
+    Shared fetches have their own pool, so a busy prefetch pool doesn't hold them up.
+    """
+    return _prefetched(name, arg, fn, _shared_executor)
+
+
+def _warm_future(tool_name, arg):
+    if getattr(_local, "prefetching", False):
+        return None
+    with _warm_lock:
+        key = _key(tool_name, arg)
+        started, future = _warm.get(key, (0.0, None))
+        if future is None or time.time() - started > WARM_TTL:
+            return None
+        # A prefetch still queued behind other fetches is no head start; the caller fetches itself
+        if future.cancel():
+            del _warm[key]
+            return None
+    return future
+
+
+def warm_result(tool_name, arg, timeout=PREFETCH_WAIT):
+    """Prefetched output for a tool call, waiting for it if the prefetch is already running, else None."""
+    future = _warm_future(tool_name, arg)
+    if future is None:
+        return None
+    try:
+        return future.result(timeout=timeout)
+    except (FutureTimeoutError, Exception):
+        return None
+
+
+async def awarm_result(tool_name, arg, timeout=PREFETCH_WAIT):
+    future = _warm_future(tool_name, arg)
+    if future is None:
+        return None
+    try:
+        return await asyncio.wait_for(asyncio.wrap_future(future), timeout)
+    except Exception:
+        return None
+
+
+def start_prefetch(stock):
+    """Start the search/scrape, GNews and Reddit fetches for `stock` in the background.
+
+    Returns the futures right away, so the crew can be kicked off while they run; tool
+    calls with the same input pick the results up instead of fetching again.
+    """
+    from Agents import get_news_tool, get_scrape_and_search_tool, get_sentiment_tool
+
+    scrape_and_search_tool = get_scrape_and_search_tool()
+    news_tool = get_news_tool()
+    sentiment_tool = get_sentiment_tool()
+    return [
+        _prefetched(scrape_and_search_tool.name, stock, lambda: scrape_and_search_tool._run(stock)),
+        _prefetched(news_tool.name, stock, lambda: news_tool._run(stock)),
+        _prefetched(sentiment_tool.name, stock, lambda: asyncio.run(sentiment_tool._run(stock))),
+    ]
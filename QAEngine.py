@@ -0,0 +1,163 @@
+import math
+import os
+import re
+import threading
+from collections import Counter, OrderedDict, defaultdict
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.prompts import PromptTemplate
+
+from LLMCache import CachedChain
+from LLMs import rag_llm
+
+# Candidates taken from each retriever before fusion, and chunks the answer is given
+QA_KEYWORD_K = int(os.getenv("QA_KEYWORD_K", "8"))
+QA_VECTOR_K = int(os.getenv("QA_VECTOR_K", "8"))
+QA_CONTEXT_CHUNKS = int(os.getenv("QA_CONTEXT_CHUNKS", "4"))
+QA_ANSWER_CACHE_SIZE = int(os.getenv("QA_ANSWER_CACHE_SIZE", "256"))
+# The usual reciprocal-rank-fusion constant; larger values flatten the rank differences
+RRF_K = 60
+
+# Keeps tickers, "p/e", "17.1%", "$26.0" and "q3-fy25" as single terms
+TOKEN = re.compile(r"[$₹€£]?[a-z0-9]+(?:[./,&'-][a-z0-9]+)*%?")
+
+QA_PROMPT = PromptTemplate(
+    template="""Use the following pieces of context to answer the question at the end. If you don't know the answer, just say that you don't know, don't try to make up an answer.
+
+{context}
+
+Question: {question}
+Helpful Answer:""",
+    input_variables=["context", "question"],
+)
+
+
+def tokenize(text):
+    return TOKEN.findall(text.lower())
+
+
+class BM25:
+    """Okapi BM25 over a fixed list of texts, scored with NumPy."""
+
+    def __init__(self, texts, k1=1.5, b=0.75):
+        self.size = len(texts)
+        counts = [Counter(tokenize(text)) for text in texts]
+        lengths = np.array([sum(c.values()) for c in counts], dtype=np.float32)
+        average = lengths.mean() if self.size else 0.0
+        # Per-document length normalisation, computed once
+        self.norm = k1 * (1 - b + b * lengths / (average or 1.0))
+        self.k1 = k1
+        postings = defaultdict(lambda: ([], []))
+        for doc, count in enumerate(counts):
+            for term, tf in count.items():
+                postings[term][0].append(doc)
+                postings[term][1].append(tf)
+        self.postings = {
+            term: (np.array(docs), np.array(tfs, dtype=np.float32)) for term, (docs, tfs) in postings.items()
+        }
+        self.idf = {
+            term: math.log(1 + (self.size - len(docs) + 0.5) / (len(docs) + 0.5))
+            for term, (docs, _) in self.postings.items()
+        }
+
+    def scores(self, query):
+        scores = np.zeros(self.size, dtype=np.float32)
+        for term in set(tokenize(query)):
+            if term not in self.postings:
+                continue
+            docs, tfs = self.postings[term]
+            scores[docs] += self.idf[term] * tfs * (self.k1 + 1) / (tfs + self.norm[docs])
+        return scores
+
+    def top(self, query, k):
+        """Indices of the k best matching texts, best first; texts sharing no term are left out."""
+        scores = self.scores(query)
+        ranked = np.argsort(-scores)[:k]
+        return [int(i) for i in ranked if scores[i] > 0]
+
+
+def reciprocal_rank_fusion(rankings, k=RRF_K):
+    """Merge ranked lists of keys, scoring each key by sum(1 / (k + rank)) over the lists."""
+    scores = defaultdict(float)
+    for ranking in rankings:
+        for rank, key in enumerate(ranking, start=1):
+            scores[key] += 1.0 / (k + rank)
+    return sorted(scores, key=lambda key: -scores[key])
+
+
+def corpus(vectordb):
+    """(texts, metadatas) of every chunk in a NumpyIndex or Chroma store."""
+    if hasattr(vectordb, "texts"):
+        return list(vectordb.texts), list(vectordb.metadatas)
+    data = vectordb.get(include=["documents", "metadatas"])
+    return list(data["documents"]), [m or {} for m in data["metadatas"]]
+
+
+class QAEngine:
+    """Answers questions about one ticker's analyses; build it once and reuse it for every question.
+
+    Chunks are retrieved by BM25 and by vector similarity, fused by reciprocal rank, so exact
+    terms like tickers and "P/E" match as reliably as paraphrases. Answers stream from the
+    RAG model and repeated questions are answered from memory.
+    """
+
+    def __init__(self, stock, vectordb, llm=None):
+        self.stock = stock
+        self.vectordb = vectordb
+        texts, metadatas = corpus(vectordb)
+        self.documents = {text: Document(page_content=text, metadata=metadata) for text, metadata in zip(texts, metadatas)}
+        self.texts = list(self.documents)
+        self.bm25 = BM25(self.texts)
+        self.chain = CachedChain(QA_PROMPT, llm or rag_llm())
+        self._answers = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def question_key(question):
+        return " ".join(tokenize(question))
+
+    def retrieve(self, question, k=QA_CONTEXT_CHUNKS):
+        keyword = [self.texts[i] for i in self.bm25.top(question, QA_KEYWORD_K)]
+        vector = [doc.page_content for doc in self.vectordb.similarity_search(question, k=QA_VECTOR_K)]
+        fused = reciprocal_rank_fusion([keyword, vector])[:k]
+        return [self.documents.get(text) or Document(page_content=text) for text in fused]
+
+    def _cached(self, key):
+        with self._lock:
+            answer = self._answers.get(key)
+            if answer is not None:
+                self._answers.move_to_end(key)
+            return answer
+
+    def _remember(self, key, text, sources):
+        with self._lock:
+            self._answers[key] = (text, sources)
+            self._answers.move_to_end(key)
+            while len(self._answers) > QA_ANSWER_CACHE_SIZE:
+                self._answers.popitem(last=False)
+
+    def ask(self, question):
+        """(source documents, iterator over the answer's text as it arrives)."""
+        key = self.question_key(question)
+        cached = self._cached(key)
+        if cached is not None:
+            text, sources = cached
+            return sources, iter([text])
+
+        sources = self.retrieve(question)
+        inputs = {"context": "\n\n".join(doc.page_content for doc in sources), "question": question}
+
+        def generate():
+            parts = []
+            for piece in self.chain.stream(inputs):
+                parts.append(piece)
+                yield piece
+            self._remember(key, "".join(parts), sources)
+
+        return sources, generate()
+
+    def answer(self, question):
+        """The whole answer at once, shaped like RetrievalQA's output."""
+        sources, pieces = self.ask(question)
+        return {"query": question, "result": "".join(pieces), "source_documents": sources}
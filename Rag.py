@@ -0,0 +1,336 @@
+import hashlib
+import os
+import re
+import shutil
+import threading
+import time
+
+from FetchCache import CACHE_DIR
+from Lazy import lazy
+
+# One persistent Chroma store; each ticker has a collection holding all its recent analyses
+RAG_DIR = os.getenv("RAG_DIR", os.path.join(CACHE_DIR, "rag"))
+# Chunks no analysis has produced for this many days are dropped, and so are tickers left with none
+RAG_RETENTION_DAYS = float(os.getenv("RAG_RETENTION_DAYS", "30"))
+# Tickers kept at most; the least recently analysed go first
+RAG_MAX_COLLECTIONS = int(os.getenv("RAG_MAX_COLLECTIONS", "200"))
+RAG_CLEANUP_INTERVAL = float(os.getenv("RAG_CLEANUP_INTERVAL", str(60 * 60)))
+COLLECTION_PREFIX = "analysis-"
+# "chroma": a persistent Chroma collection per ticker; "numpy": a float32 matrix per ticker
+# saved with np.save and memory-mapped on load, with no Chroma/SQLite underneath
+RAG_BACKEND = os.getenv("RAG_BACKEND", "chroma").lower()
+NUMPY_DIR = os.path.join(RAG_DIR, "numpy")
+
+CHUNK_CHARS = int(os.getenv("RAG_CHUNK_CHARS", "800"))
+CHUNK_OVERLAP_SENTENCES = int(os.getenv("RAG_CHUNK_OVERLAP_SENTENCES", "1"))
+HEADING = re.compile(r"^(#{1,6}\s+.+|\*\*[^*]+\*\*:?)$")
+LIST_ITEM = re.compile(r"^([-*+•|]|\d+[.)])\s*")
+SENTENCE_END = re.compile(r"[.!?](?=[\"')\]]*\s+[\"'(\[]*[A-Z0-9$₹€£])")
+ABBREVIATIONS = {
+    "e.g.", "i.e.", "etc.", "vs.", "approx.", "est.", "inc.", "ltd.", "co.", "corp.", "no.",
+    "mr.", "mrs.", "ms.", "dr.", "rs.", "u.s.", "u.k.", "jan.", "feb.", "mar.", "apr.", "jun.",
+    "jul.", "aug.", "sep.", "sept.", "oct.", "nov.", "dec.",
+}
+
+_collection_locks = {}
+_collection_locks_lock = threading.Lock()
+_cleanup = {"last": 0.0}
+_cleanup_lock = threading.Lock()
+
+
+@lazy
+def get_chroma_client():
+    import chromadb
+    os.makedirs(RAG_DIR, exist_ok=True)
+    return chromadb.PersistentClient(path=RAG_DIR)
+
+
+def _collection_lock(name):
+    with _collection_locks_lock:
+        if name not in _collection_locks:
+            _collection_locks[name] = threading.Lock()
+        return _collection_locks[name]
+
+
+def collection_name(stock):
+    """A valid Chroma collection name (3-63 chars, alphanumeric ends) unique to the ticker."""
+    ticker = str(stock).strip().upper()
+    slug = re.sub(r"[^a-z0-9]+", "-", ticker.lower()).strip("-")[:40] or "stock"
+    return f"{COLLECTION_PREFIX}{slug}-{hashlib.sha1(ticker.encode('utf-8')).hexdigest()[:8]}"
+
+
+def split_sections(text):
+    """(heading, blocks) per section; a block is a paragraph, or one line of a list or table."""
+    sections = [("", [])]
+    paragraph = []
+
+    def flush():
+        if paragraph:
+            sections[-1][1].append(" ".join(paragraph))
+            paragraph.clear()
+
+    for line in text.splitlines():
+        stripped = line.strip()
+        if not stripped:
+            flush()
+        elif HEADING.match(stripped):
+            flush()
+            sections.append((stripped.strip("#* ").rstrip(":"), []))
+        elif LIST_ITEM.match(stripped):
+            flush()
+            sections[-1][1].append(stripped)
+        else:
+            paragraph.append(stripped)
+    flush()
+    return [(heading, blocks) for heading, blocks in sections if blocks]
+
+
+def split_sentences(block):
+    """Sentences of a paragraph; decimals, tickers and abbreviations like "U.S." or "Inc." stay whole."""
+    sentences = []
+    start = 0
+    for match in SENTENCE_END.finditer(block):
+        words = block[start:match.start() + 1].split()
+        if words and words[-1].lower().strip("(\"'") in ABBREVIATIONS:
+            continue
+        sentences.append(block[start:match.start() + 1].strip())
+        start = match.end()
+    if block[start:].strip():
+        sentences.append(block[start:].strip())
+    return sentences
+
+
+def chunk_text(analysis_text, max_chars=CHUNK_CHARS, overlap=CHUNK_OVERLAP_SENTENCES):
+    """Chunks of whole sentences, up to max_chars, that never span sections.
+
+    Each chunk starts with its section's heading and repeats the last `overlap`
+    sentences of the chunk before it in the same section.
+    """
+    if not isinstance(analysis_text, str):
+        return [str(analysis_text)]
+    chunks = []
+    for heading, blocks in split_sections(analysis_text):
+        # (text, separator before it): a new block starts on a new line
+        units = []
+        for block in blocks:
+            separator = "\n"
+            for sentence in split_sentences(block):
+                # A sentence longer than a chunk (e.g. a huge table row) is cut at word boundaries
+                while len(sentence) > max_chars:
+                    cut = sentence.rfind(" ", 0, max_chars)
+                    cut = cut if cut > 0 else max_chars
+                    units.append((sentence[:cut], separator))
+                    sentence, separator = sentence[cut:].strip(), " "
+                units.append((sentence, separator))
+                separator = " "
+        current = []
+        for unit in units:
+            if current and sum(len(text) + 1 for text, _ in current) + len(unit[0]) > max_chars:
+                chunks.append((heading, current))
+                # No overlap when it would be the whole chunk just written, e.g. one long sentence
+                current = current[-overlap:] if overlap and len(current) > overlap else []
+            current.append(unit)
+        if current:
+            chunks.append((heading, current))
+    return [
+        (f"{heading}\n" if heading else "") + "".join(separator + text for text, separator in units)[1:]
+        for heading, units in chunks
+    ]
+
+
+def chunk_id(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:32]
+
+
+def numpy_index_path(stock):
+    return os.path.join(NUMPY_DIR, collection_name(stock))
+
+
+def _cleanup_chroma(cutoff):
+    """Drop expired collections and chunks; returns how many collections went, and
+    (updated_at, name, delete) for each one left."""
+    client = get_chroma_client()
+    # chromadb < 0.6 lists Collection objects, later versions list names
+    names = [c if isinstance(c, str) else c.name for c in client.list_collections()]
+    kept = []
+    removed = 0
+    for name in names:
+        if not name.startswith(COLLECTION_PREFIX):
+            continue
+        with _collection_lock(name):
+            collection = client.get_collection(name, embedding_function=None)
+            updated = (collection.metadata or {}).get("updated_at", 0)
+            if updated < cutoff:
+                client.delete_collection(name)
+                removed += 1
+                continue
+            collection.delete(where={"last_seen": {"$lt": cutoff}})
+        kept.append((updated, name, lambda name=name: client.delete_collection(name)))
+    return removed, kept
+
+
+def _cleanup_numpy(cutoff):
+    from VectorIndex import NumpyIndex
+
+    names = os.listdir(NUMPY_DIR) if os.path.isdir(NUMPY_DIR) else []
+    kept = []
+    removed = 0
+    for name in names:
+        path = os.path.join(NUMPY_DIR, name)
+        with _collection_lock(name):
+            updated = 0
+            if NumpyIndex.exists(path):
+                try:
+                    updated = NumpyIndex.load(path, None).attributes.get("updated_at", 0)
+                except (OSError, ValueError) as e:
+                    print(f"Dropping unreadable RAG index {path}: {e}")
+            if updated < cutoff:
+                shutil.rmtree(path, ignore_errors=True)
+                removed += 1
+                continue
+        kept.append((updated, name, lambda path=path: shutil.rmtree(path, ignore_errors=True)))
+    return removed, kept
+
+
+def cleanup_collections(now=None, backend=None):
+    """Drop expired chunks and tickers, and the oldest tickers beyond RAG_MAX_COLLECTIONS."""
+    now = now or time.time()
+    cutoff = now - RAG_RETENTION_DAYS * 24 * 60 * 60
+    cleanup = _cleanup_numpy if (backend or RAG_BACKEND) == "numpy" else _cleanup_chroma
+    removed, kept = cleanup(cutoff)
+    for _, name, delete in sorted(kept, key=lambda k: k[0])[:max(0, len(kept) - RAG_MAX_COLLECTIONS)]:
+        with _collection_lock(name):
+            delete()
+        removed += 1
+    return removed
+
+
+def _maybe_cleanup():
+    with _cleanup_lock:
+        if time.time() - _cleanup["last"] < RAG_CLEANUP_INTERVAL:
+            return
+        _cleanup["last"] = time.time()
+    try:
+        removed = cleanup_collections()
+        if removed:
+            print(f"RAG cleanup removed {removed} collections")
+    except Exception as e:
+        print(f"RAG cleanup failed: {e}")
+
+
+def _index_chroma(name, ticker, chunks, metadata, now):
+    from EmbeddingService import get_embedding_service
+
+    collection = get_chroma_client().get_or_create_collection(name, embedding_function=None)
+    existing = collection.get(ids=list(chunks), include=["metadatas"])
+    seen = dict(zip(existing["ids"], existing["metadatas"]))
+    if seen:
+        collection.update(ids=list(seen), metadatas=[{**(m or {}), "last_seen": now} for m in seen.values()])
+
+    new_ids = [i for i in chunks if i not in seen]
+    if new_ids:
+        texts = [chunks[i][1] for i in new_ids]
+        collection.add(
+            ids=new_ids,
+            documents=texts,
+            embeddings=get_embedding_service().embed_documents(texts),
+            metadatas=[metadata(i) for i in new_ids],
+        )
+    collection.modify(metadata={"ticker": ticker, "updated_at": now})
+    return len(new_ids)
+
+
+def _index_numpy(name, ticker, chunks, metadata, now):
+    from EmbeddingService import get_embedding_service
+    from VectorIndex import NumpyIndex
+
+    path = os.path.join(NUMPY_DIR, name)
+    service = get_embedding_service()
+    index = NumpyIndex.load(path, service) if NumpyIndex.exists(path) else NumpyIndex(service)
+    for row, i in enumerate(index.ids):
+        if i in chunks:
+            index.metadatas[row]["last_seen"] = now
+    cutoff = now - RAG_RETENTION_DAYS * 24 * 60 * 60
+    index.keep([m.get("last_seen", 0) >= cutoff for m in index.metadatas])
+
+    known = set(index.ids)
+    new_ids = [i for i in chunks if i not in known]
+    index.add_texts([chunks[i][1] for i in new_ids], metadatas=[metadata(i) for i in new_ids], ids=new_ids)
+    index.attributes = {"ticker": ticker, "updated_at": now}
+    index.save(path)
+    return len(new_ids)
+
+
+def index_analysis(stock, analysis_text, backend=None):
+    """Upsert a report's chunks into the ticker's collection; only new chunks are embedded.
+
+    Chunk ids are content hashes, so a chunk an earlier analysis already produced is
+    just marked as seen again. Returns the number of chunks embedded.
+    """
+    ticker = str(stock).strip().upper()
+    name = collection_name(ticker)
+    now = time.time()
+    chunks = {}
+    for position, text in enumerate(chunk_text(analysis_text)):
+        chunks.setdefault(chunk_id(text), (position, text))
+    if not chunks:
+        return 0
+
+    def metadata(i):
+        return {"source": f"{ticker} analysis {time.strftime('%Y-%m-%d %H:%M', time.localtime(now))}",
+                "ticker": ticker, "chunk_id": chunks[i][0], "analysed_at": now, "last_seen": now}
+
+    index = _index_numpy if (backend or RAG_BACKEND) == "numpy" else _index_chroma
+    with _collection_lock(name):
+        return index(name, ticker, chunks, metadata, now)
+
+
+def open_vectordb(stock, backend=None):
+    """The ticker's collection as a LangChain vector store, covering every retained analysis."""
+    from EmbeddingService import get_embedding_service
+
+    if (backend or RAG_BACKEND) == "numpy":
+        from VectorIndex import NumpyIndex
+
+        path = numpy_index_path(stock)
+        with _collection_lock(collection_name(stock)):
+            if not NumpyIndex.exists(path):
+                return NumpyIndex(get_embedding_service())
+            return NumpyIndex.load(path, get_embedding_service())
+
+    from langchain.vectorstores import Chroma
+
+    return Chroma(
+        client=get_chroma_client(),
+        collection_name=collection_name(stock),
+        embedding_function=get_embedding_service(),
+    )
+
+
+def setup_rag_system(analysis_text, stock):
+    """Setup RAG system with the analysis results; raises if the report can't be indexed.
+
+    Runs on the job threads, so errors go back to the caller instead of to the page.
+    """
+    added = index_analysis(stock, analysis_text)
+    print(f"RAG index for {stock}: {added} new chunks embedded")
+    _maybe_cleanup()
+    return open_vectordb(stock)
+
+
+def build_qa_engine(stock, vectordb):
+    """The Q&A engine for a ticker's store; built once per analysis and reused for every question."""
+    from QAEngine import QAEngine
+
+    try:
+        return QAEngine(stock, vectordb)
+    except Exception as e:
+        print(f"Error building Q&A engine: {e}")
+        return None
+
+
+def query_rag_system(engine, query):
+    """Query the RAG system; raises on a missing API key or a failed query."""
+    if not os.getenv("OPEN_AI_KEY"):
+        raise RuntimeError("OpenAI API key not found. Please set OPEN_AI_KEY in your environment variables.")
+    return engine.answer(query)
@@ -0,0 +1,270 @@
+import asyncio
+import os
+import random
+import threading
+import time
+from collections import defaultdict
+from email.utils import parsedate_to_datetime
+
+from Tracing import record
+
+# Requests and tokens per minute allowed by each provider's plan; override with
+# RATE_LIMIT_<PROVIDER>_RPM / RATE_LIMIT_<PROVIDER>_TPM. None means unlimited.
+DEFAULT_QUOTAS = {
+    "serper": {"rpm": 300, "tpm": None},
+    "scrape": {"rpm": 120, "tpm": None},
+    "gnews": {"rpm": 60, "tpm": None},
+    "reddit": {"rpm": 100, "tpm": None},
+    "groq": {"rpm": 30, "tpm": 6000},
+    "gemini": {"rpm": 15, "tpm": 1000000},
+    "openai": {"rpm": 500, "tpm": 30000},
+}
+
+MAX_RETRIES = int(os.getenv("RATE_LIMIT_MAX_RETRIES", "4"))
+BACKOFF_BASE = float(os.getenv("RATE_LIMIT_BACKOFF_BASE", "1.0"))
+BACKOFF_MAX = float(os.getenv("RATE_LIMIT_BACKOFF_MAX", "60"))
+# Calls in a row that failed on every retry before a breaker opens
+BREAKER_FAILURES = int(os.getenv("CIRCUIT_BREAKER_FAILURES", "5"))
+BREAKER_RESET = float(os.getenv("CIRCUIT_BREAKER_RESET", "30"))
+
+RETRYABLE_STATUS = {408, 425, 429, 500, 502, 503, 504}
+
+
+class CircuitOpenError(Exception):
+    pass
+
+
+def _quota(provider, kind):
+    env = os.getenv(f"RATE_LIMIT_{provider.upper()}_{kind.upper()}")
+    if env is not None:
+        return float(env) or None
+    return DEFAULT_QUOTAS.get(provider, {}).get(kind)
+
+
+def status_of(error):
+    """HTTP status carried by an exception from httpx, requests, urllib, openai/groq or google clients."""
+    for attr in ("status_code", "status", "code"):
+        value = getattr(error, attr, None)
+        if isinstance(value, int):
+            return value
+    response = getattr(error, "response", None)
+    for attr in ("status_code", "status"):
+        value = getattr(response, attr, None)
+        if isinstance(value, int):
+            return value
+    return None
+
+
+def retry_after(error):
+    """Seconds the provider asked us to wait, from a Retry-After header if there is one."""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or getattr(error, "headers", None)
+    value = headers.get("retry-after") if headers else None
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        try:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return None
+
+
+def is_retryable(error):
+    status = status_of(error)
+    if status is not None:
+        return status in RETRYABLE_STATUS
+    return isinstance(error, (TimeoutError, ConnectionError)) or "timeout" in type(error).__name__.lower()
+
+
+class TokenBucket:
+    def __init__(self, per_minute):
+        self.capacity = per_minute
+        self.rate = per_minute / 60.0
+        self.tokens = per_minute
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, amount=1):
+        """Take `amount` tokens and return how long the caller must wait before using them."""
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= min(amount, self.capacity)
+            return max(0.0, -self.tokens / self.rate)
+
+
+class CircuitBreaker:
+    def __init__(self, failures=BREAKER_FAILURES, reset_after=BREAKER_RESET):
+        self.failures = failures
+        self.reset_after = reset_after
+        self.consecutive = 0
+        self.opened_at = None
+        self._lock = threading.Lock()
+
+    def check(self):
+        with self._lock:
+            if self.opened_at is None:
+                return
+            if time.monotonic() - self.opened_at >= self.reset_after:
+                # Half-open: let the next call through and see if the provider recovered
+                self.opened_at = None
+                self.consecutive = self.failures - 1
+                return
+        raise CircuitOpenError("circuit open after repeated failures")
+
+    def success(self):
+        with self._lock:
+            self.consecutive = 0
+            self.opened_at = None
+
+    def failure(self):
+        with self._lock:
+            self.consecutive += 1
+            if self.consecutive >= self.failures:
+                self.opened_at = time.monotonic()
+                return True
+            return False
+
+
+class ProviderLimiter:
+    def __init__(self, provider):
+        self.provider = provider
+        rpm, tpm = _quota(provider, "rpm"), _quota(provider, "tpm")
+        self.requests = TokenBucket(rpm) if rpm else None
+        self.tokens = TokenBucket(tpm) if tpm else None
+        self.breaker = CircuitBreaker()
+        # Breakers of their own for calls given a breaker_key, e.g. one per scraped host, so
+        # failures of one site don't shut out the others
+        self._breakers = {}
+        self._breakers_lock = threading.Lock()
+        self.counters = defaultdict(float)
+
+    def breaker_for(self, key=None):
+        if key is None:
+            return self.breaker
+        with self._breakers_lock:
+            if key not in self._breakers:
+                self._breakers[key] = CircuitBreaker()
+            return self._breakers[key]
+
+    def circuit_open(self):
+        with self._breakers_lock:
+            breakers = [self.breaker, *self._breakers.values()]
+        return any(breaker.opened_at is not None for breaker in breakers)
+
+    def _reserve(self, tokens):
+        wait = self.requests.reserve() if self.requests else 0.0
+        if self.tokens and tokens:
+            wait = max(wait, self.tokens.reserve(tokens))
+        self.counters["calls"] += 1
+        if wait:
+            self.counters["throttled"] += 1
+            self.counters["throttle_wait_s"] += wait
+            record(wait_s=wait)
+        return wait
+
+    def _backoff(self, error, attempt):
+        status = status_of(error)
+        if status == 429:
+            self.counters["rate_limited"] += 1
+        delay = retry_after(error)
+        if delay is None:
+            delay = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt) * random.uniform(0.5, 1.5)
+        self.counters["retries"] += 1
+        self.counters["backoff_wait_s"] += delay
+        record(wait_s=delay, retries=1)
+        return delay
+
+    def _failed(self, error, breaker_key=None):
+        """Record a failed attempt and return whether it is worth retrying."""
+        if not is_retryable(error):
+            # The provider answered (e.g. 404 for a page), so this says nothing about its health
+            self.counters["errors"] += 1
+            self.breaker_for(breaker_key).success()
+            return False
+        self.counters["failures"] += 1
+        return True
+
+    def _gave_up(self, error, breaker_key=None):
+        """Count a call that failed on every attempt as one failure of its breaker."""
+        breaker = self.breaker_for(breaker_key)
+        if breaker.failure():
+            self.counters["circuit_opened"] += 1
+            name = f"{self.provider} ({breaker_key})" if breaker_key else self.provider
+            print(f"[rate limit] {name}: circuit opened after {breaker.failures} failed calls ({error})")
+
+    def _check(self, breaker_key=None):
+        try:
+            self.breaker_for(breaker_key).check()
+        except CircuitOpenError as e:
+            self.counters["rejected"] += 1
+            name = f"{self.provider} ({breaker_key})" if breaker_key else self.provider
+            raise CircuitOpenError(f"{name}: {e}") from None
+
+    def call(self, fn, *args, tokens=0, breaker_key=None, **kwargs):
+        for attempt in range(MAX_RETRIES + 1):
+            self._check(breaker_key)
+            time.sleep(self._reserve(tokens))
+            try:
+                result = fn(*args, **kwargs)
+            except Exception as e:
+                if not self._failed(e, breaker_key):
+                    raise
+                if attempt == MAX_RETRIES:
+                    self._gave_up(e, breaker_key)
+                    raise
+                time.sleep(self._backoff(e, attempt))
+                continue
+            self.breaker_for(breaker_key).success()
+            return result
+
+    async def acall(self, fn, *args, tokens=0, breaker_key=None, **kwargs):
+        for attempt in range(MAX_RETRIES + 1):
+            self._check(breaker_key)
+            await asyncio.sleep(self._reserve(tokens))
+            try:
+                result = await fn(*args, **kwargs)
+            except Exception as e:
+                if not self._failed(e, breaker_key):
+                    raise
+                if attempt == MAX_RETRIES:
+                    self._gave_up(e, breaker_key)
+                    raise
+                await asyncio.sleep(self._backoff(e, attempt))
+                continue
+            self.breaker_for(breaker_key).success()
+            return result
+
+    def acquire(self, tokens=0):
+        """Wait for a slot without retry handling, for calls that can't be wrapped (e.g. streams)."""
+        self._check()
+        time.sleep(self._reserve(tokens))
+
+    async def aacquire(self, tokens=0):
+        """Wait for a slot without retry handling, for calls that can't be wrapped (e.g. listings)."""
+        self._check()
+        await asyncio.sleep(self._reserve(tokens))
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def limiter(provider):
+    with _limiters_lock:
+        if provider not in _limiters:
+            _limiters[provider] = ProviderLimiter(provider)
+        return _limiters[provider]
+
+
+def limiter_stats():
+    with _limiters_lock:
+        return {name: dict(l.counters, circuit_open=l.circuit_open()) for name, l in _limiters.items()}
+
+
+def provider_rpm(provider):
+    rpm = _quota(provider, "rpm")
+    return int(rpm) if rpm else None
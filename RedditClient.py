@@ -0,0 +1,109 @@
+import heapq
+import os
+import tracemalloc
+from contextlib import contextmanager
+
+import asyncpraw
+from dotenv import load_dotenv
+
+from EventLoop import run_in_background, run_sync
+from RateLimiter import limiter
+from Tracing import span, carry
+from Cassette import cassette_reddit
+
+load_dotenv()
+
+MAX_REDDIT_CONCURRENCY = int(os.getenv("MAX_REDDIT_CONCURRENCY", "8"))
+COMMENT_TOP_K = int(os.getenv("COMMENT_TOP_K", "15"))
+COMMENT_MAX_DEPTH = int(os.getenv("COMMENT_MAX_DEPTH", "2"))
+COMMENT_MAX_CHARS = int(os.getenv("COMMENT_MAX_CHARS", "500"))
+# How many comments per submission to ask Reddit for, as a multiple of the top-k kept
+COMMENT_FETCH_FACTOR = 4
+
+_reddit = None
+
+
+def get_reddit():
+    """The process-wide asyncpraw client; only call from coroutines running on the background loop."""
+    global _reddit
+    if _reddit is None:
+        _reddit = cassette_reddit(lambda: asyncpraw.Reddit(
+            client_id=os.getenv("REDDIT_CLIENT_ID"),
+            client_secret=os.getenv("REDDIT_CLIENT_SECRET"),
+            user_agent="Arthya",
+        ))
+    return _reddit
+
+
+async def run_reddit(coro):
+    """Run `coro` on the loop that owns the shared client and await its result from any other loop."""
+    return await run_in_background(carry(coro))
+
+
+async def _close():
+    global _reddit
+    if _reddit is not None:
+        await _reddit.close()
+        _reddit = None
+
+
+def close_reddit():
+    run_sync(_close())
+
+
+async def load_bounded(submission, top_k=COMMENT_TOP_K):
+    """Load a submission with only its best-scored comments instead of the full tree."""
+    submission.comment_sort = "top"
+    submission.comment_limit = top_k * COMMENT_FETCH_FACTOR
+    with span("http", "reddit load", submission=submission.id):
+        await limiter("reddit").acall(submission.load)
+    await submission.comments.replace_more(limit=0)
+
+
+def top_comments(submission, top_k=COMMENT_TOP_K, max_depth=COMMENT_MAX_DEPTH, max_chars=COMMENT_MAX_CHARS):
+    """The `top_k` highest-scored comments down to `max_depth`, bodies cut to `max_chars`.
+
+    The tree is walked level by level and only the current heap is kept, so no full
+    comment list is ever built.
+    """
+    heap = []
+    seen = 0
+    level = list(submission.comments)
+    depth = 0
+    while level and depth <= max_depth:
+        next_level = []
+        for comment in level:
+            if isinstance(comment, asyncpraw.models.MoreComments):
+                continue
+            seen += 1
+            if len(heap) < top_k or comment.score > heap[0][0]:
+                item = (comment.score, seen, {
+                    "id": comment.id,
+                    "body": comment.body[:max_chars],
+                    "score": comment.score,
+                    "depth": depth,
+                })
+                if len(heap) < top_k:
+                    heapq.heappush(heap, item)
+                else:
+                    heapq.heapreplace(heap, item)
+            if depth < max_depth:
+                next_level.extend(comment.replies)
+        level = next_level
+        depth += 1
+    return [item for _, _, item in sorted(heap, key=lambda x: (-x[0], x[1]))]
+
+
+@contextmanager
+def peak_memory(label):
+    """Print the peak traced memory of the block when REPORT_PEAK_MEMORY is set."""
+    if not os.getenv("REPORT_PEAK_MEMORY") or tracemalloc.is_tracing():
+        yield
+        return
+    tracemalloc.start()
+    try:
+        yield
+    finally:
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print(f"[memory] {label}: peak {peak / 1024 / 1024:.1f} MiB")
@@ -1,13 +1,55 @@
 from crewai.tools import BaseTool
 import asyncio
-import asyncpraw
-import os
+import heapq
+import time
 from dotenv import load_dotenv
-from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain_core.prompts import PromptTemplate
+from LLMCache import CachedChain
+from LLMs import gemini_flash
+from Lazy import lazy
+from RedditStore import get_store
+from Dedup import story_index
+from RateLimiter import limiter
+from Tracing import span, traced_tool
+from RedditClient import get_reddit, run_reddit, load_bounded, top_comments, peak_memory, MAX_REDDIT_CONCURRENCY
 
 load_dotenv()
 
+DEFAULT_SUBREDDITS = ["indianstockmarket", "Wallstreetbets", "IndianStocks", "business"]
+
+prompt_template = PromptTemplate(
+    input_variables=["title", "top_comments"],
+    template="""
+You will be provided with a Reddit post, including its Title and a list of the Top Comments.
+
+Your task is to:
+- Analyze the text for any information about important global news, or news specifically related to the stock market, economic trends, trade, corporate actions, or major business developments.
+- If such news is present, extract and summarize the key facts in clear, concise points.
+- Clean the data to remove irrelevant content, slang, personal remarks, memes, or unrelated opinions. Focus only on factual and actionable information.
+
+Your output should be a formatted summary highlighting the significance of the detected news or event, especially as it relates to markets or global business.
+
+If there is no relevant news, respond with: "None"
+
+Title: {title}
+Top Comments: {top_comments}
+"""
+)
+
+@lazy
+def get_analysis_chain():
+    return CachedChain(prompt_template, gemini_flash())
+
+
+async def summarize(post):
+    top_comments_text = "\n".join([comment['body'] for comment in post['top_comments']])
+    inputs = {
+        "title": post["title"],
+        "top_comments": top_comments_text
+    }
+    response = await get_analysis_chain().ainvoke(inputs)
+    return response.content.strip()
+
 
 class RedditNewsTool(BaseTool):
     name: str = "Market News Tool Reddit"
@@ -16,105 +58,158 @@ class RedditNewsTool(BaseTool):
         "and summarizes relevant economic/stock market updates."
     )
 
-    async def fetch_hot_posts_per_subreddit(self, reddit, subreddit_name, limit=30, upvote_min=200, top_n_comments=5):
-        subreddit = await reddit.subreddit(subreddit_name)
-        posts_content = []
-
-        async for submission in subreddit.hot(limit=limit):
+    async def hot_posts(self, reddit, subreddit_name, limit=30, upvote_min=200):
+        with span("http", "reddit hot", subreddit=subreddit_name):
+            subreddit = await reddit.subreddit(subreddit_name)
+            await limiter("reddit").aacquire()
+            submissions = [s async for s in subreddit.hot(limit=limit)]
+        for submission in submissions:
             is_meme = (submission.link_flair_text and "meme" in submission.link_flair_text.lower())
             if submission.score < upvote_min or is_meme:
                 continue
-            await submission.load()
-            await submission.comments.replace_more(limit=0)
-            top_comments = sorted(
-                [c for c in submission.comments if isinstance(c, asyncpraw.models.Comment)],
-                key=lambda x: x.score,
-                reverse=True
-            )[:top_n_comments]
-
-            posts_content.append({
-                "subreddit": subreddit.display_name,
+            yield submission
+
+    async def load_post(self, submission, subreddit_name, top_n_comments=5):
+        store = get_store()
+        scope = f"hot:{subreddit_name.lower()}"
+        if store.needs_fetch(submission):
+            await load_bounded(submission, top_k=top_n_comments)
+            store.save(scope, {
+                "subreddit": submission.subreddit.display_name,
                 "title": submission.title,
                 "selftext": submission.selftext,
                 "url": submission.url,
                 "id": submission.id,
                 "score": submission.score,
+                "num_comments": submission.num_comments,
                 "created_utc": submission.created_utc,
                 "flair": submission.link_flair_text,
-                "top_comments": [{"body": c.body, "score": c.score} for c in top_comments]
+                "comments": top_comments(submission, top_k=top_n_comments, max_depth=0)
             })
-
-        return posts_content
-
-    async def fetch_top_hot_posts(self, subreddits=None, per_sub_limit=30, upvote_min=200, top_n_comments=5, overall_top_n=10):
+        else:
+            store.update_listing(submission)
+
+        post = store.load(submission.id)
+        comments = sorted(post.pop("comments"), key=lambda x: x["score"] or 0, reverse=True)[:top_n_comments]
+        post["score"] = submission.score
+        post["top_comments"] = [{"body": c["body"], "score": c["score"]} for c in comments]
+        return post
+
+    async def stream_summaries(self, subreddits=None, per_sub_limit=30, upvote_min=200, top_n_comments=5, overall_top_n=10):
+        """Yield (post, summary) pairs as soon as each summary is ready.
+
+        A running top-N heap on listing scores decides which posts get loaded and summarized;
+        posts that are pushed out of the top N while still in flight are cancelled, but a
+        summary that already finished may be yielded before its post is pushed out.
+        """
         if subreddits is None:
-            subreddits = ["indianstockmarket", "Wallstreetbets", "IndianStocks", "business"]
-
-        reddit = asyncpraw.Reddit(
-            client_id=os.getenv("REDDIT_CLIENT_ID"),
-            client_secret=os.getenv("REDDIT_CLIENT_SECRET"),
-            user_agent="Arthya/1.0",
-        )
-
-        tasks = [
-            self.fetch_hot_posts_per_subreddit(
-                reddit, subreddit,
-                limit=per_sub_limit,
-                upvote_min=upvote_min,
-                top_n_comments=top_n_comments
-            )
-            for subreddit in subreddits
-        ]
-
-        all_results = await asyncio.gather(*tasks)
-        await reddit.close()
-
-        all_posts = [post for group in all_results for post in group]
-        return sorted(all_posts, key=lambda x: x['score'], reverse=True)[:overall_top_n]
+            subreddits = DEFAULT_SUBREDDITS
+
+        reddit = get_reddit()
+        semaphore = asyncio.Semaphore(MAX_REDDIT_CONCURRENCY)
+        queue = asyncio.Queue()
+        heap = []
+        tasks = {}
+        # The summary of each story being summarized in this run, which its crossposts wait on
+        claims = {}
+
+        async def process(submission, subreddit_name):
+            async with semaphore:
+                post = await self.load_post(submission, subreddit_name, top_n_comments)
+            story = post["story"] = story_index.add(f"reddit:{post['id']}", f"{post['title']} {post['selftext']}", source="reddit")
+            while story in claims:
+                claim = claims[story]
+                try:
+                    # Shielded, so this post being cancelled leaves the owner's summary running
+                    await asyncio.shield(claim)
+                except asyncio.CancelledError:
+                    if not claim.cancelled():
+                        raise
+                    # The owner was pushed out of the top N; this post may take the story over
+                    continue
+                # A crosspost of a story already summarized in this run
+                await queue.put((post, "None"))
+                return
+            claim = claims[story] = asyncio.get_running_loop().create_future()
+            # Reads the error, so one no crosspost waited on isn't reported as never retrieved
+            claim.add_done_callback(lambda f: f.cancelled() or f.exception())
+            try:
+                summary = await summarize(post)
+            except asyncio.CancelledError:
+                # Only a cancelled owner gives the story up, to a crosspost still waiting on it
+                del claims[story]
+                claim.cancel()
+                raise
+            except Exception as e:
+                claim.set_exception(e)
+                raise
+            claim.set_result(summary)
+            await queue.put((post, summary))
+
+        async def scan(subreddit_name):
+            async for submission in self.hot_posts(reddit, subreddit_name, per_sub_limit, upvote_min):
+                if submission.id in tasks:
+                    continue
+                if len(heap) < overall_top_n:
+                    heapq.heappush(heap, (submission.score, submission.id))
+                elif submission.score > heap[0][0]:
+                    _, evicted = heapq.heapreplace(heap, (submission.score, submission.id))
+                    tasks.pop(evicted).cancel()
+                else:
+                    # Can no longer make the cut, so it is never loaded
+                    continue
+                tasks[submission.id] = asyncio.create_task(process(submission, subreddit_name))
+
+        async def produce():
+            try:
+                # One subreddit failing, e.g. an open circuit, leaves the others' posts
+                scans = await asyncio.gather(*(scan(subreddit_name) for subreddit_name in subreddits), return_exceptions=True)
+                for subreddit_name, result in zip(subreddits, scans):
+                    if isinstance(result, Exception):
+                        print(f"[reddit news] r/{subreddit_name}: {result}")
+                await asyncio.gather(*tasks.values(), return_exceptions=True)
+            finally:
+                # Always end the stream, so the consumer below never waits forever
+                queue.put_nowait(None)
+
+        producer = asyncio.create_task(produce())
+        try:
+            while (item := await queue.get()) is not None:
+                yield item
+            # Raises whatever stopped the producer early
+            await producer
+        finally:
+            producer.cancel()
+            for task in tasks.values():
+                task.cancel()
+
+    async def collect_summaries(self, overall_top_n=10, **kwargs):
+        start = time.perf_counter()
+        first = None
+        results = []
+        async for post, summary in self.stream_summaries(overall_top_n=overall_top_n, **kwargs):
+            if first is None:
+                first = time.perf_counter() - start
+            results.append((post, summary))
+        total = time.perf_counter() - start
+        if first is not None:
+            print(f"[reddit news] first summary after {first:.1f}s, {len(results)} summaries in {total:.1f}s")
+
+        # Posts evicted after their summary finished score below everything that stayed in
+        results = sorted(results, key=lambda x: x[0]["score"], reverse=True)[:overall_top_n]
+        responses = []
+        for post, summary in results:
+            if summary == "None":
+                continue
+            reports = story_index.group_size(post["story"])
+            responses.append(summary if reports < 2 else f"{summary}\n(Reported in {reports} posts/articles)")
+        return responses, bool(results)
 
+    @traced_tool
     async def _run(self) -> list:
-        posts = await self.fetch_top_hot_posts()
-        if not posts:
+        with peak_memory("reddit news"):
+            responses, found = await run_reddit(self.collect_summaries())
+        if not found:
             return ["No relevant posts found."]
 
-        llm = ChatGoogleGenerativeAI(
-            google_api_key=os.getenv('GOOGLE_API_KEY'),
-            model='gemini-2.0-flash',
-            temperature=0,
-        )
-
-        prompt_template = PromptTemplate(
-            input_variables=["title", "top_comments"],
-            template="""
-You will be provided with a Reddit post, including its Title and a list of the Top Comments.
-
-Your task is to:
-- Analyze the text for any information about important global news, or news specifically related to the stock market, economic trends, trade, corporate actions, or major business developments.
-- If such news is present, extract and summarize the key facts in clear, concise points.
-- Clean the data to remove irrelevant content, slang, personal remarks, memes, or unrelated opinions. Focus only on factual and actionable information.
-
-Your output should be a formatted summary highlighting the significance of the detected news or event, especially as it relates to markets or global business.
-
-If there is no relevant news, respond with: "None"
-
-Title: {title}
-Top Comments: {top_comments}
-"""
-        )
-
-        analysis_chain = prompt_template | llm
-        responses = []
-
-        for post in posts:
-            top_comments_text = "\n".join([comment['body'] for comment in post['top_comments']])
-            inputs = {
-                "title": post["title"],
-                "top_comments": top_comments_text
-            }
-            response = await analysis_chain.ainvoke(inputs)
-            content = response.content.strip()
-            if content != "None":
-                responses.append(content)
-
         return responses or ["No significant global, stock market, or business news identified."]
-
@@ -0,0 +1,187 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from FetchCache import CACHE_DIR
+
+# Posts younger than this whose comment count moved since the last fetch get their tree refreshed
+ACTIVE_HOURS = float(os.getenv("REDDIT_ACTIVE_HOURS", "48"))
+# Never reload the same comment tree more often than this
+REFRESH_INTERVAL = float(os.getenv("REDDIT_REFRESH_INTERVAL", str(15 * 60)))
+
+
+def content_hash(post):
+    payload = json.dumps(
+        [post["title"], post.get("selftext", ""), [c["body"] for c in post["comments"]]],
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class RedditStore:
+    """Local copy of fetched submissions and comments, with per-listing created_utc watermarks."""
+
+    def __init__(self, path=None):
+        if path is None:
+            os.makedirs(CACHE_DIR, exist_ok=True)
+            path = os.path.join(CACHE_DIR, "reddit.sqlite")
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS submissions (
+                id TEXT PRIMARY KEY,
+                subreddit TEXT NOT NULL,
+                title TEXT NOT NULL,
+                selftext TEXT,
+                url TEXT,
+                score INTEGER,
+                num_comments INTEGER,
+                created_utc REAL,
+                flair TEXT,
+                comments_fetched_at REAL,
+                content_hash TEXT
+            );
+            CREATE TABLE IF NOT EXISTS comments (
+                id TEXT PRIMARY KEY,
+                submission_id TEXT NOT NULL,
+                body TEXT NOT NULL,
+                score INTEGER,
+                depth INTEGER
+            );
+            CREATE INDEX IF NOT EXISTS comments_submission ON comments(submission_id);
+            CREATE TABLE IF NOT EXISTS listings (
+                scope TEXT NOT NULL,
+                submission_id TEXT NOT NULL,
+                PRIMARY KEY (scope, submission_id)
+            );
+            CREATE TABLE IF NOT EXISTS watermarks (
+                scope TEXT PRIMARY KEY,
+                created_utc REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS verdicts (
+                submission_id TEXT NOT NULL,
+                content_hash TEXT NOT NULL,
+                verdict TEXT NOT NULL,
+                PRIMARY KEY (submission_id, content_hash)
+            );
+        """)
+        self._conn.commit()
+
+    def watermark(self, scope):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT created_utc FROM watermarks WHERE scope = ?", (scope,)
+            ).fetchone()
+        return row[0] if row else 0.0
+
+    def needs_fetch(self, submission, now=None):
+        """Whether a listed submission is new, or still active enough to reload its comments."""
+        now = now or time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT num_comments, comments_fetched_at FROM submissions WHERE id = ?",
+                (submission.id,),
+            ).fetchone()
+        if row is None:
+            return True
+        num_comments, fetched_at = row
+        if num_comments == submission.num_comments:
+            return False
+        is_active = now - submission.created_utc < ACTIVE_HOURS * 3600
+        return is_active and now - (fetched_at or 0) >= REFRESH_INTERVAL
+
+    def save(self, scope, post):
+        """Store a freshly fetched post dict (with a "comments" list of dicts) and advance the watermark."""
+        post["content_hash"] = content_hash(post)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO submissions (id, subreddit, title, selftext, url, score, "
+                "num_comments, created_utc, flair, comments_fetched_at, content_hash) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (post["id"], post["subreddit"], post["title"], post.get("selftext"), post.get("url"),
+                 post.get("score"), post.get("num_comments"), post.get("created_utc"), post.get("flair"),
+                 time.time(), post["content_hash"]),
+            )
+            self._conn.execute("DELETE FROM comments WHERE submission_id = ?", (post["id"],))
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO comments (id, submission_id, body, score, depth) VALUES (?, ?, ?, ?, ?)",
+                [(c["id"], post["id"], c["body"], c.get("score"), c.get("depth", 0)) for c in post["comments"]],
+            )
+            self._conn.execute(
+                "INSERT OR IGNORE INTO listings (scope, submission_id) VALUES (?, ?)", (scope, post["id"])
+            )
+            self._conn.execute(
+                "INSERT INTO watermarks (scope, created_utc) VALUES (?, ?) "
+                "ON CONFLICT(scope) DO UPDATE SET created_utc = MAX(created_utc, excluded.created_utc)",
+                (scope, post.get("created_utc") or 0.0),
+            )
+            self._conn.commit()
+
+    def update_listing(self, submission):
+        """Record the latest score of a listed submission that didn't need refetching."""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE submissions SET score = ? WHERE id = ?", (submission.score, submission.id)
+            )
+            self._conn.commit()
+
+    def load(self, submission_id):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT id, subreddit, title, selftext, url, score, num_comments, created_utc, flair, "
+                "content_hash FROM submissions WHERE id = ?",
+                (submission_id,),
+            ).fetchone()
+            if row is None:
+                return None
+            comments = self._conn.execute(
+                "SELECT id, body, score, depth FROM comments WHERE submission_id = ? ORDER BY rowid",
+                (submission_id,),
+            ).fetchall()
+        keys = ("id", "subreddit", "title", "selftext", "url", "score", "num_comments", "created_utc",
+                "flair", "content_hash")
+        post = dict(zip(keys, row))
+        post["comments"] = [{"id": c[0], "body": c[1], "score": c[2], "depth": c[3]} for c in comments]
+        return post
+
+    def recent(self, scope, limit):
+        """The newest `limit` stored posts seen in a listing."""
+        with self._lock:
+            ids = [row[0] for row in self._conn.execute(
+                "SELECT s.id FROM submissions s JOIN listings l ON l.submission_id = s.id "
+                "WHERE l.scope = ? ORDER BY s.created_utc DESC LIMIT ?",
+                (scope, limit),
+            )]
+        return [self.load(submission_id) for submission_id in ids]
+
+    def verdict(self, submission_id, post_hash):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT verdict FROM verdicts WHERE submission_id = ? AND content_hash = ?",
+                (submission_id, post_hash),
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def save_verdict(self, submission_id, post_hash, verdict):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO verdicts (submission_id, content_hash, verdict) VALUES (?, ?, ?)",
+                (submission_id, post_hash, json.dumps(verdict)),
+            )
+            self._conn.commit()
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = RedditStore()
+        return _store
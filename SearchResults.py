@@ -0,0 +1,125 @@
+import json
+import os
+import re
+from urllib.parse import unquote_plus, urlsplit, urlunsplit
+
+TRACKING_PARAMS = {
+    "gclid", "fbclid", "msclkid", "dclid", "yclid", "mc_cid", "mc_eid",
+    "igshid", "ref_src", "cmpid", "ncid", "ocid", "_ga", "_gl",
+}
+TRACKING_PREFIXES = ("utm_",)
+
+DEFAULT_BLOCKLIST = [
+    "youtube.com", "facebook.com", "instagram.com", "twitter.com", "x.com",
+    "tiktok.com", "pinterest.com", "linkedin.com",
+]
+
+# Result lists a Serper response (raw or as processed by SerperDevTool) can contain
+RESULT_KEYS = ("organic", "news", "topStories")
+
+_TEXT_RESULT = re.compile(
+    r"Title:\s*(?P<title>.*?)\s*\n\s*Link:\s*(?P<link>\S+)\s*(?:\n\s*Snippet:\s*(?P<snippet>.*?))?\s*(?:\n---|$)",
+    re.S,
+)
+
+
+def domain_blocklist():
+    env = os.getenv("SEARCH_DOMAIN_BLOCKLIST")
+    if env is None:
+        return list(DEFAULT_BLOCKLIST)
+    return [d.strip().lower() for d in env.split(",") if d.strip()]
+
+
+def is_tracking_param(segment):
+    key = unquote_plus(segment.split("=", 1)[0]).lower()
+    return key in TRACKING_PARAMS or key.startswith(TRACKING_PREFIXES)
+
+
+def normalize_url(url):
+    url = url.strip()
+    parts = urlsplit(url)
+    if parts.scheme not in ("http", "https") or not parts.netloc:
+        return None
+
+    host = parts.netloc.lower()
+    if host.endswith(":80") and parts.scheme == "http":
+        host = host[:-3]
+    if host.endswith(":443") and parts.scheme == "https":
+        host = host[:-4]
+
+    # The path and the other parameters are kept exactly as written; changing them can change the page
+    query = "&".join(segment for segment in parts.query.split("&") if segment and not is_tracking_param(segment))
+    return urlunsplit((parts.scheme.lower(), host, parts.path or "/", query, ""))
+
+
+def dedup_key(link):
+    """What two normalized links must share to count as the same page: scheme, "www." and a trailing slash aside."""
+    parts = urlsplit(link)
+    host = parts.netloc[4:] if parts.netloc.startswith("www.") else parts.netloc
+    return host, parts.path.rstrip("/") or "/", parts.query
+
+
+def is_blocked(url, blocklist):
+    host = urlsplit(url).hostname or ""
+    if host.startswith("www."):
+        host = host[4:]
+    return any(host == d or host.endswith("." + d) for d in blocklist)
+
+
+def _results_from_dict(data):
+    results = []
+    for key in RESULT_KEYS:
+        for item in data.get(key) or []:
+            link = item.get("link") or item.get("url")
+            if link:
+                results.append({
+                    "link": link,
+                    "title": item.get("title", ""),
+                    "snippet": item.get("snippet") or item.get("description", ""),
+                })
+    return results
+
+
+def parse_search_results(data):
+    """Read link, title and snippet of every result in a SerperDevTool response."""
+    if isinstance(data, dict):
+        return _results_from_dict(data)
+    if not isinstance(data, str):
+        data = str(data)
+
+    try:
+        parsed = json.loads(data)
+        if isinstance(parsed, dict):
+            return _results_from_dict(parsed)
+    except ValueError:
+        pass
+
+    return [
+        {
+            "link": m.group("link"),
+            "title": m.group("title").strip(),
+            "snippet": (m.group("snippet") or "").strip(),
+        }
+        for m in _TEXT_RESULT.finditer(data)
+    ]
+
+
+def extract_results(data, blocklist=None, max_results=None):
+    """Parsed results with normalized, deduped links and blocklisted domains dropped."""
+    if blocklist is None:
+        blocklist = domain_blocklist()
+
+    seen = set()
+    results = []
+    for result in parse_search_results(data):
+        link = normalize_url(result["link"])
+        if not link or is_blocked(link, blocklist):
+            continue
+        key = dedup_key(link)
+        if key in seen:
+            continue
+        seen.add(key)
+        results.append({**result, "link": link})
+        if max_results and len(results) >= max_results:
+            break
+    return results
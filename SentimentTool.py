@@ -1,11 +1,148 @@
 import asyncio
-import asyncpraw
-from langchain_groq import ChatGroq
-from langchain_core.runnables import RunnableLambda
+from RedditClient import get_reddit, run_reddit, load_bounded, top_comments, peak_memory, MAX_REDDIT_CONCURRENCY
+from RedditStore import get_store, ACTIVE_HOURS
 from langchain_core.prompts import PromptTemplate
 from crewai.tools import BaseTool
+from LLMCache import CachedChain
+from LLMs import groq_llm
+from Lazy import lazy
+from Dedup import dedupe
+from RateLimiter import limiter
+from Prefetch import awarm_result
+from Tracing import span, traced_tool
 from dotenv import load_dotenv
+import json
 import os
+import re
+import numpy as np
+
+SENTIMENT_BATCH_SIZE = int(os.getenv("SENTIMENT_BATCH_SIZE", "5"))
+SENTIMENT_LLM_CONCURRENCY = int(os.getenv("SENTIMENT_LLM_CONCURRENCY", "4"))
+SENTIMENT_LABELS = ("Positive", "Negative", "Neutral")
+SENTIMENT_POST_LIMIT = int(os.getenv("SENTIMENT_POST_LIMIT", "20"))
+# Posts the local scorer is less sure about than this are sent to the LLM
+ESCALATION_THRESHOLD = float(os.getenv("SENTIMENT_ESCALATION_THRESHOLD", "0.6"))
+MAX_LLM_POSTS = int(os.getenv("SENTIMENT_MAX_LLM_POSTS", "15"))
+
+FINANCE_LEXICON = {
+  "moon": 2.0, "mooning": 2.0, "rocket": 1.5, "bullish": 2.0, "bull": 1.0, "buy": 1.0, "buying": 1.0,
+  "bought": 0.8, "accumulate": 1.5, "accumulating": 1.5, "long": 0.5, "calls": 0.8, "rally": 1.5,
+  "breakout": 1.5, "upside": 1.2, "undervalued": 1.5, "beat": 1.2, "beats": 1.2, "strong": 1.0,
+  "growth": 0.8, "profit": 0.8, "profits": 0.8, "gain": 1.0, "gains": 1.0, "green": 0.8, "up": 0.4,
+  "outperform": 1.5, "upgrade": 1.5, "upgraded": 1.5, "multibagger": 2.0, "hold": 0.3, "holding": 0.3,
+  "dividend": 0.5, "record": 0.8, "ath": 1.5, "solid": 0.8, "good": 0.6, "great": 1.0, "love": 1.0,
+  "bearish": -2.0, "bear": -1.0, "sell": -1.0, "selling": -1.0, "sold": -0.8, "dump": -2.0,
+  "dumping": -2.0, "dumped": -1.5, "crash": -2.0, "crashing": -2.0, "short": -0.8, "puts": -0.8,
+  "overvalued": -1.5, "miss": -1.2, "missed": -1.2, "weak": -1.0, "loss": -1.0, "losses": -1.0,
+  "red": -0.8, "down": -0.4, "downgrade": -1.5, "downgraded": -1.5, "fraud": -2.5, "scam": -2.5,
+  "bagholder": -1.5, "bagholding": -1.5, "exit": -0.8, "avoid": -1.5, "risky": -1.0, "debt": -0.5,
+  "falling": -1.0, "fall": -0.8, "plunge": -2.0, "plunged": -2.0, "tank": -1.5, "tanking": -1.8,
+  "worst": -1.5, "bad": -0.6, "terrible": -1.5, "underperform": -1.5, "bubble": -1.2, "rip": -1.0,
+}
+NEGATORS = {"not", "no", "never", "dont", "don't", "isnt", "isn't", "wont", "won't", "cant", "can't"}
+
+_LEXICON_TERMS = list(FINANCE_LEXICON)
+_LEXICON_INDEX = {term: i for i, term in enumerate(_LEXICON_TERMS)}
+_LEXICON_WEIGHTS = np.array([FINANCE_LEXICON[t] for t in _LEXICON_TERMS], dtype=np.float64)
+_TOKEN = re.compile(r"[a-z']+")
+# "Is X going to crash?" names a worry, not a stance; the lexicon can't tell the two apart
+_QUESTION = re.compile(
+  r"\?\s*$|^\s*(?:is|are|will|would|should|can|could|does|do|did|what|why|how|when|which|anyone)\b", re.IGNORECASE,
+)
+
+prompt_template = PromptTemplate(
+  input_variables=["posts"],
+  template="""
+    You are a financial analyst AI. You'll be given several Reddit posts about stocks, each with an id, a title and top comments.
+    Analyze the sentiment of each post and its comments to determine the overall market sentiment toward the stock.
+
+    ---
+    {posts}
+    ---
+    Return only a JSON array with one object per post, in this format and with no other text:
+    [{{"id": "<post id>", "stocks": ["<detected stock name(s)>"], "sentiment": "<Positive / Negative / Neutral>", "justification": "<Why you think this is the sentiment>"}}]
+    """
+)
+
+@lazy
+def get_analysis_chain():
+  return CachedChain(prompt_template, groq_llm())
+
+
+def local_scores(posts):
+  """Lexicon sentiment for every post and its comments, in one vectorized pass.
+
+  Returns (score, confidence) arrays with one entry per post. The post text counts twice
+  as much as any single comment.
+  """
+  term_ids, doc_ids, signs, doc_weights, doc_posts = [], [], [], [], []
+  doc = 0
+  for p, post in enumerate(posts):
+    texts = [(f"{post['title']} {post.get('selftext', '')}", 2.0)] + [(c, 1.0) for c in post["comments"]]
+    for text, weight in texts:
+      negate = False
+      for token in _TOKEN.findall(text.lower()):
+        i = _LEXICON_INDEX.get(token)
+        if i is not None:
+          term_ids.append(i)
+          doc_ids.append(doc)
+          signs.append(-1.0 if negate else 1.0)
+        negate = token in NEGATORS
+      doc_weights.append(weight)
+      doc_posts.append(p)
+      doc += 1
+
+  n_posts = len(posts)
+  if not term_ids:
+    return np.zeros(n_posts), np.zeros(n_posts)
+
+  contributions = _LEXICON_WEIGHTS[np.array(term_ids)] * np.array(signs)
+  doc_ids = np.array(doc_ids)
+  positive = np.bincount(doc_ids, weights=np.clip(contributions, 0, None), minlength=doc)
+  negative = np.bincount(doc_ids, weights=np.clip(-contributions, 0, None), minlength=doc)
+
+  doc_weights = np.array(doc_weights)
+  doc_posts = np.array(doc_posts)
+  positive = np.bincount(doc_posts, weights=positive * doc_weights, minlength=n_posts)
+  negative = np.bincount(doc_posts, weights=negative * doc_weights, minlength=n_posts)
+
+  score = positive - negative
+  confidence = np.abs(score) / (positive + negative + 1.0)
+  return score, confidence
+
+
+def is_question(post):
+  return bool(_QUESTION.search(post["title"]))
+
+
+def format_posts(posts):
+  return "\n\n".join(
+    f"id: {post['id']}\n**Title:** {post['title']}\n**Top Comments:**\n" + "\n".join(post["comments"][:15])
+    for post in posts
+  )
+
+
+def parse_verdicts(posts, content):
+  match = re.search(r"\[.*\]", content, re.S)
+  try:
+    items = json.loads(match.group(0)) if match else []
+  except ValueError:
+    items = []
+  by_id = {str(item.get("id")): item for item in items if isinstance(item, dict)}
+
+  verdicts = []
+  for post in posts:
+    item = by_id.get(post["id"], {})
+    sentiment = str(item.get("sentiment", "")).capitalize()
+    verdicts.append({
+      "id": post["id"],
+      "subreddit": post["subreddit"],
+      "title": post["title"],
+      "stocks": item.get("stocks", []),
+      "sentiment": sentiment if sentiment in SENTIMENT_LABELS else "Unknown",
+      "justification": item.get("justification", "Model output could not be parsed for this post."),
+    })
+  return verdicts
 
 class MarketSentimentTool(BaseTool):
   name: str = "Market sentiment analyser Tool"
@@ -16,69 +153,126 @@ class MarketSentimentTool(BaseTool):
 
   )
   
-  async def fetch_posts(self, stock, subreddit_list, limit=20):
-      reddit = asyncpraw.Reddit(
-          client_id=os.getenv("REDDIT_CLIENT_ID"),
-          client_secret=os.getenv("REDDIT_CLIENT_SECRET"),
-          user_agent="Arthya",
-      )
-      all_posts = []
-      for subreddit_name in subreddit_list:
-          subreddit = await reddit.subreddit(subreddit_name)
-          async for submission in subreddit.search(stock, sort="new", limit=limit):
-              post_data = {
-                  "subreddit": subreddit_name,
-                  "title": submission.title,
-                  "selftext": submission.selftext,
-                  "url": submission.url,
-                  "id": submission.id,
-                  "comments": []
-              }
-              await submission.load()
-              await submission.comments.replace_more(limit=0)
-              for comment in submission.comments.list():
-                  post_data["comments"].append(comment.body)
-              all_posts.append(post_data)
-      await reddit.close()
-      return all_posts
+  async def fetch_submission(self, submission, subreddit_name, semaphore):
+      async with semaphore:
+          await load_bounded(submission)
+      return {
+          "subreddit": subreddit_name,
+          "title": submission.title,
+          "selftext": submission.selftext,
+          "url": submission.url,
+          "id": submission.id,
+          "score": submission.score,
+          "num_comments": submission.num_comments,
+          "created_utc": submission.created_utc,
+          "comments": top_comments(submission)
+      }
 
-  async def _run(self, stock:str):
+  async def fetch_subreddit(self, reddit, stock, subreddit_name, limit, semaphore):
+      store = get_store()
+      scope = f"search:{subreddit_name.lower()}:{stock.lower()}"
+      # Listings are sorted new, so past the watermark minus the activity window nothing can have changed
+      settled_before = store.watermark(scope) - ACTIVE_HOURS * 3600
+      async with semaphore:
+          with span("http", "reddit search", subreddit=subreddit_name, query=stock):
+              subreddit = await reddit.subreddit(subreddit_name)
+              await limiter("reddit").aacquire()
+              submissions = []
+              async for s in subreddit.search(stock, sort="new", limit=limit):
+                  if s.created_utc < settled_before:
+                      break
+                  submissions.append(s)
+
+      to_fetch = []
+      for submission in submissions:
+          if store.needs_fetch(submission):
+              to_fetch.append(submission)
+          else:
+              store.update_listing(submission)
+      fetched = await asyncio.gather(*[
+          self.fetch_submission(submission, subreddit_name, semaphore)
+          for submission in to_fetch
+      ])
+      for post in fetched:
+          store.save(scope, post)
+
+      posts = store.recent(scope, limit)
+      for post in posts:
+          post["comments"] = [c["body"] for c in post["comments"]]
+      return posts
 
-    x = await self.fetch_posts(stock, ["IndianStockMarket", "IndiaInvestments"], limit=20)
-    llm = ChatGroq(
-      groq_api_key = os.environ['GROQ_API_KEY'],
-      model = 'llama-3.1-8b-instant'
+  async def _fetch_posts(self, stock, subreddit_list, limit, max_concurrency):
+      reddit = get_reddit()
+      semaphore = asyncio.Semaphore(max_concurrency)
+      results = await asyncio.gather(*[
+          self.fetch_subreddit(reddit, stock, subreddit_name, limit, semaphore)
+          for subreddit_name in subreddit_list
+      ])
+      return [post for group in results for post in group]
+
+  async def fetch_posts(self, stock, subreddit_list, limit=20, max_concurrency=MAX_REDDIT_CONCURRENCY):
+      return await run_reddit(self._fetch_posts(stock, subreddit_list, limit, max_concurrency))
+
+  async def score_posts(self, posts, batch_size=SENTIMENT_BATCH_SIZE, max_concurrency=SENTIMENT_LLM_CONCURRENCY):
+    batches = [posts[i:i + batch_size] for i in range(0, len(posts), batch_size)]
+    outputs = await get_analysis_chain().abatch(
+      [{"posts": format_posts(batch)} for batch in batches],
+      config={"max_concurrency": max_concurrency},
     )
-    prompt_template = PromptTemplate(
-      input_variables=["title", "top_comments"],
-      template="""
-        You are a financial analyst AI. You'll be given a Reddit post about a stock, including the title and top comments.
-        Analyze the sentiment of the post and comments to determine the overall market sentiment toward the stock.
-
-        ---
-        **Title:** {title}
-
-        **Top Comments:**
-        {top_comments}
-
-        ---
-        Return your response in this format:
-        - Detected Stock(s): <stock name(s)>
-        - Sentiment: <Positive / Negative / Neutral>
-        - Justification: <Why you think this is the sentiment>
-        """
-      )
-    analysis_chain = prompt_template | llm
-    responses = []
-    if len(x) > 15:
-      x = x[:15]
-    else:
-      x
-    for post in x:
-        inputs = {
-            "title": post["title"],
-            "top_comments": "\n".join(post["comments"][:15])
-        }
-        responses.append(analysis_chain.invoke(inputs).content)
-
-    return responses
\ No newline at end of file
+    verdicts = []
+    for batch, output in zip(batches, outputs):
+      verdicts.extend(parse_verdicts(batch, output.content))
+    return verdicts
+
+  @traced_tool
+  async def _run(self, stock:str):
+    warm = await awarm_result(self.name, stock)
+    if warm is not None:
+      return warm
+
+    with peak_memory(f"sentiment fetch {stock}"):
+      x = await self.fetch_posts(stock, ["IndianStockMarket", "IndiaInvestments"], limit=SENTIMENT_POST_LIMIT)
+    if not x:
+      return {"posts": [], "llm_escalation_rate": 0.0}
+    # Crossposts are scored once; their group size is kept as a popularity signal
+    x = dedupe(x, lambda post: f"{post['title']} {post.get('selftext', '')}", key=lambda post: post["id"])
+
+    score, confidence = local_scores(x)
+    verdicts = []
+    for post, post_score, post_confidence in zip(x, score, confidence):
+      verdicts.append({
+        "id": post["id"],
+        "subreddit": post["subreddit"],
+        "title": post["title"],
+        "stocks": [stock],
+        "sentiment": "Positive" if post_score > 0 else "Negative" if post_score < 0 else "Neutral",
+        "confidence": round(float(post_confidence), 3),
+        "justification": f"Finance lexicon score {post_score:+.1f}",
+        "source": "local",
+        "duplicates": post["duplicates"],
+      })
+
+    store = get_store()
+    # Questions go to the LLM first, however sure the lexicon is
+    priority = np.where([is_question(post) for post in x], 0.0, confidence)
+    ambiguous = [i for i in np.argsort(priority, kind="stable") if priority[i] < ESCALATION_THRESHOLD][:MAX_LLM_POSTS]
+    to_score = []
+    for i in ambiguous:
+      # Unchanged posts keep the LLM verdict from an earlier run
+      cached = store.verdict(x[i]["id"], x[i]["content_hash"])
+      if cached:
+        verdicts[i] = {**cached, "duplicates": x[i]["duplicates"]}
+      else:
+        to_score.append(i)
+    if to_score:
+      llm_verdicts = await self.score_posts([x[i] for i in to_score])
+      for i, verdict in zip(to_score, llm_verdicts):
+        if verdict["sentiment"] != "Unknown":
+          verdicts[i] = {**verdict, "confidence": None, "source": "llm", "duplicates": x[i]["duplicates"]}
+          store.save_verdict(x[i]["id"], x[i]["content_hash"], verdicts[i])
+
+    # Only the posts actually sent to the LLM; cached verdicts cost nothing
+    escalation_rate = len(to_score) / len(x)
+    print(f"[sentiment] {stock}: {len(x)} posts, {len(ambiguous) - len(to_score)} cached verdicts, "
+          f"llm escalation rate {escalation_rate:.0%}")
+    return {"posts": verdicts, "llm_escalation_rate": round(escalation_rate, 3)}
@@ -1,83 +1,110 @@
-from crewai import Task
-from Tools import web_scrape_tool, search_tool
-from Agents import Researcher, Analyst, DecisionAdvisor, Sentiment_analyser
+from Agents import get_analyst, get_decision_advisor, get_researcher, get_sentiment_analyser
+from Lazy import lazy
 
-research = Task(
-    description = (
-        "1. Prioritize gathering the latest news and major global events that could impact the {stock}, with special attention to US government actions and geopolitical conflicts.\n"
-        "2. Identify and specify the market segment or industry to which the {stock} belongs.\n"
-        "3. Collect recent financial data, earnings reports, and key performance indicators from reputable sources.\n"
-        "4. Use the Scrape and Search Tool to gather this information, ensuring that you only use it twice. If you cannot find global news, end the process and provide the data you have gathered."
-    ),
-    expected_output = (
-        "A well-organized summary containing:\n"
-        "- The most recent and relevant news headlines and global events affecting {stock}.\n"
-        "- The identified market segment or industry classification for {stock}.\n"
-        "- A table or list of up-to-date financial data, earnings reports, and key performance indicators.\n"
-        "- A brief analysis of current market sentiment, including highlights from news, social media, and expert opinions."
-    ),
-    name = "Research",
-    agent = Researcher,
-    
-)
+# Tasks are built on first use (e.g. `from Tasks import research`), together with their agents.
 
-sentiment_analysis = Task(
-    description = (
-        "1. Analyze the sentiment of the stock {stock} based on Reddit posts and comments.\n"
-        "2. Use the Market Sentiment Tool to fetch relevant posts from subreddits like r/stocks, r/investing, and r/wallstreetbets.\n"
-        "3. Summarize the overall market sentiment, highlighting major themes, positive and negative trends, and influential posts or users."
-    ),
-    expected_output = (
-        "A detailed sentiment analysis report that includes:\n"
-        "- Key themes and trends in market sentiment for {stock}.\n"
-        "- Positive and negative sentiment indicators with examples from Reddit posts.\n"
-        "- Influential users or posts that significantly impact sentiment.\n"
-        "- An actionable summary of how the online investment community views {stock}."
-    ),
-    name = "Sentiment Analysis",
-    agent = Sentiment_analyser,
-    context=(research,)
-)
 
-analysis = Task(
-    description = (
-        "1. Review the research summary, including news, financial data, and market sentiment for {stock}.\n"
-        "2. Perform fundamental analysis using financial indicators (e.g., P/E ratio, revenue growth, profit margins).\n"
-        "3. Conduct technical analysis by identifying recent stock price trends, support/resistance levels, and trading volume patterns.\n"
-        "4. Assess risks and opportunities based on both qualitative and quantitative findings."
-    ),
-    expected_output = (
-        "A comprehensive analysis report that includes:\n"
-        "- Key insights from fundamental and technical analysis of NVIDIA.\n"
-        "- Identification of major risks and potential opportunities.\n"
-        "- Visuals or tables summarizing important financial and technical metrics.\n"
-        "- A concise summary of overall stock outlook based on the analysis."
-    ),
-    name = "Analysis",
-    agent = Analyst,
-    context=(research, sentiment_analysis)
-)
+@lazy
+def get_research():
+    from crewai import Task
+    return Task(
+        description = (
+            "1. Prioritize gathering the latest news and major global events that could impact the {stock}, with special attention to US government actions and geopolitical conflicts.\n"
+            "2. Identify and specify the market segment or industry to which the {stock} belongs.\n"
+            "3. Collect recent financial data, earnings reports, and key performance indicators from reputable sources.\n"
+            "4. Use the Scrape and Search Tool to gather this information, ensuring that you only use it twice. If you cannot find global news, end the process and provide the data you have gathered."
+        ),
+        expected_output = (
+            "A well-organized summary containing:\n"
+            "- The most recent and relevant news headlines and global events affecting {stock}.\n"
+            "- The identified market segment or industry classification for {stock}.\n"
+            "- A table or list of up-to-date financial data, earnings reports, and key performance indicators.\n"
+            "- A brief analysis of current market sentiment, including highlights from news, social media, and expert opinions."
+        ),
+        name = "Research",
+        agent = get_researcher(),
+    )
 
 
-reporting = Task(
-    description = (
-        "1. Review the analysis report for {stock}, including all key findings and metrics.\n"
-        "2. Summarize the most important insights in clear, jargon-free language.\n"
-        "3. Provide actionable recommendations for investors, such as buy/hold/sell guidance, with supporting rationale.\n"
-        "4. Highlight any critical risks, uncertainties, or factors that could affect investment decisions."
-        "5. If it's a buy, say BUY, if it's a hold, say HOLD, if it's a sell, say SELL"
-        "6. Use quantitative metrics like Strong Buy, Buy, Hold, Sell, Strong Sell to indicate the strength of the recommendation."
-    ),
-    expected_output = (
-        "A concise investment report that includes:\n"
-        "- An executive summary of the stock’s outlook.\n"
-        "- Clear, actionable recommendations (e.g., buy, hold, sell) with supporting arguments.\n"
-        "- A summary of key risks and considerations for potential investors.\n"
-        "- Well-structured sections for easy reading and decision-making."
-    ),
-    name = "Reporting",
-    agent = DecisionAdvisor,
-    context= (research, analysis)
+@lazy
+def get_sentiment_analysis():
+    from crewai import Task
+    return Task(
+        description = (
+            "1. Analyze the sentiment of the stock {stock} based on Reddit posts and comments.\n"
+            "2. Use the Market Sentiment Tool to fetch relevant posts from subreddits like r/stocks, r/investing, and r/wallstreetbets.\n"
+            "3. Summarize the overall market sentiment, highlighting major themes, positive and negative trends, and influential posts or users."
+        ),
+        expected_output = (
+            "A detailed sentiment analysis report that includes:\n"
+            "- Key themes and trends in market sentiment for {stock}.\n"
+            "- Positive and negative sentiment indicators with examples from Reddit posts.\n"
+            "- Influential users or posts that significantly impact sentiment.\n"
+            "- An actionable summary of how the online investment community views {stock}."
+        ),
+        name = "Sentiment Analysis",
+        agent = get_sentiment_analyser(),
+        context=(get_research(),)
+    )
 
-)
 
+@lazy
+def get_analysis():
+    from crewai import Task
+    return Task(
+        description = (
+            "1. Review the research summary, including news, financial data, and market sentiment for {stock}.\n"
+            "2. Perform fundamental analysis using financial indicators (e.g., P/E ratio, revenue growth, profit margins).\n"
+            "3. Conduct technical analysis by identifying recent stock price trends, support/resistance levels, and trading volume patterns.\n"
+            "4. Assess risks and opportunities based on both qualitative and quantitative findings."
+        ),
+        expected_output = (
+            "A comprehensive analysis report that includes:\n"
+            "- Key insights from fundamental and technical analysis of NVIDIA.\n"
+            "- Identification of major risks and potential opportunities.\n"
+            "- Visuals or tables summarizing important financial and technical metrics.\n"
+            "- A concise summary of overall stock outlook based on the analysis."
+        ),
+        name = "Analysis",
+        agent = get_analyst(),
+        context=(get_research(), get_sentiment_analysis())
+    )
+
+
+@lazy
+def get_reporting():
+    from crewai import Task
+    return Task(
+        description = (
+            "1. Review the analysis report for {stock}, including all key findings and metrics.\n"
+            "2. Summarize the most important insights in clear, jargon-free language.\n"
+            "3. Provide actionable recommendations for investors, such as buy/hold/sell guidance, with supporting rationale.\n"
+            "4. Highlight any critical risks, uncertainties, or factors that could affect investment decisions."
+            "5. If it's a buy, say BUY, if it's a hold, say HOLD, if it's a sell, say SELL"
+            "6. Use quantitative metrics like Strong Buy, Buy, Hold, Sell, Strong Sell to indicate the strength of the recommendation."
+        ),
+        expected_output = (
+            "A concise investment report that includes:\n"
+            "- An executive summary of the stock’s outlook.\n"
+            "- Clear, actionable recommendations (e.g., buy, hold, sell) with supporting arguments.\n"
+            "- A summary of key risks and considerations for potential investors.\n"
+            "- Well-structured sections for easy reading and decision-making."
+        ),
+        name = "Reporting",
+        agent = get_decision_advisor(),
+        context= (get_research(), get_analysis())
+    )
+
+
+TASKS = {
+    "research": get_research,
+    "sentiment_analysis": get_sentiment_analysis,
+    "analysis": get_analysis,
+    "reporting": get_reporting,
+}
+
+
+def __getattr__(name):
+    if name in TASKS:
+        return TASKS[name]()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
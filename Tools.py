@@ -1,21 +1,28 @@
 from dotenv import load_dotenv
-from crewai_tools import SerperDevTool, ScrapeWebsiteTool
 from crewai.tools import BaseTool
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain_groq import ChatGroq
-from langchain.prompts import PromptTemplate
+from langchain_core.prompts import PromptTemplate
+from LLMCache import CachedChain
+from LLMs import groq_llm
+from Lazy import lazy
+from Distill import distill
+from Dedup import NearDuplicateIndex
+from RateLimiter import limiter
+from Prefetch import warm_result
+from Tracing import span, record, traced_tool, payload_size
+from Cassette import recorded
+from FetchCache import get_cache, not_modified, page_validators
+from SearchResults import extract_results, normalize_url, dedup_key, is_blocked, domain_blocklist
 load_dotenv()
 import os
+import re
+import contextvars
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from dataclasses import dataclass
+from urllib.parse import urlparse
 
-serper_api_key = os.environ['SERPER_API_KEY'] 
-google_api_key = os.environ["GOOGLE_API_KEY"]
-groq_api_key = os.environ["GROQ_API_KEY"]
-
-
-llm = ChatGroq(
-    groq_api_key=groq_api_key,
-    model="llama-3.1-8b-instant",
-)
 
 promptTemplate = PromptTemplate(
     input_variables=["data"],
@@ -36,17 +43,255 @@ extract_info_template = PromptTemplate(
     """
 )
 
-qa_chain = promptTemplate | llm
-extraction_chain = extract_info_template | llm
 
+@lazy
+def get_qa_chain():
+    return CachedChain(promptTemplate, groq_llm())
 
-web_scrape_tool = ScrapeWebsiteTool()
 
-search_tool = SerperDevTool(
-    search_url="https://google.serper.dev/scholar",
-    n_results=5,
-    api_key = serper_api_key
-)
+@lazy
+def get_extraction_chain():
+    return CachedChain(extract_info_template, groq_llm())
+
+
+@lazy
+def get_web_scrape_tool():
+    from crewai_tools import ScrapeWebsiteTool
+    return ScrapeWebsiteTool()
+
+
+@lazy
+def get_search_tool():
+    from crewai_tools import SerperDevTool
+    return SerperDevTool(
+        search_url="https://google.serper.dev/scholar",
+        n_results=5,
+        api_key=os.getenv("SERPER_API_KEY"),
+    )
+
+
+# The old module-level names still work, but build on first access
+_LAZY_ATTRIBUTES = {
+    "llm": groq_llm,
+    "qa_chain": get_qa_chain,
+    "extraction_chain": get_extraction_chain,
+    "web_scrape_tool": get_web_scrape_tool,
+    "search_tool": get_search_tool,
+}
+
+
+def __getattr__(name):
+    if name in _LAZY_ATTRIBUTES:
+        return _LAZY_ATTRIBUTES[name]()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+MAX_SCRAPE_WORKERS = int(os.getenv("MAX_SCRAPE_WORKERS", "8"))
+MAX_REQUESTS_PER_HOST = int(os.getenv("MAX_REQUESTS_PER_HOST", "2"))
+# Per link, from when it gets its host's turn
+LINK_TIMEOUT = float(os.getenv("LINK_TIMEOUT", "45"))
+# How long a link may wait for a worker and its host's turn before it is given up
+LINK_QUEUE_TIMEOUT = float(os.getenv("LINK_QUEUE_TIMEOUT", "90"))
+
+_host_semaphores = {}
+_host_semaphores_lock = threading.Lock()
+# Looks up a scraped page's ETag/Last-Modified after the scrape, off the link's critical path
+_validators_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="validators")
+
+
+def link_host(link):
+    return urlparse(link).netloc.lower()
+
+
+def _host_semaphore(link):
+    host = link_host(link)
+    with _host_semaphores_lock:
+        if host not in _host_semaphores:
+            _host_semaphores[host] = threading.Semaphore(MAX_REQUESTS_PER_HOST)
+        return _host_semaphores[host]
+
+
+def cached_search(query):
+    cache = get_cache()
+    search_tool = get_search_tool()
+    key = f"{getattr(search_tool, 'search_url', '')}|{search_tool.n_results}|{query}"
+    with span("http", "serper search", request_bytes=len(query)):
+        entry = cache.get("search", key)
+        if entry:
+            record(cache="hit", response_bytes=payload_size(entry.value))
+            return entry.value
+        data = limiter("serper").call(recorded, "serper", {"query": query, "n_results": search_tool.n_results}, search_tool.run, search_query=query)
+        record(cache="miss", response_bytes=payload_size(data))
+        cache.put("search", key, data)
+        return data
+
+
+def cached_scrape(link):
+    """The page's text, from the cache or the site; records on the caller's scrape span."""
+    cache = get_cache()
+    entry = cache.get("scrape", link, allow_stale=True)
+    if entry and entry.fresh:
+        record(cache="hit", response_bytes=payload_size(entry.value))
+        return entry.value
+    # A revalidation is a request to the site like any other
+    if entry and limiter("scrape").call(not_modified, link, entry, breaker_key=link_host(link)):
+        cache.touch("scrape", link)
+        record(cache="revalidated", response_bytes=payload_size(entry.value))
+        return entry.value
+
+    # Each site gets its own circuit breaker, so a few slow sites don't stop every scrape
+    x = limiter("scrape").call(recorded, "scrape", {"url": link}, get_web_scrape_tool().run,
+                               breaker_key=link_host(link), website_url = link)
+    record(cache="miss", response_bytes=payload_size(x))
+    cache.put("scrape", link, x)
+    _validators_executor.submit(contextvars.copy_context().run, _store_validators, link)
+    return x
+
+
+def _store_validators(link):
+    # The HEAD request waits for its host's turn and counts against the scrape limits like the GET
+    try:
+        with _host_semaphore(link):
+            etag, last_modified = limiter("scrape").call(page_validators, link, breaker_key=link_host(link))
+    except Exception as e:
+        print(f"[scrape] {link}: no validators ({e})")
+        return
+    if etag or last_modified:
+        get_cache().set_validators("scrape", link, etag=etag, last_modified=last_modified)
+
+
+class LinkTimeout(Exception):
+    pass
+
+
+@dataclass
+class SameStory:
+    """A page whose story an earlier page already has; settled once it's known whether that page made it."""
+    same_as: str
+    text: str
+
+
+def _extract(text, stock):
+    return get_extraction_chain().invoke({"data": text, "stock": stock}).content
+
+
+def _scrape_and_extract_one(link, stock, pages, state, timeout):
+    with span("http", "scrape", url=link):
+        queued = time.monotonic()
+        # Only the scrape is capped per host, the Groq call can overlap with other hosts' scrapes
+        with _host_semaphore(link):
+            if state.get("abandoned"):
+                raise LinkTimeout("given up before its turn")
+            state["started"] = time.monotonic()
+            record(wait_s=state["started"] - queued)
+            x = cached_scrape(link)
+        distilled = distill(x, stock)
+        record(
+            tokens_before=distilled.tokens_before,
+            tokens_after=distilled.tokens_after,
+            chunks_kept=distilled.chunks_kept,
+            chunks_total=distilled.chunks_total,
+        )
+    same_as = pages.add(link, distilled.text)
+    if same_as != link:
+        return SameStory(same_as, distilled.text)
+    # The caller has dropped a link that ran out of time, so its extraction isn't paid for
+    if state.get("abandoned") or time.monotonic() - state["started"] > timeout:
+        raise LinkTimeout(f"out of time after {time.monotonic() - state['started']:.0f}s")
+    return _extract(distilled.text, stock)
+
+
+def _link_deadline(state, queued_deadline, timeout):
+    started = state.get("started")
+    return queued_deadline if started is None else started + timeout
+
+
+def scrape_and_extract(links, stock, timeout=LINK_TIMEOUT, queue_timeout=LINK_QUEUE_TIMEOUT):
+    links = [link for link in links if link]
+    if not links:
+        return []
+
+    executor = ThreadPoolExecutor(max_workers=min(MAX_SCRAPE_WORKERS, len(links)))
+    pages = NearDuplicateIndex()
+    # A link's clock starts when it gets its host's turn, so time spent queued behind
+    # other links doesn't count against it
+    states = [{} for _ in links]
+    # Each worker gets its own copy of the caller's context so its spans join the current trace
+    futures = [
+        executor.submit(contextvars.copy_context().run, _scrape_and_extract_one, link, stock, pages, state, timeout)
+        for link, state in zip(links, states)
+    ]
+    queued_deadline = time.monotonic() + queue_timeout
+
+    # Results are collected in the original source order, whichever finishes first
+    results = {}
+    try:
+        for link, future, state in zip(links, futures, states):
+            while True:
+                deadline = _link_deadline(state, queued_deadline, timeout)
+                try:
+                    # Waits at most a second at a time, as a queued link may start meanwhile
+                    results[link] = future.result(timeout=max(0.0, min(1.0, deadline - time.monotonic())))
+                except FutureTimeoutError:
+                    if time.monotonic() < _link_deadline(state, queued_deadline, timeout):
+                        continue
+                    state["abandoned"] = True
+                    future.cancel()
+                    print(f"[scrape] {link}: timed out after {timeout:.0f}s" if "started" in state
+                          else f"[scrape] {link}: not started within {queue_timeout:.0f}s")
+                except Exception as e:
+                    # Failed sources are left out rather than handing error text to the agents
+                    print(f"[scrape] {link}: {e}")
+                break
+        _settle_same_stories(results, executor, stock, timeout)
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+    return [f"\n[Source: {link}]\n{content}" for link, content in results.items()]
+
+
+def _settle_same_stories(results, executor, stock, timeout):
+    """Point duplicates at the page that has their story, or extract one of them if that page failed."""
+    # The duplicate extracted in place of a failed page, by that page
+    stands_in = {}
+    for link, content in list(results.items()):
+        if not isinstance(content, SameStory):
+            continue
+        same_as = stands_in.get(content.same_as, content.same_as)
+        if same_as in results and not isinstance(results[same_as], SameStory):
+            results[link] = f"Same story as {same_as}"
+            continue
+        future = executor.submit(contextvars.copy_context().run, _extract, content.text, stock)
+        try:
+            results[link] = future.result(timeout=timeout)
+            stands_in[content.same_as] = link
+        except Exception as e:
+            future.cancel()
+            print(f"[scrape] {link}: {e or 'timed out'}")
+            del results[link]
+
+
+# A link in the LLM's list output; commas may be part of a link, so only a following "http" ends it
+LINK = re.compile(r"https?://(?:(?!,\s*https?://)[^\s'\"<>\[\]])+", re.IGNORECASE)
+
+
+def clean_link(link):
+    """A link without the list's punctuation after it; a ")" that closes a "(" in the link stays."""
+    link = link.rstrip(".,;:!?")
+    while link.endswith(")") and link.count(")") > link.count("("):
+        link = link[:-1].rstrip(".,;:!?")
+    return link
+
+
+def llm_extract_links(data):
+    # Fallback for search output the structured parser doesn't recognise
+    response = get_qa_chain().invoke({"data": data})
+    blocklist = domain_blocklist()
+    links = {}
+    for link in LINK.findall(response.content):
+        link = normalize_url(clean_link(link))
+        if link and not is_blocked(link, blocklist):
+            links.setdefault(dedup_key(link), link)
+    return list(links.values())
 
 
 class Scrape_and_Search_Tool(BaseTool):
@@ -56,31 +301,25 @@ class Scrape_and_Search_Tool(BaseTool):
         "The scraper tool scrapes the web and gives the relevant information which is structured by an LLM."
     )
 
+    @traced_tool
     def _run(self, stock: str) -> str:
-        # 1. Search
-        data = search_tool.run(search_query=f"{stock} stocks")
-
-        response = qa_chain.invoke({"data": data})
-        links_text = response.content.strip().strip("[]")
-        links = [link.strip().strip("'").strip('"') for link in links_text.split(",")]
-        print(links)
-
-        # 3. Scrape all links
-        scraped_data = []
-        for link in links:
-            if link: 
-                print(link) # basic safety
-                try:
-                    x = web_scrape_tool.run(website_url = link)
-                    y = extraction_chain.invoke({"data": x, "stock": stock})
-                    content = y.content
-                    scraped_data.append(f"\n[Source: {link}]\n{content}")
-                except Exception as e:
-                    scraped_data.append(f"\n[Source: {link}]\nError scraping: {e}")
-        print(links)
-        return "\n".join(scraped_data)
-    
-
+        warm = warm_result(self.name, stock)
+        if warm is not None:
+            return warm
+        if not os.getenv("SERPER_API_KEY"):
+            return "Web search is unavailable: SERPER_API_KEY is not set."
 
+        # 1. Search
+        data = cached_search(f"{stock} stocks")
 
+        # 2. Read the links straight from the Serper response
+        links = [result["link"] for result in extract_results(data)]
+        if not links:
+            links = llm_extract_links(data)
+        record(links=len(links))
 
+        # 3. Scrape and extract all links concurrently
+        scraped_data = scrape_and_extract(links, stock)
+        if not scraped_data:
+            return f"No sources could be retrieved for {stock}."
+        return "\n".join(scraped_data)
@@ -0,0 +1,290 @@
+import contextvars
+import functools
+import inspect
+import json
+import os
+import threading
+import time
+import urllib.request
+import uuid
+from collections import defaultdict
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from typing import Optional
+
+TRACE_DIR = os.getenv("TRACE_DIR", "traces")
+OTLP_ENDPOINT = os.getenv("OTEL_EXPORTER_OTLP_TRACES_ENDPOINT")
+
+# USD per million (prompt, completion) tokens
+MODEL_PRICES = {
+    "gpt-4o": (2.50, 10.00),
+    "gpt-3.5-turbo": (0.50, 1.50),
+    "llama-3.1-8b-instant": (0.05, 0.08),
+    "gemini-2.0-flash": (0.10, 0.40),
+}
+
+# Attributes that add up when recorded more than once on a span
+SUMMED = {"wait_s", "prompt_tokens", "completion_tokens", "cost_usd", "request_bytes", "response_bytes", "retries"}
+
+
+def estimate_cost(model, prompt_tokens, completion_tokens):
+    for name, (prompt_price, completion_price) in MODEL_PRICES.items():
+        if model and name in model:
+            return (prompt_tokens * prompt_price + completion_tokens * completion_price) / 1_000_000
+    return 0.0
+
+
+@dataclass
+class Span:
+    trace_id: str
+    span_id: str
+    parent_id: Optional[str]
+    kind: str
+    name: str
+    start: float
+    end: Optional[float] = None
+    attributes: dict = field(default_factory=dict)
+
+    @property
+    def duration(self):
+        return (self.end or time.time()) - self.start
+
+    def record(self, **attributes):
+        for key, value in attributes.items():
+            if key in SUMMED and value is not None:
+                self.attributes[key] = self.attributes.get(key, 0) + value
+            else:
+                self.attributes[key] = value
+
+
+class Trace:
+    def __init__(self, name, **attributes):
+        self.trace_id = uuid.uuid4().hex
+        self.spans = []
+        # Called with every finished span, e.g. to stream progress to the page
+        self.listeners = []
+        self._lock = threading.Lock()
+        self.root = Span(self.trace_id, uuid.uuid4().hex[:16], None, "run", name, time.time(), attributes=attributes)
+
+    def new_span(self, kind, name, parent=None, start=None, **attributes):
+        parent_id = parent.span_id if parent else self.root.span_id
+        return Span(self.trace_id, uuid.uuid4().hex[:16], parent_id, kind, name, start or time.time(),
+                    attributes=attributes)
+
+    def add(self, span):
+        with self._lock:
+            self.spans.append(span)
+        for listener in list(self.listeners):
+            try:
+                listener(span)
+            except Exception as e:
+                print(f"Trace listener failed: {e}")
+
+    def all_spans(self):
+        with self._lock:
+            return [self.root] + list(self.spans)
+
+    def summary(self):
+        """One row per (kind, name): calls, wall time, wait time, tokens, cost and cache hits."""
+        rows = defaultdict(lambda: defaultdict(float))
+        for span in self.all_spans():
+            row = rows[(span.kind, span.name)]
+            row["calls"] += 1
+            row["wall_s"] += span.duration
+            for key in sorted(SUMMED):
+                row[key] += span.attributes.get(key) or 0
+            if span.attributes.get("cache") == "hit":
+                row["cache_hits"] += 1
+        return [
+            {"kind": kind, "name": name,
+             **{k: int(v) if k in ("calls", "cache_hits") else round(v, 4) for k, v in row.items()}}
+            for (kind, name), row in sorted(rows.items(), key=lambda x: -x[1]["wall_s"])
+        ]
+
+    def export_jsonl(self, path=None):
+        path = path or os.path.join(TRACE_DIR, f"{self.trace_id}.jsonl")
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            for span in self.all_spans():
+                f.write(json.dumps({**asdict(span), "duration": span.duration}, default=str) + "\n")
+        return path
+
+    def to_otlp(self):
+        """The trace as an OTLP/JSON ExportTraceServiceRequest."""
+        def value(v):
+            if isinstance(v, bool):
+                return {"boolValue": v}
+            if isinstance(v, int):
+                return {"intValue": str(v)}
+            if isinstance(v, float):
+                return {"doubleValue": v}
+            return {"stringValue": str(v)}
+
+        spans = []
+        for span in self.all_spans():
+            spans.append({
+                "traceId": span.trace_id,
+                "spanId": span.span_id,
+                "parentSpanId": span.parent_id or "",
+                "name": f"{span.kind} {span.name}",
+                # 3 = CLIENT for outgoing calls, 1 = INTERNAL for everything else
+                "kind": 3 if span.kind in ("http", "llm") else 1,
+                "startTimeUnixNano": str(int(span.start * 1e9)),
+                "endTimeUnixNano": str(int((span.end or time.time()) * 1e9)),
+                "attributes": [{"key": k, "value": value(v)} for k, v in
+                               {"span.kind": span.kind, **span.attributes}.items() if v is not None],
+            })
+        return {"resourceSpans": [{
+            "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": "stock-analyzer"}}]},
+            "scopeSpans": [{"scope": {"name": "Tracing"}, "spans": spans}],
+        }]}
+
+    def export_otlp(self, path=None, endpoint=OTLP_ENDPOINT):
+        payload = json.dumps(self.to_otlp()).encode("utf-8")
+        path = path or os.path.join(TRACE_DIR, f"{self.trace_id}.otlp.json")
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(payload)
+        if endpoint:
+            request = urllib.request.Request(endpoint, data=payload, headers={"Content-Type": "application/json"})
+            try:
+                urllib.request.urlopen(request, timeout=10).close()
+            except OSError as e:
+                print(f"[tracing] OTLP export to {endpoint} failed: {e}")
+        return path
+
+
+_trace = contextvars.ContextVar("trace", default=None)
+_span = contextvars.ContextVar("span", default=None)
+
+
+def current_trace():
+    return _trace.get()
+
+
+def current_span():
+    return _span.get()
+
+
+def record(**attributes):
+    """Add attributes to the innermost open span, if any."""
+    span = _span.get()
+    if span is not None:
+        span.record(**attributes)
+
+
+@contextmanager
+def start_trace(name, **attributes):
+    trace = Trace(name, **attributes)
+    trace_token = _trace.set(trace)
+    span_token = _span.set(trace.root)
+    try:
+        yield trace
+    finally:
+        trace.root.end = time.time()
+        _span.reset(span_token)
+        _trace.reset(trace_token)
+
+
+@contextmanager
+def span(kind, name, **attributes):
+    trace = _trace.get()
+    if trace is None:
+        yield None
+        return
+    s = trace.new_span(kind, name, parent=_span.get(), **attributes)
+    token = _span.set(s)
+    try:
+        yield s
+    except Exception as e:
+        s.attributes["error"] = repr(e)[:500]
+        raise
+    finally:
+        s.end = time.time()
+        _span.reset(token)
+        trace.add(s)
+
+
+def payload_size(value):
+    if value is None:
+        return 0
+    if isinstance(value, (bytes, str)):
+        return len(value)
+    return len(json.dumps(value, default=str))
+
+
+def traced_tool(fn):
+    """Wrap a tool's _run (sync or async) in a "tool" span named after the tool."""
+    if inspect.iscoroutinefunction(fn):
+        @functools.wraps(fn)
+        async def async_wrapper(self, *args, **kwargs):
+            with span("tool", self.name, request_bytes=payload_size([args, kwargs])) as s:
+                result = await fn(self, *args, **kwargs)
+                if s:
+                    s.record(response_bytes=payload_size(result))
+                return result
+        return async_wrapper
+
+    @functools.wraps(fn)
+    def wrapper(self, *args, **kwargs):
+        with span("tool", self.name, request_bytes=payload_size([args, kwargs])) as s:
+            result = fn(self, *args, **kwargs)
+            if s:
+                s.record(response_bytes=payload_size(result))
+            return result
+    return wrapper
+
+
+def carry(coro):
+    """Keep the caller's trace context for a coroutine that will run on another event loop."""
+    trace, parent = _trace.get(), _span.get()
+
+    async def run():
+        _trace.set(trace)
+        _span.set(parent)
+        return await coro
+
+    return run()
+
+
+def crew_callbacks(trace):
+    """step_callback / task_callback for Crew that record task and agent-step spans on `trace`.
+
+    Tasks run one after the other, so each task span runs from the end of the previous one.
+    """
+    state = {"task_start": time.time(), "step_start": time.time()}
+
+    def step_callback(step):
+        now = time.time()
+        s = trace.new_span("agent", type(step).__name__, start=state["step_start"],
+                           tool=getattr(step, "tool", None))
+        s.end = now
+        trace.add(s)
+        state["step_start"] = now
+
+    def task_callback(output):
+        now = time.time()
+        agent = getattr(output, "agent", None)
+        s = trace.new_span("task", getattr(output, "name", None) or str(getattr(output, "description", ""))[:60],
+                           start=state["task_start"], agent=str(agent) if agent else None,
+                           response_bytes=payload_size(getattr(output, "raw", "")))
+        s.end = now
+        trace.add(s)
+        state["task_start"] = state["step_start"] = now
+
+    return {"step_callback": step_callback, "task_callback": task_callback}
+
+
+def record_crew_usage(trace, usage, model="gpt-4o"):
+    """Put the crew's agent LLM token usage (crewai UsageMetrics) on the root span."""
+    if usage is None:
+        return
+    prompt_tokens = getattr(usage, "prompt_tokens", 0) or 0
+    completion_tokens = getattr(usage, "completion_tokens", 0) or 0
+    trace.root.record(
+        model=model,
+        prompt_tokens=prompt_tokens,
+        completion_tokens=completion_tokens,
+        cost_usd=estimate_cost(model, prompt_tokens, completion_tokens),
+        llm_requests=getattr(usage, "successful_requests", None),
+    )
@@ -0,0 +1,173 @@
+import glob
+import hashlib
+import json
+import os
+import uuid
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.vectorstores import VectorStore
+
+# Names of the current version's files; each save writes new files and then swaps this
+POINTER_FILE = "current.json"
+# Unversioned files written by earlier saves, still read
+VECTORS_FILE = "vectors.npy"
+CHUNKS_FILE = "chunks.json"
+
+
+def _normalize(matrix):
+    matrix = np.asarray(matrix, dtype=np.float32)
+    if matrix.ndim == 1:
+        matrix = matrix[None, :]
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+class NumpyIndex(VectorStore):
+    """Chunks and their unit-length embeddings in one contiguous float32 matrix.
+
+    A query is a single matrix-vector product over every chunk, which for a few reports'
+    worth of chunks takes microseconds. Saved as a .npy file plus the chunks as JSON, and
+    loaded memory-mapped.
+    """
+
+    def __init__(self, embedding, vectors=None, texts=(), metadatas=(), ids=(), attributes=None):
+        self._embedding = embedding
+        self.vectors = vectors
+        self.texts = list(texts)
+        self.metadatas = [dict(m) for m in metadatas] or [{} for _ in self.texts]
+        self.ids = list(ids) or [hashlib.sha256(t.encode("utf-8")).hexdigest()[:32] for t in self.texts]
+        # Index-wide values kept with the chunks, e.g. the ticker and when it was last updated
+        self.attributes = dict(attributes or {})
+
+    def __len__(self):
+        return len(self.texts)
+
+    @property
+    def embeddings(self):
+        return self._embedding
+
+    def add_texts(self, texts, metadatas=None, ids=None, **kwargs):
+        texts = list(texts)
+        if not texts:
+            return []
+        vectors = _normalize(self._embedding.embed_documents(texts))
+        ids = list(ids) if ids else [hashlib.sha256(t.encode("utf-8")).hexdigest()[:32] for t in texts]
+        # Always a new contiguous array, also when the current one is memory-mapped
+        self.vectors = vectors if not len(self) else np.concatenate([self.vectors, vectors])
+        self.texts.extend(texts)
+        self.metadatas.extend(dict(m) for m in (metadatas or [{} for _ in texts]))
+        self.ids.extend(ids)
+        return ids
+
+    def keep(self, mask):
+        """Drop the chunks where `mask` is False."""
+        if not len(self):
+            return
+        mask = np.asarray(mask, dtype=bool)
+        rows = np.flatnonzero(mask)
+        self.vectors = np.ascontiguousarray(self.vectors[rows]) if len(rows) else None
+        self.texts = [self.texts[i] for i in rows]
+        self.metadatas = [self.metadatas[i] for i in rows]
+        self.ids = [self.ids[i] for i in rows]
+
+    def similarity_search_with_score_by_vector(self, embedding, k=4):
+        if not len(self):
+            return []
+        scores = self.vectors @ _normalize(embedding)[0]
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(Document(page_content=self.texts[i], metadata=self.metadatas[i]), float(scores[i])) for i in top]
+
+    def similarity_search_by_vector(self, embedding, k=4, **kwargs):
+        return [doc for doc, _ in self.similarity_search_with_score_by_vector(embedding, k)]
+
+    def similarity_search_with_score(self, query, k=4, **kwargs):
+        return self.similarity_search_with_score_by_vector(self._embedding.embed_query(query), k)
+
+    def similarity_search(self, query, k=4, **kwargs):
+        return [doc for doc, _ in self.similarity_search_with_score(query, k)]
+
+    def _select_relevance_score_fn(self):
+        # Scores are cosine similarities in [-1, 1]
+        return lambda score: (score + 1.0) / 2.0
+
+    @classmethod
+    def from_texts(cls, texts, embedding, metadatas=None, ids=None, **kwargs):
+        index = cls(embedding)
+        index.add_texts(texts, metadatas=metadatas, ids=ids)
+        return index
+
+    def save(self, path):
+        """Write the matrix with np.save and the chunks as JSON under new names, then point to them.
+
+        Files that are open, e.g. memory-mapped by an index loaded earlier, are never
+        replaced (Windows doesn't allow it). Old versions are removed once nothing has
+        them open, at this save or a later one.
+        """
+        os.makedirs(path, exist_ok=True)
+        version = uuid.uuid4().hex[:12]
+        current = {"vectors": f"vectors-{version}.npy", "chunks": f"chunks-{version}.json"}
+        np.save(
+            os.path.join(path, current["vectors"]),
+            self.vectors if self.vectors is not None else np.zeros((0, 0), dtype=np.float32),
+        )
+        with open(os.path.join(path, current["chunks"]), "w", encoding="utf-8") as f:
+            json.dump({
+                "attributes": self.attributes,
+                "chunks": [{"id": i, "text": t, "metadata": m} for i, t, m in zip(self.ids, self.texts, self.metadatas)],
+            }, f)
+        pointer_tmp = os.path.join(path, f"current-{version}.tmp")
+        with open(pointer_tmp, "w", encoding="utf-8") as f:
+            json.dump(current, f)
+        os.replace(pointer_tmp, os.path.join(path, POINTER_FILE))
+
+        stale = glob.glob(os.path.join(path, "vectors-*.npy")) + glob.glob(os.path.join(path, "chunks-*.json"))
+        stale += [os.path.join(path, VECTORS_FILE), os.path.join(path, CHUNKS_FILE)]
+        for file in stale:
+            if os.path.basename(file) not in current.values() and os.path.exists(file):
+                try:
+                    os.remove(file)
+                except OSError:
+                    pass
+
+    @staticmethod
+    def _files(path):
+        """(vectors file, chunks file) of the current version, or None."""
+        try:
+            with open(os.path.join(path, POINTER_FILE), encoding="utf-8") as f:
+                current = json.load(f)
+            return os.path.join(path, current["vectors"]), os.path.join(path, current["chunks"])
+        except FileNotFoundError:
+            files = os.path.join(path, VECTORS_FILE), os.path.join(path, CHUNKS_FILE)
+            return files if all(os.path.exists(file) for file in files) else None
+
+    @classmethod
+    def load(cls, path, embedding, mmap=True):
+        files = cls._files(path)
+        if files is None:
+            raise FileNotFoundError(f"No index at {path}")
+        vectors_file, chunks_file = files
+        with open(chunks_file, encoding="utf-8") as f:
+            data = json.load(f)
+        chunks = data["chunks"]
+        vectors = None
+        # An empty file can't be memory-mapped
+        if chunks:
+            vectors = np.load(vectors_file, mmap_mode="r" if mmap else None)
+            if len(vectors) != len(chunks):
+                raise ValueError(f"{path}: {len(vectors)} vectors for {len(chunks)} chunks")
+        return cls(
+            embedding,
+            vectors=vectors,
+            texts=[c["text"] for c in chunks],
+            metadatas=[c["metadata"] for c in chunks],
+            ids=[c["id"] for c in chunks],
+            attributes=data.get("attributes"),
+        )
+
+    @classmethod
+    def exists(cls, path):
+        return cls._files(path) is not None
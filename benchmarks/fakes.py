@@ -0,0 +1,442 @@
+"""Local stand-ins for every external service the tools and agents talk to."""
+import asyncio
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+import urllib.request
+import zlib
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Optional
+from urllib.parse import parse_qs, urlsplit
+
+import numpy as np
+from crewai import BaseLLM
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from pydantic import ConfigDict
+
+WORDS = (
+    "market revenue quarter growth margin guidance earnings analyst shares stock price target "
+    "bullish bearish buy sell hold rally crash upgrade downgrade dividend debt profit loss strong "
+    "weak investors demand supply sector outlook risk valuation momentum support resistance volume "
+    "order book capex exports tariff rupee inflation policy rates bank credit retail funds"
+).split()
+
+
+def _rng(*parts):
+    return random.Random(zlib.crc32("|".join(map(str, parts)).encode("utf-8")))
+
+
+def sentence(rng, subject=None, words=14):
+    tokens = [rng.choice(WORDS) for _ in range(words)]
+    if subject:
+        tokens.insert(rng.randrange(len(tokens)), subject)
+    text = " ".join(tokens)
+    return text[0].upper() + text[1:] + "."
+
+
+def paragraph(rng, subject=None, sentences=5):
+    return " ".join(sentence(rng, subject if i % 2 == 0 else None) for i in range(sentences))
+
+
+def filler(tokens, seed="filler"):
+    """About `tokens` tokens of text (a word is roughly 1.3 tokens)."""
+    rng = _rng(seed)
+    return " ".join(rng.choice(WORDS) for _ in range(max(1, int(tokens / 1.3))))
+
+
+def _slug(text):
+    return re.sub(r"[^a-z0-9]+", "-", text.lower()).strip("-") or "q"
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    # Room for every concurrent analysis to connect at once
+    request_queue_size = 256
+
+
+class StubServer:
+    """HTTP stand-in for Serper, GNews and the pages search results point at.
+
+    Every response is generated from the request, so the same query always gets the same
+    results, and each request is answered after `latency` seconds.
+    """
+
+    def __init__(self, latency=0.05, page_kb=40, results=5, articles=10):
+        self.latency = latency
+        self.page_kb = page_kb
+        self.results = results
+        self.articles = articles
+        self.requests = {}
+        self._lock = threading.Lock()
+        self._server = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                stub._handle(self, body=True)
+
+            def do_HEAD(self):
+                stub._handle(self, body=False)
+
+            def do_POST(self):
+                stub._handle(self, body=True)
+
+        self._server = _Server(("127.0.0.1", 0), Handler)
+        threading.Thread(target=self._server.serve_forever, name="stub-server", daemon=True).start()
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def _count(self, route):
+        with self._lock:
+            self.requests[route] = self.requests.get(route, 0) + 1
+
+    def _handle(self, handler, body):
+        time.sleep(self.latency)
+        parts = urlsplit(handler.path)
+        route = parts.path.strip("/").split("/")[0]
+        self._count(route)
+        if route == "search":
+            length = int(handler.headers.get("Content-Length") or 0)
+            request = json.loads(handler.rfile.read(length) or b"{}")
+            self._send(handler, 200, "application/json", json.dumps(self.search(request.get("q", ""))), body)
+        elif route == "gnews":
+            query = parse_qs(parts.query)
+            max_articles = int(query.get("max", [self.articles])[0])
+            payload = json.dumps(self.gnews(query.get("q", [""])[0], max_articles))
+            self._send(handler, 200, "application/json", payload, body, etag=True)
+        elif route in ("page", "article"):
+            self._send(handler, 200, "text/html; charset=utf-8", self.page(parts.path), body, etag=True)
+        else:
+            self._send(handler, 404, "text/plain", "not found", body)
+
+    def _send(self, handler, status, content_type, text, body, etag=False):
+        data = text.encode("utf-8")
+        tag = f'"{hashlib.sha256(data).hexdigest()[:16]}"'
+        if etag and handler.headers.get("If-None-Match") == tag:
+            status, data = 304, b""
+        handler.send_response(status)
+        handler.send_header("Content-Type", content_type)
+        handler.send_header("Content-Length", str(len(data)))
+        if etag:
+            handler.send_header("ETag", tag)
+            handler.send_header("Last-Modified", formatdate(0, usegmt=True))
+        handler.end_headers()
+        if body and data:
+            handler.wfile.write(data)
+
+    def search(self, query):
+        rng = _rng("search", query)
+        slug = _slug(query)
+        return {
+            "searchParameters": {"q": query},
+            "organic": [
+                {
+                    "title": sentence(rng, query, words=6),
+                    "link": f"{self.url}/page/{slug}/{i}",
+                    "snippet": sentence(rng, query),
+                    "position": i + 1,
+                }
+                for i in range(self.results)
+            ],
+        }
+
+    def gnews(self, query, max_articles):
+        rng = _rng("gnews", query)
+        subject = query.strip('"')
+        now = time.time()
+        return {
+            "totalArticles": max_articles,
+            "articles": [
+                {
+                    "title": sentence(rng, subject, words=8),
+                    "description": sentence(rng, subject),
+                    "content": paragraph(rng, subject),
+                    "url": f"{self.url}/article/{_slug(query)}/{i}",
+                    "publishedAt": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(now - i * 3600)),
+                    "source": {"name": "Stub Wire", "url": self.url},
+                }
+                for i in range(max_articles)
+            ],
+        }
+
+    def page(self, path):
+        rng = _rng("page", path)
+        # Pages for the query "RELIANCE stocks" are about RELIANCE
+        subject = path.strip("/").split("/")[1].split("-")[0].upper()
+        paragraphs = []
+        size = 0
+        while size < self.page_kb * 1024:
+            text = paragraph(rng, subject)
+            paragraphs.append(f"<p>{text}</p>")
+            size += len(text) + 7
+        return (
+            f"<html><head><title>{subject} stock news</title></head><body>"
+            f"<nav>Home | Markets | Login</nav><h1>{sentence(rng, subject, words=6)}</h1>"
+            f"{''.join(paragraphs)}<footer>Copyright Stub Wire</footer></body></html>"
+        )
+
+
+class FakeSerperClient:
+    """Stands in for Tools.search_tool, sending the query to the stub server instead of google.serper.dev."""
+
+    def __init__(self, url, n_results=5):
+        self.search_url = f"{url}/search"
+        self.n_results = n_results
+
+    def run(self, search_query):
+        request = urllib.request.Request(
+            self.search_url,
+            data=json.dumps({"q": search_query, "num": self.n_results}).encode("utf-8"),
+            headers={"Content-Type": "application/json"},
+            method="POST",
+        )
+        with urllib.request.urlopen(request, timeout=30) as response:
+            return json.loads(response.read())
+
+
+# asyncpraw stand-ins: only the attributes and coroutines the tools use are implemented
+
+class FakeCommentForest(list):
+    async def replace_more(self, limit=None):
+        return []
+
+
+class FakeComment:
+    def __init__(self, id, body, score):
+        self.id = id
+        self.body = body
+        self.score = score
+        self.replies = FakeCommentForest()
+
+
+class FakeSubredditRef:
+    def __init__(self, display_name):
+        self.display_name = display_name
+
+
+class FakeSubmission:
+    def __init__(self, reddit, subreddit, id, subject, score, created_utc):
+        rng = _rng("submission", id)
+        self._reddit = reddit
+        self.id = id
+        self.subreddit = FakeSubredditRef(subreddit)
+        self.title = sentence(rng, subject, words=10)
+        self.selftext = paragraph(rng, subject, sentences=3)
+        self.url = f"https://www.reddit.com/r/{subreddit}/comments/{id}/"
+        self.score = score
+        self.num_comments = reddit.comments
+        self.created_utc = created_utc
+        self.link_flair_text = "Meme" if rng.random() < 0.1 else "News"
+        self.comment_sort = "confidence"
+        self.comment_limit = None
+        self.comments = FakeCommentForest()
+
+    async def load(self):
+        await asyncio.sleep(self._reddit.latency)
+        rng = _rng("comments", self.id)
+        count = min(self.num_comments, self.comment_limit or self.num_comments)
+        # About a third are top-level, the rest hang off earlier comments down to max_depth
+        forest = FakeCommentForest()
+        # Comments that can still take replies, with their depth
+        parents = []
+        for i in range(count):
+            comment = FakeComment(f"{self.id}c{i}", paragraph(rng, sentences=rng.randint(1, 4)), rng.randint(-20, 2000))
+            if i < max(1, count // 3) or not parents:
+                forest.append(comment)
+                depth = 0
+            else:
+                parent, parent_depth = rng.choice(parents)
+                parent.replies.append(comment)
+                depth = parent_depth + 1
+            if depth < self._reddit.max_depth:
+                parents.append((comment, depth))
+        self.comments = forest
+
+
+class FakeSubreddit:
+    def __init__(self, reddit, name):
+        self._reddit = reddit
+        self.display_name = name
+
+    def _listing(self, kind, query, limit):
+        now = time.time()
+        subject = query.upper() if query else None
+        for i in range(min(limit or self._reddit.posts, self._reddit.posts)):
+            id = hashlib.sha1(f"{self._reddit.generation}|{kind}|{self.display_name}|{query}|{i}".encode()).hexdigest()[:7]
+            score = _rng("score", id).randint(10, 5000)
+            yield FakeSubmission(self._reddit, self.display_name, id, subject, score, now - i * 900)
+
+    async def search(self, query, sort="new", limit=100):
+        for i, submission in enumerate(self._listing("search", query, limit)):
+            if i % 100 == 0:
+                await asyncio.sleep(self._reddit.latency)
+            yield submission
+
+    async def hot(self, limit=100):
+        for i, submission in enumerate(self._listing("hot", None, limit)):
+            if i % 100 == 0:
+                await asyncio.sleep(self._reddit.latency)
+            yield submission
+
+
+class FakeReddit:
+    """asyncpraw.Reddit stand-in with configurable listing and thread sizes.
+
+    Bump `generation` to get a fresh set of submission ids, so the local store doesn't
+    answer a repeated listing.
+    """
+
+    def __init__(self, posts=25, comments=200, max_depth=3, latency=0.05):
+        self.posts = posts
+        self.comments = comments
+        self.max_depth = max_depth
+        self.latency = latency
+        self.generation = 0
+
+    async def subreddit(self, name):
+        return FakeSubreddit(self, name)
+
+    async def close(self):
+        pass
+
+
+class FakeChatModel(BaseChatModel):
+    """LangChain chat model that answers after `latency` seconds and reports token usage.
+
+    `responder` maps the prompt text to the reply; by default the reply is filler text of
+    `completion_tokens` tokens.
+    """
+
+    model_config = ConfigDict(protected_namespaces=())
+
+    model_name: str = "fake"
+    latency: float = 0.2
+    completion_tokens: int = 200
+    responder: Optional[Callable[[str], str]] = None
+
+    @property
+    def _llm_type(self):
+        return "fake-chat"
+
+    def _result(self, messages):
+        prompt = "\n".join(str(message.content) for message in messages)
+        content = self.responder(prompt) if self.responder else filler(self.completion_tokens, prompt[-200:])
+        prompt_tokens = len(prompt) // 4
+        message = AIMessage(content=content, usage_metadata={
+            "input_tokens": prompt_tokens,
+            "output_tokens": self.completion_tokens,
+            "total_tokens": prompt_tokens + self.completion_tokens,
+        })
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        time.sleep(self.latency)
+        return self._result(messages)
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        await asyncio.sleep(self.latency)
+        return self._result(messages)
+
+
+def sentiment_responder(prompt):
+    """A verdict for every post id in a MarketSentimentTool batch prompt."""
+    verdicts = []
+    for post_id in re.findall(r"^id: (\S+)", prompt, re.M):
+        rng = _rng("verdict", post_id)
+        verdicts.append({
+            "id": post_id,
+            "stocks": [],
+            "sentiment": rng.choice(["Positive", "Negative", "Neutral"]),
+            "justification": sentence(rng),
+        })
+    return json.dumps(verdicts)
+
+
+# Tickers the benchmarks make up, see benchmarks.run.next_stock
+BENCH_TICKER = re.compile(r"BENCH\d{4}")
+BENCH_RATINGS = ("STRONG BUY", "BUY", "HOLD", "SELL", "STRONG SELL")
+
+
+class FakeAgentLLM(BaseLLM):
+    """crewai LLM that calls each of `actions` in turn, ReAct style, then gives a final answer.
+
+    `actions` is a list of (tool name, arguments) pairs. A "{stock}" in an argument is
+    replaced by the benchmark ticker in the prompt, so one LLM serves every stock's crew.
+    The final answer ends in a recommendation picked from the ticker.
+    """
+
+    def __init__(self, actions=(), latency=0.5, completion_tokens=400, model="openai/gpt-4o"):
+        super().__init__(model=model)
+        self.actions = list(actions)
+        self.latency = latency
+        self.completion_tokens = completion_tokens
+
+    def call(self, messages, *args, **kwargs):
+        time.sleep(self.latency)
+        # The executor appends every action with its observation as an assistant message
+        steps = 0 if isinstance(messages, str) else sum(1 for m in messages if m.get("role") == "assistant")
+        prompt = messages if isinstance(messages, str) else " ".join(str(m.get("content", "")) for m in messages)
+        match = BENCH_TICKER.search(prompt)
+        stock = match.group(0) if match else "STOCK"
+        if steps < len(self.actions):
+            name, arguments = self.actions[steps]
+            arguments = {k: v.replace("{stock}", stock) if isinstance(v, str) else v for k, v in arguments.items()}
+            return f"Thought: I should use the {name}.\nAction: {name}\nAction Input: {json.dumps(arguments)}"
+        rating = BENCH_RATINGS[zlib.crc32(stock.encode("utf-8")) % len(BENCH_RATINGS)]
+        return (
+            f"Thought: I now know the final answer\nFinal Answer: {filler(self.completion_tokens, steps)}\n"
+            f"Recommendation: {rating}"
+        )
+
+    def supports_function_calling(self):
+        return False
+
+    def supports_stop_words(self):
+        return True
+
+    def get_context_window_size(self):
+        return 128000
+
+
+class FakeEmbeddings(Embeddings):
+    """Deterministic unit vectors from a hash of the text, `latency` seconds per text embedded."""
+
+    def __init__(self, size=384, latency=0.005):
+        self.size = size
+        self.latency = latency
+
+    def _embed(self, text):
+        vector = np.random.default_rng(zlib.crc32(text.encode("utf-8"))).standard_normal(self.size)
+        return (vector / np.linalg.norm(vector)).tolist()
+
+    def embed_documents(self, texts):
+        time.sleep(self.latency * len(texts))
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text):
+        time.sleep(self.latency)
+        return self._embed(text)
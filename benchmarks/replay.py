@@ -0,0 +1,82 @@
+"""Record a real crew run to a cassette, or replay one offline.
+
+    python -m benchmarks.replay record RELIANCE runs/reliance.json.gz
+    python -m benchmarks.replay replay runs/reliance.json.gz --latency zero
+
+Recording talks to the real services with the keys from .env. Replaying needs no keys or
+network. With --latency zero, the replay's wall time is roughly the time spent in our own
+code. Compare it with the recorded wall time and the upstream seconds per kind.
+Both modes start from empty caches, so every exchange goes through the cassette.
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+from benchmarks.run import OFFLINE_ENV
+
+
+def run_crew(stock):
+    from Jobs import build_crew, crew_inputs
+    from Prefetch import start_prefetch
+    from Tracing import crew_callbacks, start_trace
+
+    with start_trace("analysis", stock=stock) as trace:
+        crew = build_crew(crew_callbacks(trace), verbose=False)
+        start_prefetch(stock)
+        result = crew.kickoff(inputs=crew_inputs(stock))
+    return result, trace
+
+
+def print_stats(stats, recorded_wall=None, wall=None):
+    print(f"\n{'kind':<18} {'exchanges':>9} {'upstream s':>11}")
+    for kind, row in sorted(stats.items()):
+        print(f"{kind:<18} {row['exchanges']:>9} {row['upstream_s']:>11.2f}")
+    if recorded_wall is not None:
+        print(f"\nrecorded run: {recorded_wall:.2f}s wall")
+    if wall is not None:
+        print(f"this run:     {wall:.2f}s wall")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="mode", required=True)
+    record = sub.add_parser("record")
+    record.add_argument("stock")
+    record.add_argument("path")
+    replay = sub.add_parser("replay")
+    replay.add_argument("path")
+    replay.add_argument("--latency", choices=("original", "zero"), default="original")
+    args = parser.parse_args(argv)
+
+    scratch = tempfile.mkdtemp(prefix="stock-cassette-")
+    os.environ["CACHE_DIR"] = os.path.join(scratch, "cache")
+    os.environ["TRACE_DIR"] = os.path.join(scratch, "traces")
+    os.environ["LLM_CACHE"] = "off"
+    if args.mode == "replay":
+        os.environ.update(OFFLINE_ENV)
+
+    from Cassette import use_cassette
+
+    try:
+        with use_cassette(args.path, args.mode, getattr(args, "latency", "original")) as cassette:
+            stock = args.stock if args.mode == "record" else cassette.meta["stock"]
+            start = time.perf_counter()
+            result, trace = run_crew(stock)
+            wall = time.perf_counter() - start
+            if args.mode == "record":
+                cassette.meta = {"stock": stock, "wall_s": round(wall, 3), "recorded_at": time.time()}
+        print(str(result)[:2000])
+        print_stats(cassette.stats(), cassette.meta.get("wall_s") if args.mode == "replay" else None, wall)
+        print(f"\n{'stage':<40} {'calls':>6} {'wall s':>8}")
+        for row in trace.summary()[:15]:
+            print(f"{row['kind'] + ' ' + str(row['name']):<40.40} {row['calls']:>6} {row['wall_s']:>8.2f}")
+        if args.mode == "record":
+            print(f"\ncassette saved to {args.path} ({os.path.getsize(args.path) / 1024:.0f} KiB)")
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,459 @@
+"""Offline benchmarks for the tools, the crew and the RAG path.
+
+Every external service is replaced by a local stand-in from benchmarks.fakes, so runs are
+reproducible and cost nothing:
+
+    python -m benchmarks.run
+    python -m benchmarks.run --scenarios tools,rag --iterations 10
+    python -m benchmarks.run --save-baseline       # keep the results in benchmarks/baselines/
+    python -m benchmarks.run --compare             # compare against the saved baseline
+    python -m benchmarks.run --scenarios portfolio --portfolio-size 12 --portfolio-workers 4
+
+Every iteration uses a new ticker and caches start empty, so latencies are for cold fetches.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.fakes import (
+    FakeAgentLLM, FakeChatModel, FakeEmbeddings, FakeReddit, FakeSerperClient, StubServer,
+    filler, sentiment_responder,
+)
+
+BASELINE_DIR = os.path.join(os.path.dirname(__file__), "baselines")
+SCENARIOS = ("tools", "crew", "rag", "throughput", "portfolio", "cache")
+# Metrics compared against the baseline, and whether bigger is better
+COMPARED = {"p50_s": False, "p95_s": False, "peak_mib": False, "analyses_per_min": True}
+
+# Keys the clients are built with; nothing is ever sent with them
+OFFLINE_ENV = {
+    "SERPER_API_KEY": "offline",
+    "GOOGLE_API_KEY": "offline",
+    "GROQ_API_KEY": "offline",
+    "OPEN_AI_KEY": "offline",
+    "GNEWS_KEY": "offline",
+    "REDDIT_CLIENT_ID": "offline",
+    "REDDIT_CLIENT_SECRET": "offline",
+    "CREWAI_DISABLE_TELEMETRY": "true",
+    "OTEL_SDK_DISABLED": "true",
+}
+
+_tickers = itertools.count()
+
+
+def next_stock():
+    return f"BENCH{next(_tickers):04d}"
+
+
+def offline_environment(args):
+    """Point caches at a scratch directory and lift rate limits; must run before the repo modules are imported."""
+    os.environ.update(OFFLINE_ENV)
+    os.environ.pop("OTEL_EXPORTER_OTLP_TRACES_ENDPOINT", None)
+    scratch = tempfile.mkdtemp(prefix="stock-bench-")
+    os.environ["CACHE_DIR"] = os.path.join(scratch, "cache")
+    os.environ["TRACE_DIR"] = os.path.join(scratch, "traces")
+    os.environ["RAG_BACKEND"] = args.rag_backend
+    if not args.rate_limits:
+        from RateLimiter import DEFAULT_QUOTAS
+        for provider in list(DEFAULT_QUOTAS) + ["llm"]:
+            os.environ[f"RATE_LIMIT_{provider.upper()}_RPM"] = "0"
+            os.environ[f"RATE_LIMIT_{provider.upper()}_TPM"] = "0"
+    return scratch
+
+
+def install_fakes(args):
+    import LLMs
+    import NewsTool
+    import RedditClient
+    import RedditNewsTool
+    import SentimentTool
+    import Tools
+    from LLMCache import CachedChain
+
+    def llm(model, **kwargs):
+        return FakeChatModel(model_name=model, latency=args.llm_latency, completion_tokens=args.llm_tokens, **kwargs)
+
+    server = StubServer(latency=args.http_latency, page_kb=args.page_kb).start()
+    Tools.get_search_tool.set(FakeSerperClient(server.url, n_results=5))
+    NewsTool.GNEWS_URL = f"{server.url}/gnews"
+
+    reddit = FakeReddit(posts=args.posts, comments=args.comments, latency=args.http_latency)
+    RedditClient._reddit = reddit
+
+    Tools.get_qa_chain.set(CachedChain(Tools.promptTemplate, llm("llama-3.1-8b-instant")))
+    Tools.get_extraction_chain.set(CachedChain(Tools.extract_info_template, llm("llama-3.1-8b-instant")))
+    SentimentTool.get_analysis_chain.set(CachedChain(
+        SentimentTool.prompt_template, llm("llama-3.1-8b-instant", responder=sentiment_responder)
+    ))
+    RedditNewsTool.get_analysis_chain.set(CachedChain(RedditNewsTool.prompt_template, llm("gemini-2.0-flash")))
+
+    LLMs.embedding_model.set(FakeEmbeddings(latency=args.embed_latency))
+    LLMs.rag_llm.set(llm("gpt-3.5-turbo"))
+    LLMs.recommendation_llm.set(llm("gemini-2.0-flash"))
+    return server, reddit
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+
+def latency_stats(durations):
+    return {
+        "runs": len(durations),
+        "mean_s": round(statistics.mean(durations), 4),
+        "p50_s": round(statistics.median(durations), 4),
+        "p95_s": round(percentile(durations, 0.95), 4),
+        "min_s": round(min(durations), 4),
+        "max_s": round(max(durations), 4),
+    }
+
+
+def peak_mib(fn, value):
+    """Peak Python heap of one call, across all threads."""
+    tracemalloc.start()
+    try:
+        fn(value)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return round(peak / 1024 / 1024, 2)
+
+
+def measure(name, fn, make_input, iterations):
+    """Latency over `iterations` calls, the stage breakdown of the last one, and the peak memory of one more."""
+    from Tracing import start_trace
+
+    durations = []
+    stages = None
+    for _ in range(iterations):
+        value = make_input()
+        with start_trace(name) as trace:
+            start = time.perf_counter()
+            fn(value)
+            durations.append(time.perf_counter() - start)
+        stages = [row for row in trace.summary() if row["kind"] != "run"]
+    result = latency_stats(durations)
+    result["peak_mib"] = peak_mib(fn, make_input())
+    result["stages"] = stages
+    print(f"{name:<22} p50 {result['p50_s']:8.3f}s  p95 {result['p95_s']:8.3f}s  peak {result['peak_mib']:8.2f} MiB")
+    return result
+
+
+def tool_scenarios(reddit):
+    from NewsTool import NewsTool
+    from RedditNewsTool import RedditNewsTool
+    from SentimentTool import MarketSentimentTool
+    from Tools import Scrape_and_Search_Tool
+
+    scrape_and_search_tool = Scrape_and_Search_Tool()
+    news_tool = NewsTool()
+    sentiment_tool = MarketSentimentTool()
+    reddit_news_tool = RedditNewsTool()
+
+    def reddit_news(generation):
+        # A new generation is a new hot listing, so nothing comes from the local store
+        reddit.generation = generation
+        return asyncio.run(reddit_news_tool._run())
+
+    generations = itertools.count(1)
+    return {
+        "scrape_and_search": (scrape_and_search_tool._run, next_stock),
+        "news": (news_tool._run, next_stock),
+        "market_sentiment": (lambda stock: asyncio.run(sentiment_tool._run(stock)), next_stock),
+        "reddit_news": (reddit_news, lambda: next(generations)),
+    }
+
+
+def analyse(stock):
+    """The tool work of one analysis: search and scrape, headlines and Reddit sentiment."""
+    from NewsTool import NewsTool
+    from SentimentTool import MarketSentimentTool
+    from Tools import Scrape_and_Search_Tool
+
+    Scrape_and_Search_Tool()._run(stock)
+    NewsTool()._run(stock)
+    asyncio.run(MarketSentimentTool()._run(stock))
+
+
+def throughput(concurrency, rounds):
+    stocks = [next_stock() for _ in range(concurrency * rounds)]
+
+    def timed(stock):
+        start = time.perf_counter()
+        analyse(stock)
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        durations = list(executor.map(timed, stocks))
+    elapsed = time.perf_counter() - start
+    result = latency_stats(durations)
+    result.update({
+        "concurrency": concurrency,
+        "elapsed_s": round(elapsed, 4),
+        "analyses_per_min": round(len(stocks) / elapsed * 60, 2),
+    })
+    print(f"{'throughput x' + str(concurrency):<22} {result['analyses_per_min']:8.2f} analyses/min  "
+          f"p50 {result['p50_s']:8.3f}s  p95 {result['p95_s']:8.3f}s")
+    return result
+
+
+def install_agent_llms(args):
+    """Agent LLMs that call each of their agent's tools once, for whichever stock the crew is given."""
+    import Agents
+
+    for agent in [Agents.Researcher, Agents.Sentiment_analyser, Agents.Analyst, Agents.DecisionAdvisor]:
+        actions = [(tool.name, {next(iter(tool.args_schema.model_fields)): "{stock}"}) for tool in agent.tools or []]
+        agent.llm = FakeAgentLLM(actions, latency=args.agent_latency, completion_tokens=args.llm_tokens)
+        agent.verbose = False
+
+
+def crew_runner(args):
+    """An end-to-end run the way crew.py does it, with agent LLMs that call each of their tools once."""
+    from Jobs import build_crew, crew_inputs
+    from Prefetch import start_prefetch
+    from Rag import setup_rag_system
+    from Tracing import crew_callbacks, current_trace
+
+    install_agent_llms(args)
+
+    def run(stock):
+        trace = current_trace()
+        crew = build_crew(crew_callbacks(trace) if trace else None, verbose=False)
+        start_prefetch(stock)
+        result = crew.kickoff(inputs=crew_inputs(stock))
+        setup_rag_system(str(result), stock)
+
+    return run
+
+
+def portfolio(args):
+    """A whole portfolio through Portfolio.run_portfolio, as crew.py runs it."""
+    from Jobs import Job
+    from Portfolio import run_portfolio
+
+    install_agent_llms(args)
+    stocks = [next_stock() for _ in range(args.portfolio_size)]
+    job = Job(f"portfolio of {len(stocks)}")
+    start = time.perf_counter()
+    summary = run_portfolio(job, stocks, args.portfolio_workers)
+    elapsed = time.perf_counter() - start
+    durations = [row["wall_s"] for row in summary["rows"] if row["wall_s"] is not None]
+    result = latency_stats(durations)
+    result.update({
+        "stocks": len(stocks),
+        "workers": summary["workers"],
+        "done": len(summary["reports"]),
+        "elapsed_s": round(elapsed, 4),
+        "analyses_per_min": round(len(summary["reports"]) / elapsed * 60, 2),
+        "ratings": {rating: sum(1 for row in summary["rows"] if row["rating"] == rating)
+                    for rating in {row["rating"] for row in summary["rows"]}},
+    })
+    print(f"{'portfolio x' + str(summary['workers']):<22} {result['analyses_per_min']:8.2f} analyses/min  "
+          f"{result['done']}/{len(stocks)} done in {result['elapsed_s']:.1f}s")
+    return result
+
+
+def analysis_cache(args):
+    """`--concurrency` requests for one ticker at once, then one more: one crew run should serve them all."""
+    from Jobs import submit, run_analysis
+
+    install_agent_llms(args)
+    stock = next_stock()
+    start = time.perf_counter()
+    jobs = [submit(stock, run_analysis, stock) for _ in range(args.concurrency)]
+    for job in jobs:
+        job.future.result()
+    concurrent_s = time.perf_counter() - start
+    start = time.perf_counter()
+    repeat = submit(stock, run_analysis, stock)
+    repeat.future.result()
+    repeat_s = time.perf_counter() - start
+    sources = [job.result["source"] if job.result else job.status for job in jobs + [repeat]]
+    result = {
+        "requests": len(sources),
+        "crew_runs": sources.count("run"),
+        "sources": sources,
+        "concurrent_s": round(concurrent_s, 4),
+        "repeat_s": round(repeat_s, 4),
+    }
+    print(f"{'analysis_cache x' + str(args.concurrency):<22} {result['crew_runs']} crew run(s) for {result['requests']} requests  "
+          f"concurrent {concurrent_s:8.3f}s  repeat {repeat_s:8.3f}s")
+    return result
+
+
+def rag_scenarios(args):
+    """Indexing a new ticker's report, re-indexing an unchanged one, and answering new and repeated questions."""
+    from Rag import build_qa_engine, query_rag_system, setup_rag_system
+
+    reports = (
+        "\n\n".join(filler(300, f"report {n} {i}") for i in range(args.report_paragraphs)) for n in itertools.count()
+    )
+    made = []
+
+    def setup(item):
+        stock, text = item
+        vectordb = setup_rag_system(text, stock)
+        made.append((stock, text, vectordb))
+        return vectordb
+
+    engines = []
+
+    def engine():
+        if not engines:
+            engines.append(build_qa_engine(made[0][0], made[0][2]))
+        return engines[0]
+
+    def retrieve(question):
+        return engine().retrieve(question)
+
+    def query(question):
+        return query_rag_system(engine(), question)
+
+    def first_token(question):
+        _, answer = engine().ask(question)
+        return next(answer, "")
+
+    questions = itertools.cycle([
+        "What are the main risks?", "What's the price target?", "How did revenue grow?", "Should I buy?",
+    ])
+    # A new question every time, so neither the answer cache nor the LLM cache can help
+    new_questions = (f"{question} ({n})" for n, question in enumerate(questions))
+    return {
+        "rag_setup": (setup, lambda: (next_stock(), next(reports))),
+        # The same report again: every chunk is already in the collection
+        "rag_setup_unchanged": (setup, lambda: made[0][:2]),
+        "rag_retrieve": (retrieve, lambda: next(new_questions)),
+        "rag_query": (query, lambda: next(new_questions)),
+        "rag_first_token": (first_token, lambda: next(new_questions)),
+        # Follow-ups repeating an earlier question are answered from the engine's cache
+        "rag_query_repeat": (query, lambda: "What are the main risks? (0)"),
+    }
+
+
+def max_rss_mib():
+    try:
+        import resource
+    except ImportError:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Bytes on macOS, kilobytes elsewhere
+    return round(rss / 1024 / 1024 if sys.platform == "darwin" else rss / 1024, 1)
+
+
+def compare(results, baseline):
+    if baseline["config"] != results["config"]:
+        print("note: the baseline was recorded with a different configuration")
+    print(f"\n{'scenario':<22} {'metric':<18} {'baseline':>10} {'current':>10} {'change':>8}")
+    for name, current in results["scenarios"].items():
+        base = baseline["scenarios"].get(name)
+        if not base:
+            continue
+        for metric, higher_is_better in COMPARED.items():
+            if not base.get(metric) or metric not in current:
+                continue
+            change = (current[metric] - base[metric]) / base[metric]
+            worse = change < 0 if higher_is_better else change > 0
+            flag = "  <-- worse" if worse and abs(change) >= 0.1 else ""
+            print(f"{name:<22} {metric:<18} {base[metric]:>10} {current[metric]:>10} {change:>+7.1%}{flag}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS),
+                        help=f"comma separated, from {', '.join(SCENARIOS)}")
+    parser.add_argument("--iterations", type=int, default=5)
+    parser.add_argument("--concurrency", type=int, default=4, help="concurrent analyses in the throughput run")
+    parser.add_argument("--rounds", type=int, default=2, help="analyses per worker in the throughput run")
+    parser.add_argument("--http-latency", type=float, default=0.05, help="seconds per stub HTTP request")
+    parser.add_argument("--llm-latency", type=float, default=0.3, help="seconds per tool LLM call")
+    parser.add_argument("--agent-latency", type=float, default=0.5, help="seconds per agent LLM call")
+    parser.add_argument("--embed-latency", type=float, default=0.005, help="seconds per embedded chunk")
+    parser.add_argument("--llm-tokens", type=int, default=200, help="completion tokens per LLM call")
+    parser.add_argument("--page-kb", type=int, default=40, help="size of every scraped page")
+    parser.add_argument("--posts", type=int, default=25, help="submissions per Reddit listing")
+    parser.add_argument("--comments", type=int, default=200, help="comments per Reddit thread")
+    parser.add_argument("--portfolio-size", type=int, default=8, help="stocks in the portfolio run")
+    parser.add_argument("--portfolio-workers", type=int, default=4, help="stocks analysed at once in the portfolio run")
+    parser.add_argument("--report-paragraphs", type=int, default=20, help="size of the report the RAG path indexes")
+    parser.add_argument("--rag-backend", choices=("chroma", "numpy"), default="chroma", help="vector store for the RAG path")
+    parser.add_argument("--rate-limits", action="store_true", help="keep the real provider rate limits")
+    parser.add_argument("--baseline", default="default", help="name of the baseline to save or compare against")
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--compare", action="store_true")
+    parser.add_argument("--output", help="also write the results to this JSON file")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    scenarios = [s.strip() for s in args.scenarios.split(",") if s.strip()]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        sys.exit(f"unknown scenarios: {', '.join(sorted(unknown))}")
+    baseline_path = os.path.join(BASELINE_DIR, f"{args.baseline}.json")
+    if args.compare and not os.path.exists(baseline_path):
+        # Checked before the run, which takes minutes; timings depend on the machine, so none is committed
+        sys.exit(
+            f"no baseline at {baseline_path}. Record one on this machine first, from the commit to compare "
+            f"against and with the same flags:\n    python -m benchmarks.run --save-baseline --baseline {args.baseline}"
+        )
+
+    scratch = offline_environment(args)
+    server, reddit = install_fakes(args)
+    results = {
+        "config": {k: v for k, v in vars(args).items()
+                   if k not in ("scenarios", "baseline", "save_baseline", "compare", "output")},
+        "environment": {"python": platform.python_version(), "platform": platform.platform()},
+        "scenarios": {},
+    }
+    try:
+        planned = {}
+        if "tools" in scenarios:
+            planned.update(tool_scenarios(reddit))
+        if "crew" in scenarios:
+            planned["crew_end_to_end"] = (crew_runner(args), next_stock)
+        if "rag" in scenarios:
+            planned.update(rag_scenarios(args))
+        for name, (fn, make_input) in planned.items():
+            results["scenarios"][name] = measure(name, fn, make_input, args.iterations)
+        if "throughput" in scenarios:
+            results["scenarios"][f"throughput_x{args.concurrency}"] = throughput(args.concurrency, args.rounds)
+        if "portfolio" in scenarios:
+            results["scenarios"][f"portfolio_x{args.portfolio_workers}"] = portfolio(args)
+        if "cache" in scenarios:
+            results["scenarios"][f"analysis_cache_x{args.concurrency}"] = analysis_cache(args)
+    finally:
+        server.stop()
+        shutil.rmtree(scratch, ignore_errors=True)
+
+    results["max_rss_mib"] = max_rss_mib()
+    results["stub_requests"] = dict(server.requests)
+
+    if args.compare:
+        with open(baseline_path, encoding="utf-8") as f:
+            compare(results, json.load(f))
+    if args.save_baseline:
+        os.makedirs(BASELINE_DIR, exist_ok=True)
+        with open(baseline_path, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"baseline saved to {baseline_path}")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    return results
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+"""Import-time and startup benchmarks.
+
+    python -m benchmarks.startup
+    python -m benchmarks.startup --iterations 10 --compare
+
+Every sample runs in a new interpreter, so imports are cold:
+
+- import_<Module>: importing one module, e.g. what `import Tasks` costs before anything runs
+- first_use_crew: building the agents, tools and tasks on the first analysis
+- app_first_run / app_rerun: the Streamlit page's first script run and its later reruns,
+  through streamlit.testing's AppTest, with no analysis started
+
+Uses the same dummy keys as benchmarks.run, and nothing is sent anywhere.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+from benchmarks.run import BASELINE_DIR, OFFLINE_ENV, compare, latency_stats
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODULES = ("Tools", "NewsTool", "SentimentTool", "RedditNewsTool", "Agents", "Tasks", "Rag", "Prefetch")
+
+IMPORT_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+from Lazy import built
+print(json.dumps({{"elapsed": elapsed, "built": built(), "modules": len(sys.modules)}}))
+"""
+
+FIRST_USE_SCRIPT = """
+import json, time
+import Agents, Tasks
+start = time.perf_counter()
+[Agents.Researcher, Agents.Sentiment_analyser, Agents.Analyst, Agents.DecisionAdvisor]
+[Tasks.research, Tasks.sentiment_analysis, Tasks.analysis, Tasks.reporting]
+elapsed = time.perf_counter() - start
+from Lazy import built
+print(json.dumps({"elapsed": elapsed, "built": built()}))
+"""
+
+APP_SCRIPT = """
+import json, time
+from streamlit.testing.v1 import AppTest
+app = AppTest.from_file("crew.py", default_timeout=120)
+start = time.perf_counter()
+app.run()
+first = time.perf_counter() - start
+reruns = []
+for _ in range({reruns}):
+    start = time.perf_counter()
+    app.run()
+    reruns.append(time.perf_counter() - start)
+print(json.dumps({{"first": first, "reruns": reruns, "exceptions": [str(e.value) for e in app.exception]}}))
+"""
+
+
+def run_sample(script):
+    env = dict(os.environ, **OFFLINE_ENV)
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [ROOT, env.get("PYTHONPATH")]))
+    proc = subprocess.run([sys.executable, "-c", script], cwd=ROOT, env=env, capture_output=True, text=True)
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else "sample failed")
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def sampled(name, script, iterations):
+    samples = [run_sample(script) for _ in range(iterations)]
+    result = latency_stats([s["elapsed"] for s in samples])
+    result["built"] = samples[-1]["built"]
+    if "modules" in samples[-1]:
+        result["modules"] = samples[-1]["modules"]
+    print(f"{name:<24} p50 {result['p50_s']:8.3f}s  p95 {result['p95_s']:8.3f}s  "
+          f"built on import: {len(result['built'])}")
+    return result
+
+
+def app_runs(iterations, reruns):
+    samples = [run_sample(APP_SCRIPT.format(reruns=reruns)) for _ in range(iterations)]
+    for sample in samples:
+        if sample["exceptions"]:
+            print(f"note: the page raised {sample['exceptions'][0]}")
+    first = latency_stats([s["first"] for s in samples])
+    rerun = latency_stats([d for s in samples for d in s["reruns"]])
+    print(f"{'app_first_run':<24} p50 {first['p50_s']:8.3f}s  p95 {first['p95_s']:8.3f}s")
+    print(f"{'app_rerun':<24} p50 {rerun['p50_s']:8.3f}s  p95 {rerun['p95_s']:8.3f}s")
+    return {"app_first_run": first, "app_rerun": rerun}
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--modules", default=",".join(MODULES), help="comma separated modules to time the import of")
+    parser.add_argument("--iterations", type=int, default=5, help="new interpreters per scenario")
+    parser.add_argument("--reruns", type=int, default=5, help="reruns of the Streamlit page per interpreter")
+    parser.add_argument("--skip-app", action="store_true", help="leave out the Streamlit page")
+    parser.add_argument("--baseline", default="startup", help="name of the baseline to save or compare against")
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--compare", action="store_true")
+    parser.add_argument("--output", help="also write the results to this JSON file")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    results = {
+        "config": {"iterations": args.iterations, "reruns": args.reruns},
+        "scenarios": {},
+    }
+    for module in filter(None, (m.strip() for m in args.modules.split(","))):
+        results["scenarios"][f"import_{module}"] = sampled(
+            f"import {module}", IMPORT_SCRIPT.format(module=module), args.iterations
+        )
+    results["scenarios"]["first_use_crew"] = sampled("first use (crew)", FIRST_USE_SCRIPT, args.iterations)
+    if not args.skip_app:
+        results["scenarios"].update(app_runs(args.iterations, args.reruns))
+
+    baseline_path = os.path.join(BASELINE_DIR, f"{args.baseline}.json")
+    if args.compare:
+        if os.path.exists(baseline_path):
+            with open(baseline_path, encoding="utf-8") as f:
+                compare(results, json.load(f))
+        else:
+            print(f"no baseline at {baseline_path}; record one with --save-baseline")
+    if args.save_baseline:
+        os.makedirs(BASELINE_DIR, exist_ok=True)
+        with open(baseline_path, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"baseline saved to {baseline_path}")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    return results
+
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,14 @@
 import streamlit as st
-from crewai import Crew
-from Tasks import research, analysis, reporting, sentiment_analysis
-from Agents import Researcher, Analyst, DecisionAdvisor, Sentiment_analyser
-from langchain_google_genai import ChatGoogleGenerativeAI
 from dotenv import load_dotenv
 import os
-from langchain.vectorstores import Chroma
-from langchain.embeddings import HuggingFaceEmbeddings
-from langchain_openai import ChatOpenAI
-from langchain.chains import RetrievalQA
-import tempfile
-import shutil
+import time
+from langchain_core.prompts import PromptTemplate
+from LLMs import recommendation_llm
+from LLMCache import CachedChain
+from Rag import RAG_RETENTION_DAYS
+from FetchCache import source_ttl
+from Jobs import get_job, submit, run_analysis, active_jobs, DONE, FAILED, CANCELLED, RUNNING
+from Portfolio import parse_tickers, run_portfolio, MAX_PORTFOLIO_SIZE, PORTFOLIO_WORKERS
 
 # Load environment variables
 load_dotenv()
@@ -27,21 +25,27 @@ if 'analysis_result' not in st.session_state:
     st.session_state.analysis_result = None
 if 'vectordb' not in st.session_state:
     st.session_state.vectordb = None
+if 'qa_engine' not in st.session_state:
+    st.session_state.qa_engine = None
 if 'stock_symbol' not in st.session_state:
     st.session_state.stock_symbol = None
+if 'trace_summary' not in st.session_state:
+    st.session_state.trace_summary = None
+if 'report_generated_at' not in st.session_state:
+    st.session_state.report_generated_at = None
+if 'portfolio_result' not in st.session_state:
+    st.session_state.portfolio_result = None
+if 'loaded_job' not in st.session_state:
+    st.session_state.loaded_job = None
+
+# The running or last analysis; its id is kept in the URL, so a reload finds it again
+current_job = get_job(st.query_params.get("job")) if st.query_params.get("job") else None
+
+recommendation_prompt = PromptTemplate(
+    input_variables=["stock", "result"],
+    template="Here is the analysis report for {stock}:\n{result}\n\nBased on this analysis, provide a recommendation: 'BUY', 'SELL', or 'HOLD'. Only respond with one of these three words."
+)
 
-def initialize_crew():
-    """Initialize the CrewAI crew"""
-    try:
-        crew = Crew(
-            agents=[Researcher, Sentiment_analyser, Analyst, DecisionAdvisor],
-            tasks=[research, sentiment_analysis, analysis, reporting],
-            verbose=True
-        )
-        return crew
-    except Exception as e:
-        st.error(f"Error initializing crew: {str(e)}")
-        return None
 
 def get_llm_recommendation(stock, result):
     """Get LLM recommendation based on analysis"""
@@ -50,80 +54,46 @@ def get_llm_recommendation(stock, result):
         if not google_api_key:
             st.error("Google API key not found. Please set GOOGLE_API_KEY in your environment variables.")
             return None
-            
-        llm = ChatGoogleGenerativeAI(
-            google_api_key=google_api_key,
-            model="gemini-2.0-flash",
-            temperature=0.1,
-        )
-        
-        prompt = f"Here is the analysis report for {stock}:\n{result}\n\nBased on this analysis, provide a recommendation: 'BUY', 'SELL', or 'HOLD'. Only respond with one of these three words."
-        response = llm.invoke(prompt)
+
+        # Through the LLM cache and Gemini's rate limit, like the tools' LLM calls
+        response = CachedChain(recommendation_prompt, recommendation_llm()).invoke({"stock": stock, "result": str(result)})
         return response.content.strip().upper()
     except Exception as e:
         st.error(f"Error getting LLM recommendation: {str(e)}")
         return None
 
-def setup_rag_system(analysis_text):
-    """Setup RAG system with the analysis results"""
-    try:
-        # Create embedding model
-        embedding_model = HuggingFaceEmbeddings(model_name="all-MiniLM-L6-v2")
-        
-        # Convert result to list of text chunks if it's a string
-        if isinstance(analysis_text, str):
-            # Split the text into smaller chunks for better retrieval
-            text_chunks = [analysis_text[i:i+1000] for i in range(0, len(analysis_text), 800)]
-        else:
-            text_chunks = [str(analysis_text)]
-        
-        # Create metadata for each chunk
-        metadatas = [{"source": f"analysis_chunk_{i}", "chunk_id": i} for i in range(len(text_chunks))]
-        
-        # Create temporary directory for this session
-        temp_dir = tempfile.mkdtemp()
-        chroma_dir = os.path.join(temp_dir, "chroma_db")
-        
-        # Create vector database
-        vectordb = Chroma.from_texts(
-            texts=text_chunks,
-            embedding=embedding_model,
-            metadatas=metadatas,
-            persist_directory=chroma_dir
-        )
-        
-        vectordb.persist()
-        
-        return vectordb, chroma_dir
-    except Exception as e:
-        st.error(f"Error setting up RAG system: {str(e)}")
-        return None, None
+EVENT_ICONS = {"task": "✅", "tool": "🔧", "rag": "📚", "job": "▶️", "portfolio": "📊"}
 
-def query_rag_system(vectordb, query):
-    """Query the RAG system"""
-    try:
-        openai_api_key = os.getenv("OPEN_AI_KEY")
-        if not openai_api_key:
-            st.error("OpenAI API key not found. Please set OPEN_AI_KEY in your environment variables.")
-            return None
-            
-        llm = ChatOpenAI(
-            model_name="gpt-3.5-turbo", 
-            temperature=0, 
-            openai_api_key=openai_api_key
-        )
-        
-        qa_chain = RetrievalQA.from_chain_type(
-            llm=llm,
-            retriever=vectordb.as_retriever(search_kwargs={"k": 3}),
-            return_source_documents=True
-        )
-        
-        result = qa_chain({"query": query})
-        return result
-    except Exception as e:
-        st.error(f"Error querying RAG system: {str(e)}")
-        return None
+
+@st.fragment(run_every=1.0)
+def show_progress(job_id):
+    """Live status of a running analysis; reruns the whole page once it finishes."""
+    job = get_job(job_id)
+    if job is None:
+        return
+    if job.done:
+        st.rerun()
+    st.info(f"Analyzing {job.label}... {job.status}, {job.elapsed:.0f}s")
+    if job.progress:
+        # A portfolio: one row per stock, and how fast they are getting done
+        rows = [{"stock": stock, **row} for stock, row in job.progress.items()]
+        done = sum(1 for row in rows if row["status"] == DONE)
+        m1, m2, m3 = st.columns(3)
+        m1.metric("Stocks done", f"{done}/{len(rows)}")
+        m2.metric("Running", sum(1 for row in rows if row["status"] == RUNNING))
+        m3.metric("Analyses/min", f"{done / job.elapsed * 60:.1f}" if job.elapsed else "-")
+        st.dataframe(rows, use_container_width=True)
+    for event in job.events_since():
+        line = f"{EVENT_ICONS.get(event['kind'], '•')} {event['kind']}: {event['name']}"
+        if event.get("wall_s") is not None:
+            line += f" ({event['wall_s']:.1f}s)"
+        if event.get("error"):
+            line += f" — {event['error']}"
+        st.write(line)
+    if job.cancel_requested:
+        st.caption("Cancelling after the crew's current task...")
+    elif st.button("⏹️ Cancel Analysis", key=f"cancel-{job.id}"):
+        job.cancel()
 
 # Main UI
 st.title("🚀 Stock Analysis Crew")
@@ -155,6 +125,12 @@ with st.sidebar:
     if not openai_key:
         st.warning("OpenAI API key is required for RAG queries")
 
+    running = active_jobs()
+    if running:
+        st.markdown("**Running Analyses:**")
+        for job in running:
+            st.write(f"⏳ {job.label} ({job.status}, {job.elapsed:.0f}s)")
+
 # Main content
 col1, col2 = st.columns([2, 1])
 
@@ -164,7 +140,7 @@ with col1:
     # Service selection
     service_option = st.selectbox(
         "Select Service:",
-        ["Analyze a Stock", "Analyze Portfolio (Coming Soon)"],
+        ["Analyze a Stock", "Analyze Portfolio"],
         index=0
     )
     
@@ -176,44 +152,92 @@ with col1:
             help="Enter the stock ticker symbol you want to analyze"
         )
         
+        force_refresh = st.checkbox(
+            "Force fresh analysis",
+            help=f"Reports younger than {source_ttl('analysis') / 60:.0f} minutes are reused unless this is ticked"
+        )
+
         # Analysis button
         if st.button("🔍 Start Analysis", type="primary", disabled=not stock_symbol):
             if not os.getenv("GOOGLE_API_KEY"):
                 st.error("Please configure your Google API key in the environment variables.")
             else:
-                with st.spinner(f"Analyzing {stock_symbol.upper()}... This may take a few minutes."):
-                    # Initialize crew
-                    crew = initialize_crew()
-                    
-                    if crew:
-                        try:
-                            # Run analysis
-                            result = crew.kickoff(inputs={"stock": stock_symbol.upper()})
-                            
-                            # Store results in session state
-                            st.session_state.analysis_result = str(result)
-                            st.session_state.stock_symbol = stock_symbol.upper()
-                            
-                            # Setup RAG system
-                            vectordb, chroma_dir = setup_rag_system(str(result))
-                            if vectordb:
-                                st.session_state.vectordb = vectordb
-                                st.session_state.chroma_dir = chroma_dir
-                            
-                            st.success("Analysis completed!")
-                            st.rerun()
-                            
-                        except Exception as e:
-                            st.error(f"Error during analysis: {str(e)}")
+                # The crew runs on the job pool, so this page stays responsive while it works
+                job = submit(stock_symbol.upper(), run_analysis, stock_symbol.upper(), force_refresh)
+                st.query_params["job"] = job.id
+                st.rerun()
+
+        if current_job and not current_job.done:
+            show_progress(current_job.id)
+        elif current_job and not current_job.progress and current_job.id != st.session_state.loaded_job:
+            st.session_state.loaded_job = current_job.id
+            if current_job.status == DONE:
+                result = current_job.result
+                st.session_state.analysis_result = result["report"]
+                st.session_state.stock_symbol = result["stock"]
+                st.session_state.vectordb = result["vectordb"]
+                st.session_state.qa_engine = result["qa_engine"]
+                st.session_state.trace_summary = result["trace_summary"]
+                st.session_state.report_generated_at = result["generated_at"]
+                if result["source"] == "run":
+                    st.success("Analysis completed!")
+                else:
+                    st.success("Loaded a recent analysis instead of running the crew again.")
+                if result.get("rag_error"):
+                    st.error(f"Error setting up RAG system: {result['rag_error']}")
+            elif current_job.status == FAILED:
+                st.error(f"Error during analysis: {current_job.error}")
+            elif current_job.status == CANCELLED:
+                st.info(f"Analysis of {current_job.label} was cancelled.")
     
     else:
-        st.info("Portfolio analysis feature is coming soon! Please check back later.")
+        tickers_text = st.text_area(
+            "Enter Stock Symbols:",
+            placeholder="e.g., AAPL, GOOGL, TSLA, RELIANCE.NS",
+            help=f"Separate symbols with commas, spaces or new lines; up to {MAX_PORTFOLIO_SIZE} stocks"
+        )
+        tickers = parse_tickers(tickers_text or "")
+        workers = st.number_input(
+            "Stocks analyzed at once:", min_value=1, max_value=16, value=PORTFOLIO_WORKERS,
+            help="More runs at once finish sooner but hit the providers' rate limits harder"
+        )
+
+        force_refresh = st.checkbox(
+            "Force fresh analyses",
+            help=f"Reports younger than {source_ttl('analysis') / 60:.0f} minutes are reused unless this is ticked"
+        )
+
+        if st.button("🔍 Start Portfolio Analysis", type="primary", disabled=not tickers):
+            if not os.getenv("GOOGLE_API_KEY"):
+                st.error("Please configure your Google API key in the environment variables.")
+            else:
+                # Global news and Reddit are fetched once, then every stock runs its own crew
+                job = submit(f"portfolio of {len(tickers)}", run_portfolio, tickers, int(workers), force_refresh)
+                st.query_params["job"] = job.id
+                st.rerun()
+
+        if current_job and not current_job.done:
+            show_progress(current_job.id)
+        elif current_job and current_job.progress and current_job.id != st.session_state.loaded_job:
+            st.session_state.loaded_job = current_job.id
+            if current_job.status == DONE:
+                st.session_state.portfolio_result = current_job.result
+                st.success("Portfolio analysis completed!")
+            elif current_job.status == FAILED:
+                st.error(f"Error during portfolio analysis: {current_job.error}")
+            elif current_job.status == CANCELLED:
+                st.info("Portfolio analysis was cancelled.")
 
 with col2:
     st.header("🎯 Quick Actions")
     
     if st.session_state.analysis_result:
         st.success(f"✅ Analysis completed for {st.session_state.stock_symbol}")
+
+        if st.button("🔄 Refresh Analysis"):
+            job = submit(st.session_state.stock_symbol, run_analysis, st.session_state.stock_symbol, True)
+            st.query_params["job"] = job.id
+            st.rerun()
         
         # Get recommendation
         if st.button("💡 Get AI Recommendation"):
@@ -233,13 +257,43 @@ with col2:
     else:
         st.info("Run an analysis first to see quick actions")
 
+# Display portfolio results
+if st.session_state.portfolio_result:
+    portfolio = st.session_state.portfolio_result
+    st.markdown("---")
+    st.header(f"📊 Portfolio Summary ({len(portfolio['stocks'])} stocks)")
+    m1, m2, m3 = st.columns(3)
+    m1.metric("Wall time", f"{portfolio['elapsed_s']:.0f}s")
+    m2.metric("Analyses/min", f"{portfolio['analyses_per_min']:.1f}")
+    m3.metric("Workers", portfolio["workers"])
+    st.dataframe(portfolio["rows"], use_container_width=True)
+
+    for row in portfolio["rows"]:
+        report = portfolio["reports"].get(row["stock"])
+        if report:
+            with st.expander(f"{row['stock']}: {row['rating']}"):
+                st.text_area("Analysis Report:", value=report, height=300, disabled=True, key=f"report-{row['stock']}")
+
+    st.download_button(
+        label="📥 Download Portfolio Report",
+        data="\n\n".join(f"===== {stock} =====\n{report}" for stock, report in portfolio["reports"].items()),
+        file_name="portfolio_analysis_report.txt",
+        mime="text/plain"
+    )
+
 # Display results
 if st.session_state.analysis_result:
     st.markdown("---")
     st.header(f"📊 Analysis Results for {st.session_state.stock_symbol}")
+    if st.session_state.report_generated_at:
+        generated_at = st.session_state.report_generated_at
+        st.caption(
+            f"Report generated {time.strftime('%Y-%m-%d %H:%M', time.localtime(generated_at))} "
+            f"({(time.time() - generated_at) / 60:.0f} minutes ago)"
+        )
     
     # Create tabs for different views
-    tab1, tab2 = st.tabs(["📋 Full Report", "❓ Ask Questions"])
+    tab1, tab2, tab3 = st.tabs(["📋 Full Report", "❓ Ask Questions", "⏱️ Run Breakdown"])
     
     with tab1:
         st.markdown("### Detailed Analysis Report")
@@ -260,8 +314,9 @@ if st.session_state.analysis_result:
     
     with tab2:
         st.markdown("### Ask Questions About the Analysis")
+        st.caption(f"Answers draw on every analysis of {st.session_state.stock_symbol} from the last {RAG_RETENTION_DAYS:g} days.")
         
-        if st.session_state.vectordb:
+        if st.session_state.qa_engine:
             # Query input
             user_query = st.text_input(
                 "Ask a question about the analysis:",
@@ -274,22 +329,39 @@ if st.session_state.analysis_result:
                 if not os.getenv("OPEN_AI_KEY"):
                     st.error("Please configure your OpenAI API key to use the Q&A feature.")
                 else:
-                    with st.spinner("Searching for answer..."):
-                        rag_result = query_rag_system(st.session_state.vectordb, user_query)
-                        
-                        if rag_result:
-                            st.markdown("### 💬 Answer")
-                            st.write(rag_result['result'])
-                            
-                            # Show sources
-                            if rag_result.get('source_documents'):
-                                with st.expander("📚 Sources"):
-                                    for i, doc in enumerate(rag_result['source_documents']):
-                                        st.markdown(f"**Source {i+1}:**")
-                                        st.text(doc.page_content[:300] + "..." if len(doc.page_content) > 300 else doc.page_content)
+                    try:
+                        with st.spinner("Searching for answer..."):
+                            sources, answer = st.session_state.qa_engine.ask(user_query)
+
+                        # The answer is shown token by token as the model writes it
+                        st.markdown("### 💬 Answer")
+                        st.write_stream(answer)
+
+                        # Show sources
+                        if sources:
+                            with st.expander("📚 Sources"):
+                                for i, doc in enumerate(sources):
+                                    st.markdown(f"**Source {i+1}:**")
+                                    st.text(doc.page_content[:300] + "..." if len(doc.page_content) > 300 else doc.page_content)
+                    except Exception as e:
+                        st.error(f"Error querying RAG system: {str(e)}")
         else:
             st.info("RAG system not available. Please run an analysis first.")
 
+    with tab3:
+        st.markdown("### Where the Time and Tokens Went")
+
+        if st.session_state.trace_summary:
+            run = next(row for row in st.session_state.trace_summary if row["kind"] == "run")
+            total_cost = sum(row.get("cost_usd", 0) for row in st.session_state.trace_summary)
+            m1, m2, m3 = st.columns(3)
+            m1.metric("Wall time", f"{run['wall_s']:.1f}s")
+            m2.metric("Estimated cost", f"${total_cost:.4f}")
+            m3.metric("Agent tokens", f"{int(run.get('prompt_tokens', 0) + run.get('completion_tokens', 0)):,}")
+            st.dataframe(st.session_state.trace_summary, use_container_width=True)
+        else:
+            st.info("No trace recorded for this analysis.")
+
 # Footer
 st.markdown("---")
 st.markdown("*Built with CrewAI, LangChain, and Streamlit*")
\ No newline at end of file
@@ -0,0 +1,25 @@
+from Distill import CHUNK_WORDS, distill, split_long_line
+
+
+def test_long_line_is_split_into_pieces_of_at_most_chunk_words():
+    line = " ".join(f"Sentence {i} talks about the weather and nothing else." for i in range(100))
+    pieces = split_long_line(line)
+    assert len(pieces) > 1
+    assert all(len(piece.split()) <= CHUNK_WORDS for piece in pieces)
+    assert " ".join(pieces) == line
+
+
+def test_sentence_longer_than_a_chunk_is_cut_into_word_windows():
+    pieces = split_long_line(" ".join(["menu"] * (CHUNK_WORDS * 2 + 5)))
+    assert [len(piece.split()) for piece in pieces] == [CHUNK_WORDS, CHUNK_WORDS, 5]
+
+
+def test_single_line_page_keeps_a_late_mention_of_the_stock():
+    filler = " ".join(f"Home News Markets Opinion section {i} of the navigation and site furniture." for i in range(500))
+    page = filler + " RELIANCE reported quarterly revenue growth of 12% and raised its dividend."
+    assert "\n" not in page
+
+    result = distill(page, "RELIANCE")
+
+    assert result.chunks_total > 1
+    assert "RELIANCE reported quarterly revenue growth" in result.text
@@ -0,0 +1,75 @@
+import sys
+import types
+
+import pytest
+
+import Jobs
+import Prefetch
+import Tracing
+
+
+class FakeCrew:
+    """Runs tasks like crewai: an agent whose step raises is executed again, a task callback's error ends the run."""
+
+    def __init__(self, callbacks, llm_calls, on_llm_call):
+        self.step_callback = callbacks["step_callback"]
+        self.task_callback = callbacks["task_callback"]
+        self.llm_calls = llm_calls
+        self.on_llm_call = on_llm_call
+
+    def kickoff(self, inputs):
+        for task in range(4):
+            for attempt in range(3):
+                try:
+                    for step in range(2):
+                        self.llm_calls.append(task)
+                        self.on_llm_call(task, step)
+                        self.step_callback(types.SimpleNamespace(tool=None))
+                    break
+                except Exception:
+                    if attempt == 2:
+                        raise
+            self.task_callback(types.SimpleNamespace(name=f"task {task}", agent=None, raw="output"))
+        return "report"
+
+
+def test_cancelled_job_makes_no_further_llm_calls(monkeypatch, tmp_path):
+    monkeypatch.setattr(Tracing, "TRACE_DIR", str(tmp_path))
+    monkeypatch.setattr(Prefetch, "start_prefetch", lambda stock: [])
+    monkeypatch.setitem(sys.modules, "Rag", types.SimpleNamespace(setup_rag_system=lambda report, stock: None))
+    job = Jobs.Job("analysis")
+    llm_calls = []
+
+    def on_llm_call(task, step):
+        # Cancelled in the middle of the second task
+        if (task, step) == (1, 0):
+            job.cancel()
+
+    monkeypatch.setattr(
+        Jobs, "build_crew", lambda callbacks, market_context="": FakeCrew(callbacks, llm_calls, on_llm_call),
+    )
+
+    with pytest.raises(Jobs.JobCancelled):
+        Jobs.analyse(job, "ACME")
+
+    # The task running when the job was cancelled finishes once; nothing runs after it
+    assert llm_calls == [0, 0, 1, 1]
+
+
+def test_failed_rag_setup_keeps_the_report_and_reports_the_error(monkeypatch, tmp_path):
+    monkeypatch.setattr(Tracing, "TRACE_DIR", str(tmp_path))
+    monkeypatch.setattr(Prefetch, "start_prefetch", lambda stock: [])
+
+    def setup_rag_system(report, stock):
+        raise RuntimeError("embedding service down")
+
+    monkeypatch.setitem(sys.modules, "Rag", types.SimpleNamespace(setup_rag_system=setup_rag_system))
+    monkeypatch.setattr(
+        Jobs, "build_crew", lambda callbacks, market_context="": FakeCrew(callbacks, [], lambda task, step: None),
+    )
+    job = Jobs.Job("analysis")
+
+    result, vectordb, _ = Jobs.analyse(job, "ACME")
+
+    assert result == "report" and vectordb is None
+    assert any(event["kind"] == "rag" and "embedding service down" in event["error"] for event in job.events_since())
@@ -0,0 +1,42 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import Jobs
+import Portfolio
+import Prefetch
+
+
+def test_shared_fetches_dont_queue_behind_the_stocks_prefetches(monkeypatch):
+    monkeypatch.setattr(Prefetch, "_warm", {})
+    monkeypatch.setattr(Prefetch, "_executor", ThreadPoolExecutor(max_workers=2, thread_name_prefix="prefetch"))
+    monkeypatch.setattr(Portfolio, "market_news", lambda: "macro headlines")
+    monkeypatch.setattr(Portfolio, "reddit_market_news", lambda: "reddit posts")
+    monkeypatch.setattr(Portfolio, "has_fresh_report", lambda stock: False)
+    release = threading.Event()
+
+    def start_prefetch(stock):
+        # Slow fetches that keep every prefetch worker busy
+        return [Prefetch._prefetched(name, stock, lambda: release.wait(5)) for name in ("search", "news", "sentiment")]
+
+    def cached_analysis(job, stock, market_context="", on_span=None, force=False):
+        start_prefetch(stock)
+        return f"{stock}: Recommendation: Buy", None, None, time.time(), "run"
+
+    monkeypatch.setattr(Prefetch, "start_prefetch", start_prefetch)
+    monkeypatch.setattr(Portfolio, "cached_analysis", cached_analysis)
+    stocks = [f"S{i}" for i in range(8)]
+    # An earlier portfolio's stocks already fill the prefetch pool
+    for stock in stocks:
+        start_prefetch(stock)
+
+    started = time.monotonic()
+    try:
+        result = Portfolio.run_portfolio(Jobs.Job("portfolio"), stocks, workers=2)
+    finally:
+        release.set()
+
+    assert time.monotonic() - started < 2
+    assert "macro headlines" in result["market_context"]
+    assert "reddit posts" in result["market_context"]
+    assert [row["rating"] for row in result["rows"]] == ["BUY"] * len(stocks)
@@ -0,0 +1,37 @@
+import threading
+import time
+
+import Prefetch
+
+
+def test_queued_prefetch_is_cancelled_and_fetched_inline(monkeypatch):
+    monkeypatch.setattr(Prefetch, "_warm", {})
+    release = threading.Event()
+    # Fill every worker, so the next prefetch stays queued
+    busy = [Prefetch._executor.submit(release.wait) for _ in range(Prefetch.PREFETCH_WORKERS)]
+    try:
+        queued = Prefetch._prefetched("tool", "queued", lambda: "prefetched")
+        started = time.monotonic()
+        assert Prefetch.warm_result("tool", "queued", timeout=5) is None
+        assert time.monotonic() - started < 1
+        assert queued.cancelled()
+    finally:
+        release.set()
+        for future in busy:
+            future.result()
+    # The next prefetch of the same input starts afresh instead of reusing the cancelled one
+    assert Prefetch._prefetched("tool", "queued", lambda: "again").result(timeout=5) == "again"
+
+
+def test_running_prefetch_is_waited_on(monkeypatch):
+    monkeypatch.setattr(Prefetch, "_warm", {})
+    running = threading.Event()
+
+    def fetch():
+        running.set()
+        time.sleep(0.2)
+        return "prefetched"
+
+    Prefetch._prefetched("tool", "running", fetch)
+    assert running.wait(5)
+    assert Prefetch.warm_result("tool", "running", timeout=5) == "prefetched"
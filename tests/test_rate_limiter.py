@@ -0,0 +1,39 @@
+import pytest
+
+import RateLimiter
+from RateLimiter import BREAKER_FAILURES, CircuitOpenError, ProviderLimiter
+
+
+def failing(calls):
+    def fn():
+        calls.append(1)
+        raise TimeoutError("provider timed out")
+    return fn
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(RateLimiter, "BACKOFF_BASE", 0.0)
+
+
+def test_one_failed_call_leaves_the_circuit_closed():
+    limiter = ProviderLimiter("test")
+    calls = []
+    with pytest.raises(TimeoutError):
+        limiter.call(failing(calls), breaker_key="host")
+    assert len(calls) == RateLimiter.MAX_RETRIES + 1
+    assert limiter.breaker_for("host").opened_at is None
+    assert not limiter.circuit_open()
+
+
+def test_circuit_opens_after_repeated_failed_calls():
+    limiter = ProviderLimiter("test")
+    calls = []
+    for _ in range(BREAKER_FAILURES):
+        with pytest.raises(TimeoutError):
+            limiter.call(failing(calls), breaker_key="host")
+    with pytest.raises(CircuitOpenError):
+        limiter.call(failing(calls), breaker_key="host")
+    assert len(calls) == BREAKER_FAILURES * (RateLimiter.MAX_RETRIES + 1)
+    # Other hosts are unaffected
+    assert limiter.call(lambda: "ok", breaker_key="other") == "ok"
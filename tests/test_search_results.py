@@ -0,0 +1,18 @@
+from SearchResults import extract_results, normalize_url
+
+
+def test_normalize_url_keeps_the_path_and_ref_as_written():
+    assert normalize_url("HTTPS://Example.com:443/news/story/?ref=home&utm_source=x") == "https://example.com/news/story/?ref=home"
+    assert normalize_url("https://example.com/news/story") == "https://example.com/news/story"
+
+
+def test_extract_results_dedupes_regardless_of_trailing_slash_and_www():
+    data = {"organic": [
+        {"link": "https://example.com/story/", "title": "first"},
+        {"link": "http://www.example.com/story", "title": "again"},
+        {"link": "https://example.com/other", "title": "other"},
+    ]}
+    results = extract_results(data, blocklist=[])
+    assert [(r["title"], r["link"]) for r in results] == [
+        ("first", "https://example.com/story/"), ("other", "https://example.com/other"),
+    ]